@@ -18,7 +18,16 @@ app.autodiscover_tasks(['tracktasks'])
 
 @app.on_after_finalize.connect
 def setup_periodic_tasks(sender, **kwargs):
-    # Calls test('hello') every 10 seconds.
-    from tracktasks.tasks import recurring_updates
+    # Runs the daily updates at midnight,
+    # scores the tasks missed the day before
+    # and refreshes the analytics every hour.
+    from tracktasks.tasks import (daily_updates, score_missed_tasks,
+                                  refresh_analytics)
     sender.add_periodic_task(crontab(minute=0, hour=0),
                              daily_updates.s(), name='daily updates')
+    sender.add_periodic_task(crontab(minute=5, hour=0),
+                             score_missed_tasks.s(),
+                             name='score missed tasks')
+    sender.add_periodic_task(crontab(minute=30),
+                             refresh_analytics.s(),
+                             name='refresh analytics')
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 
 import os
 import sys
+import tempfile
 
 # store private settings here
 from .privatesettings import (emailhostusr, emailpw,
@@ -48,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tracktasks.middleware.MetricsMiddleware',
+    'tracktasks.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tracktasks.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'tasktracker.urls'
@@ -86,6 +90,34 @@ DATABASES = {
 }
 
 
+# Caching
+# Task lists are cached per user, see tracktasks/cache.py.
+# The default cache has to be shared by every web and celery process,
+# since the user versions and catching-up flags in it
+# are written by one process and read by the others.
+# It's the database unless MEMCACHED_LOCATION is set,
+# and the database cache needs manage.py createcachetable.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'tracktasks_cache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    } if not os.getenv('MEMCACHED_LOCATION') else {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.getenv('MEMCACHED_LOCATION'),
+    },
+    # rendered task rows, see tracktasks/templates/tracktasks/task_row.html.
+    # Rows are keyed by version and never go stale,
+    # so each process keeps its own instead of a trip to a shared cache.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 
@@ -149,7 +181,8 @@ LOGGING = {
         },
         'tracktasks.logger': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            # DEBUG also logs the timing of every request.
+            'level': os.getenv('TRACKTASKS_LOG_LEVEL', 'INFO'),
             'stream': sys.stdout,
         }
     },
@@ -158,6 +191,69 @@ LOGGING = {
 # celery settings
 CELERY_BROKER_URL = "amqp://"
 
+# tracktasks settings
+
+# When True, users returning after a week or more get their missed
+# recurrences created by a celery task instead of during the login request.
+TRACKTASKS_DEFER_CATCH_UP = False
+
+# When True, new recurring tasks are stored as a single recurrence rule
+# and their occurrences are expanded when read,
+# instead of being created by the daily updates.
+TRACKTASKS_VIRTUAL_RECURRENCES = False
+
+# When True, the dashboard keeps an event stream open
+# to hear about changes made in other tabs and devices,
+# see tracktasks/events.py.
+# Each open tab holds a worker thread for up to five minutes,
+# so this needs an async or threaded server, like gunicorn with gevent,
+# rather than a pool of sync workers.
+# Events only reach streams in the process that made the change,
+# so it also needs a single process, or a user's requests routed to one.
+TRACKTASKS_EVENT_STREAMS = False
+
+# The daily updates are split into shards of this many user ids,
+# run as separate celery tasks.
+TRACKTASKS_DAILY_UPDATES_SHARD_SIZE = 1000
+
+# The most shards the daily updates dispatch at once.
+# Shards grow past the shard size to stay under it.
+TRACKTASKS_DAILY_UPDATES_CONCURRENCY = 8
+
+# When True, every request's SQL, view and render times are logged,
+# and sent to staff, or to everyone with DEBUG,
+# in a Server-Timing header, see tracktasks/middleware.py.
+TRACKTASKS_REQUEST_TIMING = True
+
+# Requests over any of these are logged as warnings
+# with their slowest and most repeated statements.
+# None turns a threshold off.
+TRACKTASKS_SLOW_REQUEST_MS = 500
+TRACKTASKS_SLOW_REQUEST_QUERIES = 50
+# runs of the same statement with different parameters, like an N+1.
+TRACKTASKS_REPEATED_QUERIES = 10
+
+# A directory every web and celery process on the host can write to,
+# so /metrics adds up the metrics of all of them,
+# see tracktasks/metrics.py.
+# Without it, /metrics only has the process that answers.
+TRACKTASKS_METRICS_DIR = os.getenv('TRACKTASKS_METRICS_DIR')
+
+# The bearer token a scraper sends in its Authorization header
+# to read /metrics. Without one, /metrics is a 404.
+TRACKTASKS_METRICS_TOKEN = os.getenv('TRACKTASKS_METRICS_TOKEN')
+
+# When True, staff requests with a profile query parameter
+# or an X-Profile header are profiled, see tracktasks/middleware.py.
+# When False, the profiling middleware is left out entirely.
+TRACKTASKS_PROFILING = False
+
+# Where request and daily updates profiles are stored,
+# outside the source tree unless set.
+TRACKTASKS_PROFILE_DIR = os.getenv(
+                    'TRACKTASKS_PROFILE_DIR',
+                    os.path.join(tempfile.gettempdir(), 'tracktasks-profiles'))
+
 # django-registration settings
 
 ACCOUNT_ACTIVATION_DAYS = 7
@@ -168,6 +264,16 @@ EMAIL_HOST_USER = emailhostusr
 EMAIL_HOST_PASSWORD = emailpw
 EMAIL_PORT = emailport
 
+if not DEBUG:
+    # compile templates once per process instead of on every render.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 
 if DEBUG:
     MIDDLEWARE += (
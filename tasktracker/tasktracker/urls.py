@@ -16,9 +16,11 @@ Including another URLconf
 from django.conf.urls import include, url
 from django.contrib import admin, auth
 from django.conf import settings
+from tracktasks.views import scrape_metrics
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^metrics$', scrape_metrics, name='metrics'),
     url(r'^tracktasks/', include('tracktasks.urls', namespace='tracktasks')),
     url(r'^accounts/', include('registration.backends.hmac.urls')),
 ]
@@ -0,0 +1,187 @@
+"""
+Completion analytics, read from weekly rollups.
+
+Each user's tasks are rolled up by the week they're dated in
+and by recurring series, see WeeklySeriesRollup.
+A refresh only rebuilds the weeks holding tasks updated
+since the last refresh, as recorded by an AnalyticsWatermark,
+the weeks with tasks that have become overdue since,
+and the weeks tasks were moved out of or deleted from,
+as recorded by StaleRollupWeek.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, When
+from django.utils import timezone
+
+from .models import (AnalyticsWatermark, StaleRollupWeek, Task,
+                     WeeklySeriesRollup)
+
+WATERMARK = 'weekly series rollups'
+
+# tasks updated shortly before the last refresh may not have been
+# committed when it read them, so they're rolled up again.
+OVERLAP = datetime.timedelta(minutes=5)
+
+# weeks rebuilt per query and transaction.
+CHUNK_SIZE = 200
+
+
+def week_start(date):
+    """
+    Return the Monday starting date's week.
+    """
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def refresh(full=False):
+    """
+    Bring the rollups up to date.
+    With full, or on the first refresh, every week is rebuilt.
+    Return the number of weeks rebuilt.
+    """
+    now = timezone.now()
+    today = timezone.localtime(now).date()
+
+    watermark = AnalyticsWatermark.objects.filter(name=WATERMARK).first()
+    # only the rows read are cleared,
+    # weeks marked during the refresh wait for the next one.
+    stale = list(StaleRollupWeek.objects.values_list('pk', 'user_id',
+                                                     'week'))
+    if full or watermark is None:
+        weeks = changed_weeks(Task.objects.all())
+        watermark = watermark or AnalyticsWatermark(name=WATERMARK)
+    else:
+        weeks = changed_weeks(Task.objects.filter(
+                        updated_at__gt=watermark.changed_since - OVERLAP))
+        weeks |= changed_weeks(Task.objects.filter(
+                        date__gte=watermark.refreshed_on,
+                        date__lt=today,
+                        is_completed=False))
+        weeks |= {(user_id, week) for pk, user_id, week in stale}
+
+    rebuild(weeks, today)
+    for start in range(0, len(stale), CHUNK_SIZE):
+        StaleRollupWeek.objects.filter(
+                pk__in=[pk for pk, user_id, week
+                        in stale[start:start + CHUNK_SIZE]]).delete()
+
+    watermark.changed_since = now
+    watermark.refreshed_on = today
+    watermark.save()
+    return len(weeks)
+
+
+def changed_weeks(tasks):
+    """
+    Return a set of the (user id, week) pairs the tasks fall in.
+    """
+    dates = tasks.exclude(user=None).order_by().values_list(
+                                            'user_id', 'date').distinct()
+    return {(user_id, week_start(date)) for user_id, date in dates}
+
+
+def rebuild(weeks, today):
+    """
+    Replace the rollups for the provided (user id, week) pairs
+    with totals from their tasks, a chunk of weeks at a time.
+    """
+    weeks = sorted(weeks)
+    for start in range(0, len(weeks), CHUNK_SIZE):
+        chunk = weeks[start:start + CHUNK_SIZE]
+
+        in_chunk = Q()
+        rollups_in_chunk = Q()
+        for user_id, week in chunk:
+            in_chunk |= Q(user_id=user_id,
+                          date__range=(week,
+                                       week + datetime.timedelta(days=6)))
+            rollups_in_chunk |= Q(user_id=user_id, week=week)
+
+        rollups = {}
+        for row in series_totals(Task.objects.filter(in_chunk), today):
+            key = (row['user_id'], week_start(row['date']),
+                   row['recurring_id'])
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = WeeklySeriesRollup(
+                                                user_id=key[0],
+                                                week=key[1],
+                                                recurring_id=key[2],
+                                                name=row['name'])
+            rollup.name = max(rollup.name, row['name'])
+            rollup.tasks += row['tasks']
+            rollup.completed += row['completed']
+            rollup.overdue += row['overdue']
+            rollup.tracked_time += row['tracked_time'] or \
+                                                    datetime.timedelta(0)
+
+        with transaction.atomic():
+            WeeklySeriesRollup.objects.filter(rollups_in_chunk).delete()
+            WeeklySeriesRollup.objects.bulk_create(rollups.values())
+
+
+def series_totals(tasks, today):
+    """
+    Return the totals of the enabled tasks
+    by user, series and date.
+    """
+    def count(condition):
+        return Sum(Case(When(condition, then=1), default=0,
+                        output_field=IntegerField()))
+
+    overdue = (Q(is_completed=False, date__lt=today) |
+               Q(is_completed=True, completed_date__gt=F('date')))
+
+    return tasks.filter(is_disabled=False).order_by().values(
+                        'user_id', 'recurring_id', 'date').annotate(
+                        name=Max('name'),
+                        tasks=Count('pk'),
+                        completed=count(Q(is_completed=True)),
+                        overdue=count(overdue),
+                        tracked_time=Sum('tracked_time'))
+
+
+def weekly_report(user, weeks):
+    """
+    Return the user's totals for each of the last weeks,
+    through the current one, and for each series over those weeks,
+    read from the rollups.
+    """
+    first_week = week_start(timezone.localtime(timezone.now()).date() -
+                            datetime.timedelta(weeks=weeks - 1))
+    rollups = WeeklySeriesRollup.objects.filter(user=user,
+                                                week__gte=first_week)
+
+    by_week = {}
+    by_series = {}
+    for rollup in rollups:
+        for totals, key, name in (
+                (by_week, rollup.week, None),
+                (by_series, rollup.recurring_id, rollup.name)):
+            if key not in totals:
+                totals[key] = {'key': key, 'name': name, 'tasks': 0,
+                               'completed': 0, 'overdue': 0,
+                               'tracked_time': datetime.timedelta(0)}
+            totals[key]['tasks'] += rollup.tasks
+            totals[key]['completed'] += rollup.completed
+            totals[key]['overdue'] += rollup.overdue
+            totals[key]['tracked_time'] += rollup.tracked_time
+
+    for totals in list(by_week.values()) + list(by_series.values()):
+        totals['completion_rate'] = rate(totals['completed'], totals['tasks'])
+        totals['overdue_rate'] = rate(totals['overdue'], totals['tasks'])
+        totals['tracked_hours'] = totals['tracked_time'].total_seconds() / 3600
+
+    return {
+        'weeks': [by_week[week] for week in sorted(by_week)],
+        'series': sorted(by_series.values(),
+                         key=lambda totals: (str(totals['key']) ==
+                                             Task.NULL_RECURRING,
+                                             totals['name'])),
+    }
+
+
+def rate(part, whole):
+    return part / whole if whole else None
@@ -0,0 +1,24 @@
+"""
+Benchmarks for tracktasks.
+
+Benchmarks build their own data,
+so they're run against a throwaway database,
+see in_test_database.
+"""
+from django.conf import settings
+from django.test.utils import get_runner
+
+
+def in_test_database(run, *args, **kwargs):
+    """
+    Call run in a test database created for it,
+    with the test environment set up, and return its result.
+    """
+    runner = get_runner(settings)(verbosity=0)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        return run(*args, **kwargs)
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
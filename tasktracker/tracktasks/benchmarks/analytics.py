@@ -0,0 +1,99 @@
+"""
+Times the analytics view and an incremental refresh
+for users with increasing lengths of history,
+to show that neither grows with the history.
+"""
+import datetime
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tracktasks import analytics
+from tracktasks.models import AnalyticsWatermark, Task
+from tracktasks.views import AnalyticsView
+
+
+def create_history(user, weeks, series=3):
+    """
+    Create weeks of daily recurring tasks for the user,
+    with every other task completed.
+    """
+    today = timezone.localtime(timezone.now()).date()
+    first = today - datetime.timedelta(weeks=weeks)
+    tasks = []
+    for number in range(series):
+        recurring_id = uuid.uuid4()
+        for day in range(weeks * 7):
+            date = first + datetime.timedelta(days=day)
+            completed = day % 2 == 0
+            tasks.append(Task(name="series {}".format(number),
+                              user=user,
+                              recurring='D',
+                              recurring_id=recurring_id,
+                              date=date,
+                              is_completed=completed,
+                              completed_date=date if completed else None))
+    Task.objects.bulk_create(tasks, batch_size=500)
+
+    # otherwise the whole history looks freshly changed to a refresh.
+    Task.objects.filter(user=user).update(
+                        updated_at=timezone.now() - datetime.timedelta(days=1))
+    return len(tasks)
+
+
+def time_calls(function, repeat):
+    """
+    Return the mean seconds a call takes and the queries a call makes.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        function()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat, len(queries)
+
+
+def run(history_weeks=(4, 52, 208), repeat=20):
+    """
+    Return a list of results, one for each length of history.
+    """
+    factory = RequestFactory()
+    results = []
+
+    for weeks in history_weeks:
+        user = User.objects.create(username="history {}".format(weeks))
+        tasks = create_history(user, weeks)
+        analytics.refresh(full=True)
+
+        request = factory.get('/tracktasks/analytics/')
+        request.user = user
+        view = AnalyticsView.as_view()
+        view_seconds, view_queries = time_calls(
+                            lambda: view(request).render(), repeat)
+
+        # an incremental refresh after one task changes.
+        task = Task.objects.filter(user=user).latest('date')
+
+        def refresh():
+            AnalyticsWatermark.objects.update(changed_since=timezone.now())
+            task.save()
+            analytics.refresh()
+
+        refresh_seconds, refresh_queries = time_calls(refresh, repeat)
+
+        results.append({
+            'history_weeks': weeks,
+            'tasks': tasks,
+            'view_ms': round(view_seconds * 1000, 3),
+            'view_queries': view_queries,
+            'refresh_ms': round(refresh_seconds * 1000, 3),
+            'refresh_queries': refresh_queries,
+        })
+
+    return results
@@ -0,0 +1,190 @@
+"""
+Generates a seeded, synthetic set of users and tasks for the benchmarks.
+
+The same seed and settings generate the same tasks,
+relative to today, so runs on different commits can be compared.
+Everything is bulk loaded, a user at a time.
+
+Each user gets one-off tasks spread over the history,
+recurring series with every recurrence through today
+plus the upcoming one the daily updates repeat,
+and recurrence rules.
+A share of the users stopped logging in two weeks ago,
+so their series stop there, for the login catch-up to fill in.
+"""
+import datetime
+import random
+import uuid
+
+from django.contrib.auth.models import User
+
+from tracktasks import recurrence
+from tracktasks.models import RecurrenceRule, Task
+from userprofiles.models import Profile
+
+# the relative weights of the recurring frequencies.
+FREQUENCY_MIX = {'D': 4, 'W': 3, 'B': 1, 'M': 2}
+
+# how long inactive users have been away.
+INACTIVE_DAYS = 14
+
+# the share of past tasks that were completed.
+COMPLETED_SHARE = 0.7
+
+BATCH_SIZE = 500
+
+
+def generate(seed=0, users=20, tasks_per_user=100, series_per_user=5,
+             rules_per_user=1, frequency_mix=None, months=3,
+             inactive_share=0.2):
+    """
+    Generate and save the users and tasks.
+
+    tasks_per_user: one-off tasks, series add their own recurrences.
+    frequency_mix: weights by recurring frequency, like FREQUENCY_MIX.
+
+    Return a dictionary with the settings, the ids of the users,
+    one active and one inactive user id,
+    and the numbers of tasks and rules saved.
+    """
+    settings = {
+        'seed': seed,
+        'users': users,
+        'tasks_per_user': tasks_per_user,
+        'series_per_user': series_per_user,
+        'rules_per_user': rules_per_user,
+        'frequency_mix': frequency_mix or FREQUENCY_MIX,
+        'months': months,
+        'inactive_share': inactive_share,
+    }
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=30 * months)
+    inactive_users = int(users * inactive_share)
+
+    prefix = 'benchmark-{}-'.format(seed)
+    User.objects.bulk_create(User(username='{}{}'.format(prefix, number))
+                             for number in range(users))
+    user_ids = list(User.objects.filter(
+                        username__startswith=prefix).order_by(
+                        'pk').values_list('pk', flat=True))
+
+    profiles = []
+    for number, user_id in enumerate(user_ids):
+        last_login = today
+        if number < inactive_users:
+            last_login = today - datetime.timedelta(days=INACTIVE_DAYS)
+        profiles.append(Profile(user_id=user_id,
+                                most_recent_login=last_login))
+    Profile.objects.bulk_create(profiles)
+
+    tasks = rules = 0
+    for profile in profiles:
+        user_tasks = (_one_off_tasks(rng, profile, start, tasks_per_user) +
+                      _series(rng, profile, start, series_per_user,
+                              settings['frequency_mix']))
+        Task.objects.bulk_create(user_tasks, batch_size=BATCH_SIZE)
+        tasks += len(user_tasks)
+
+        user_rules = _rules(rng, profile, start, rules_per_user,
+                            settings['frequency_mix'])
+        RecurrenceRule.objects.bulk_create(user_rules)
+        rules += len(user_rules)
+
+    return {
+        'settings': settings,
+        'user_ids': user_ids,
+        'active_user_id': user_ids[-1],
+        'inactive_user_id': user_ids[0] if inactive_users else None,
+        'tasks': tasks,
+        'rules': rules,
+    }
+
+
+def _one_off_tasks(rng, profile, start, count):
+    """
+    Return unsaved one-off tasks, dated from start
+    through a week after the user's last login.
+    """
+    last_day = profile.most_recent_login
+    span = (last_day - start).days + 7
+    tasks = []
+    for number in range(count):
+        task = _task(rng, profile.user_id, "task {}".format(number))
+        task.date = start + datetime.timedelta(days=rng.randrange(span))
+        _maybe_complete(rng, task, last_day)
+        tasks.append(task)
+    return tasks
+
+
+def _series(rng, profile, start, count, frequency_mix):
+    """
+    Return the unsaved recurrences of count recurring series,
+    from start through the user's last login and one beyond.
+    """
+    last_day = profile.most_recent_login
+    tasks = []
+    for number in range(count):
+        frequency = _frequency(rng, frequency_mix)
+        first = start + datetime.timedelta(days=rng.randrange(7))
+        dates = [first] + recurrence.dates_through(first, frequency,
+                                                   last_day)
+        dates.append(recurrence.next_date(dates[-1], frequency))
+
+        template = _task(rng, profile.user_id, "series {}".format(number))
+        template.recurring = frequency
+        template.recurring_id = uuid.UUID(int=rng.getrandbits(128))
+        for date in dates:
+            task = template.build_recurrence(date)
+            _maybe_complete(rng, task, last_day)
+            tasks.append(task)
+        tasks[-1].is_most_recent = True
+    return tasks
+
+
+def _rules(rng, profile, start, count, frequency_mix):
+    rules = []
+    for number in range(count):
+        rules.append(RecurrenceRule(
+                        user_id=profile.user_id,
+                        recurring_id=uuid.UUID(int=rng.getrandbits(128)),
+                        name="rule {}".format(number),
+                        date_type=rng.choice('SD'),
+                        recurring=_frequency(rng, frequency_mix),
+                        anchor_date=start + datetime.timedelta(
+                                                    days=rng.randrange(7))))
+    return rules
+
+
+def _task(rng, user_id, name):
+    """
+    Return an unsaved, undated task with random settings.
+    A quarter of tasks are timed.
+    """
+    task = Task(user_id=user_id, name=name,
+                date_type=rng.choice('SD'),
+                completed_val=rng.randint(1, 5),
+                not_completed_cost=rng.randint(0, 3))
+    if rng.random() < 0.25:
+        task.is_timed = True
+        task.total_time = datetime.timedelta(minutes=rng.choice([15, 30, 60]))
+        task.remaining_time = task.total_time
+    return task
+
+
+def _maybe_complete(rng, task, last_day):
+    """
+    Complete some of the tasks dated before last_day,
+    a fifth of those a day late.
+    """
+    if task.date < last_day and rng.random() < COMPLETED_SHARE:
+        task.is_completed = True
+        late = 1 if rng.random() < 0.2 else 0
+        task.completed_date = task.date + datetime.timedelta(days=late)
+
+
+def _frequency(rng, frequency_mix):
+    frequencies = sorted(frequency_mix)
+    return rng.choices(frequencies,
+                       [frequency_mix[frequency]
+                        for frequency in frequencies])[0]
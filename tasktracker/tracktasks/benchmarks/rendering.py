@@ -0,0 +1,123 @@
+"""
+Times renders of the dashboard with a few hundred tasks in each list,
+before and after the cached template loader and the cached task rows.
+
+"before" compiles the templates on every render
+and renders every row, the way DEBUG does.
+"""
+import copy
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from tracktasks.models import Task
+
+CACHED_LOADERS = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+
+def create_dashboard(user, per_list):
+    """
+    Create per_list tasks for each of the user's lists
+    of today's, still due and overdue tasks,
+    half of them timed.
+    """
+    today = datetime.date.today()
+    dates = {
+        'S': today,
+        'D': today + datetime.timedelta(days=1),
+        'O': today - datetime.timedelta(days=1),
+    }
+    tasks = []
+    for kind, date in dates.items():
+        for number in range(per_list):
+            timed = number % 2 == 0
+            tasks.append(Task(name="task {}{}".format(kind, number),
+                              user=user,
+                              date_type='S' if kind == 'S' else 'D',
+                              date=date,
+                              is_timed=timed,
+                              total_time=datetime.timedelta(hours=1)
+                                         if timed else None,
+                              remaining_time=datetime.timedelta(hours=1)
+                                             if timed else None))
+    Task.objects.bulk_create(tasks)
+    return Task.objects.dashboard(user, today)
+
+
+def scenarios():
+    """
+    Return a list of (name, templates, template fragment cache) settings.
+    """
+    uncached = copy.deepcopy(settings.TEMPLATES)
+    uncached[0]['APP_DIRS'] = True
+    uncached[0]['OPTIONS'].pop('loaders', None)
+
+    cached = copy.deepcopy(uncached)
+    cached[0]['APP_DIRS'] = False
+    cached[0]['OPTIONS']['loaders'] = CACHED_LOADERS
+
+    no_fragments = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    fragments = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                 'LOCATION': 'benchmark_fragments',
+                 'OPTIONS': {'MAX_ENTRIES': 10000}}
+
+    return [
+        ('before', uncached, no_fragments),
+        ('cached loader', cached, no_fragments),
+        ('cached loader and rows', cached, fragments),
+    ]
+
+
+def run(per_list=500, repeat=10):
+    """
+    Return a list of results, one for each scenario.
+    """
+    user = User.objects.create(username="dashboard {}".format(per_list))
+    dashboard = create_dashboard(user, per_list)
+
+    request = RequestFactory().get('/tracktasks/')
+    request.user = user
+    context = {
+        'daily_tasks_list': dashboard['scheduled_for'],
+        'still_due_tasks_list': dashboard['still_due_on'],
+        'completed_tasks_list': dashboard['completed_on'],
+        'overdue_tasks_list': dashboard['overdue_on'],
+        'catching_up': False,
+    }
+
+    def render():
+        return render_to_string('tracktasks/index.html', context,
+                                request=request)
+
+    results = []
+    for name, templates, fragments in scenarios():
+        caches = dict(settings.CACHES, template_fragments=fragments)
+        with override_settings(TEMPLATES=templates, CACHES=caches):
+            # the first render compiles templates and fills the caches.
+            start = time.perf_counter()
+            size = len(render())
+            first_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                render()
+            seconds = (time.perf_counter() - start) / repeat
+
+        results.append({
+            'scenario': name,
+            'tasks_per_list': per_list,
+            'first_render_ms': round(first_seconds * 1000, 1),
+            'render_ms': round(seconds * 1000, 1),
+            'kb': round(size / 1024),
+        })
+
+    return results
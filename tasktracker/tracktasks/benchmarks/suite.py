@@ -0,0 +1,231 @@
+"""
+Timed scenarios for TaskManager, the daily updates, the login catch-up
+and the dashboard and manage tasks views,
+run against data from tracktasks.benchmarks.generator.
+
+Each scenario is run a number of times after one untimed warm up,
+and reports its mean and fastest times and its number of queries.
+Scenarios that write are rolled back after every run,
+so every run starts from the same data.
+"""
+import datetime
+import platform
+import subprocess
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tracktasks.benchmarks import generator
+from tracktasks.models import RecurrenceRule, Task
+
+
+def rolled_back(function):
+    """
+    Wrap function to run in a transaction that's rolled back.
+    """
+    def run():
+        with transaction.atomic():
+            function()
+            transaction.set_rollback(True)
+    return run
+
+
+def scenarios(dataset):
+    """
+    Return a list of (name, function) pairs for the dataset.
+    """
+    today = datetime.date.today()
+    user = User.objects.get(pk=dataset['active_user_id'])
+    tasks = Task.objects.filter(user=user, is_disabled=False)
+
+    incomplete_ids = list(tasks.filter(is_completed=False).order_by(
+                            'date', 'pk').values_list('pk', flat=True)[:50])
+    recurring_id = tasks.exclude(recurring='N').values_list(
+                            'recurring_id', flat=True).first()
+    timed_id = tasks.filter(is_completed=False, is_timed=True).values_list(
+                            'pk', flat=True).first()
+    rule = RecurrenceRule.objects.filter(user=user).first()
+    page, last_key = Task.objects.active_tasks_page(user, today)
+
+    manager = Task.objects
+    found = [
+        ('TaskManager.unique_recurring',
+            lambda: list(manager.unique_recurring(user))),
+        ('TaskManager.unique_recurring multiple',
+            lambda: list(manager.unique_recurring(user, multiple=True))),
+        ('TaskManager.non_recurring',
+            lambda: list(manager.non_recurring(user))),
+        ('TaskManager.active_tasks',
+            lambda: list(manager.active_tasks(user))),
+        ('TaskManager.active_tasks_page first',
+            lambda: manager.active_tasks_page(user, today)),
+        ('TaskManager.scheduled_for',
+            lambda: list(manager.scheduled_for(user, today))),
+        ('TaskManager.completed_on',
+            lambda: list(manager.completed_on(user, today))),
+        ('TaskManager.still_due_on',
+            lambda: list(manager.still_due_on(user, today))),
+        ('TaskManager.overdue_on',
+            lambda: list(manager.overdue_on(user, today))),
+        ('TaskManager.last_change',
+            lambda: manager.last_change(user)),
+        ('TaskManager.dashboard',
+            lambda: manager.dashboard(user, today)),
+        ('TaskManager.rule_occurrences',
+            lambda: manager.rule_occurrences(user, today)),
+        ('TaskManager.next_rule_occurrences',
+            lambda: manager.next_rule_occurrences(user, today)),
+        ('TaskManager.get_task_group_incompletes',
+            lambda: list(manager.get_task_group_incompletes(recurring_id))),
+        ('TaskManager.disable_recurrences',
+            rolled_back(lambda: manager.disable_recurrences(recurring_id))),
+        ('TaskManager.bulk_complete',
+            rolled_back(lambda: manager.bulk_complete(user,
+                                                      incomplete_ids))),
+        ('TaskManager.bulk_disable',
+            rolled_back(lambda: manager.bulk_disable(user, incomplete_ids))),
+        ('TaskManager.bulk_reschedule',
+            rolled_back(lambda: manager.bulk_reschedule(user,
+                                                        incomplete_ids, 1))),
+        ('TaskManager.create_daily_recurring_tasks',
+            rolled_back(manager.create_daily_recurring_tasks)),
+    ]
+
+    if last_key is not None:
+        found.append(('TaskManager.active_tasks_page second',
+                      lambda: manager.active_tasks_page(user, today,
+                                                        last_key)))
+    if incomplete_ids:
+        found.append(('TaskManager.get_occurrence',
+                      lambda: manager.get_occurrence(user,
+                                                     incomplete_ids[0])))
+        now = timezone.now()
+        actions = [(task_id, 'complete', now)
+                   for task_id in incomplete_ids[:10]]
+        if timed_id is not None:
+            actions += [(timed_id, 'start_timer', now),
+                        (timed_id, 'stop_timer',
+                         now + datetime.timedelta(minutes=5))]
+        found.append(('TaskManager.apply_actions',
+                      rolled_back(lambda: manager.apply_actions(user,
+                                                                actions))))
+    if rule is not None:
+        occurrence_id = rule.build_occurrence(rule.anchor_date).occurrence_id
+        found.append(('TaskManager.get_occurrence virtual',
+                      rolled_back(lambda: manager.get_occurrence(
+                                                    user, occurrence_id))))
+
+    if dataset['inactive_user_id'] is not None:
+        inactive = User.objects.get(pk=dataset['inactive_user_id'])
+        found.append(('TaskManager.catch_up_recurring_tasks',
+                      rolled_back(lambda: manager.catch_up_recurring_tasks(
+                                                                inactive))))
+        found.append(('login catch up signal',
+                      rolled_back(lambda: user_logged_in.send(
+                                            sender=User, request=None,
+                                            user=inactive))))
+
+    client = Client()
+    client.force_login(user)
+    for name, url in [('IndexView', reverse('tracktasks:index')),
+                      ('ManageTasksView',
+                       reverse('tracktasks:manage tasks'))]:
+        found.append(('{} cold'.format(name),
+                      _get(client, url, clear_caches=True)))
+        found.append(('{} warm'.format(name), _get(client, url)))
+
+    return found
+
+
+def _get(client, url, clear_caches=False):
+    def get():
+        if clear_caches:
+            cache.clear()
+            caches['template_fragments'].clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise AssertionError("{} responded {}.".format(
+                                            url, response.status_code))
+    return get
+
+
+def measure(function, repeat):
+    """
+    Return a result for function with its times in milliseconds.
+    Queries are counted on the warm up run.
+    """
+    # counted now, since requests reset the queries log.
+    with CaptureQueriesContext(connection) as queries:
+        function()
+    query_count = len(queries)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'mean_ms': round(sum(times) / len(times), 3),
+        'min_ms': round(min(times), 3),
+        'queries': query_count,
+    }
+
+
+def run(repeat=10, only=None, **generate_settings):
+    """
+    Generate a dataset and time every scenario against it.
+    only: run the scenarios whose names contain it.
+
+    Return a dictionary with the environment, the dataset
+    and a result for each scenario.
+    """
+    start = time.perf_counter()
+    dataset = generator.generate(**generate_settings)
+    generate_seconds = time.perf_counter() - start
+
+    results = []
+    for name, function in scenarios(dataset):
+        if only and only not in name:
+            continue
+        result = {'scenario': name}
+        result.update(measure(function, repeat))
+        results.append(result)
+
+    return {
+        'environment': environment(),
+        'dataset': {
+            'settings': dataset['settings'],
+            'tasks': dataset['tasks'],
+            'rules': dataset['rules'],
+            'generate_s': round(generate_seconds, 2),
+        },
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def environment():
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+                    ['git', 'rev-parse', '--short', 'HEAD'],
+                    stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,73 @@
+"""
+Times exports and imports of increasing numbers of tasks,
+and the memory an export peaks at while it's streamed,
+which should stay flat.
+"""
+import datetime
+import io
+import time
+import tracemalloc
+import uuid
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from tracktasks import transfer
+from tracktasks.models import Task
+
+
+def create_tasks(user, count):
+    """
+    Create count tasks for the user,
+    a third of them in daily series of 30.
+    """
+    today = timezone.localtime(timezone.now()).date()
+    tasks = []
+    for number in range(count):
+        task = Task(name="task {}".format(number), user=user,
+                    date=today - datetime.timedelta(days=number % 365))
+        if number % 3 == 0:
+            task.recurring = 'D'
+            task.recurring_id = uuid.uuid5(uuid.NAMESPACE_OID,
+                                           str(number // 90))
+        tasks.append(task)
+    Task.objects.bulk_create(tasks, batch_size=500)
+
+
+def run(sizes=(1000, 10000, 100000), format='csv'):
+    """
+    Return a list of results, one for each number of tasks.
+    """
+    results = []
+
+    for size in sizes:
+        user = User.objects.create(username="export {}".format(size))
+        create_tasks(user, size)
+
+        # streamed chunks are dropped once sent, like a response's.
+        tracemalloc.start()
+        start = time.perf_counter()
+        exported = 0
+        for chunk in transfer.export_tasks(user, format):
+            exported += len(chunk)
+        export_seconds = time.perf_counter() - start
+        export_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        text = ''.join(transfer.export_tasks(user, format))
+        importer = User.objects.create(username="import {}".format(size))
+        start = time.perf_counter()
+        transfer.import_tasks(importer,
+                              transfer.read_rows(io.StringIO(text), format))
+        import_seconds = time.perf_counter() - start
+
+        results.append({
+            'tasks': size,
+            'format': format,
+            'export_kb': round(exported / 1024),
+            'export_rows_per_s': round(size / export_seconds),
+            'export_peak_kb': round(export_peak / 1024),
+            'import_rows_per_s': round(size / import_seconds),
+        })
+
+    return results
@@ -0,0 +1,108 @@
+"""
+Per-user caching for task lists.
+
+Cached lists are keyed by user and date.
+Every user also has a version number in the cache,
+which is bumped whenever one of their tasks is written.
+Lists cached under an older version are never read again.
+"""
+import collections
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import events, metrics
+
+# long enough to cover a day, since lists are keyed by date.
+TIMEOUT = 60 * 60 * 24
+
+VERSION_KEY = 'tracktasks:version:{}'
+LIST_KEY = 'tracktasks:{}:{}:{}'
+CATCHING_UP_KEY = 'tracktasks:catching-up:{}'
+
+# hits and misses for this process.
+counters = collections.Counter()
+
+
+def get_user_version(user_id):
+    """
+    Return the current cache version for a user.
+    """
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+
+    if version is None:
+        # start from the current time instead of 1,
+        # so that an evicted version can't reuse an old number.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+
+    return version
+
+
+def invalidate_user(user_id):
+    """
+    Bump a user's cache version.
+
+    It's bumped right away, so the current request doesn't read stale lists,
+    and again on commit, so that a list built from the uncommitted state
+    isn't cached under the new version.
+    Open event streams are told the lists changed on commit.
+    """
+    if user_id is None:
+        return
+
+    _bump_version(user_id)
+    transaction.on_commit(lambda: _committed(user_id))
+
+
+def _committed(user_id):
+    _bump_version(user_id)
+    events.publish(user_id, 'tasks', {})
+
+
+def _bump_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the version was never set or has been evicted.
+        get_user_version(user_id)
+
+
+def cached_for_user(name, user, date, compute):
+    """
+    Return the list cached as name for the user and date.
+    On a miss, call compute and cache its result.
+    """
+    version = get_user_version(user.pk)
+    key = LIST_KEY.format(name, user.pk, date.isoformat())
+    value = cache.get(key, version=version)
+
+    if value is None:
+        counters['misses'] += 1
+        metrics.cache_lookups.inc(result='miss')
+        value = compute()
+        cache.set(key, value, TIMEOUT, version=version)
+    else:
+        counters['hits'] += 1
+        metrics.cache_lookups.inc(result='hit')
+
+    return value
+
+
+def set_catching_up(user_id):
+    """
+    Flag that a user's missed recurrences are being created.
+    The flag expires on its own in case the update never finishes.
+    """
+    cache.set(CATCHING_UP_KEY.format(user_id), True, 60 * 10)
+
+
+def clear_catching_up(user_id):
+    cache.delete(CATCHING_UP_KEY.format(user_id))
+
+
+def is_catching_up(user_id):
+    return cache.get(CATCHING_UP_KEY.format(user_id), False)
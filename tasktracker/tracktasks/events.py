@@ -0,0 +1,82 @@
+"""
+In-process publish/subscribe for changes to a user's tasks.
+
+Write paths publish once their transaction commits,
+and every open event stream for the user gets a copy.
+Only streams served by the same process are reached,
+so the web server should route a user's streams and writes
+to the same process, or run a single process.
+
+Streams are off unless TRACKTASKS_EVENT_STREAMS is set,
+since each open stream holds a worker for up to STREAM_LIFETIME.
+"""
+import collections
+import queue
+import threading
+
+# seconds between keepalive comments on an idle stream.
+KEEPALIVE = 15
+
+# seconds before a stream is closed, to be reopened by the browser.
+STREAM_LIFETIME = 60 * 5
+
+# events kept for a subscriber that isn't reading.
+# later events are dropped.
+MAX_PENDING = 100
+
+_subscriptions = collections.defaultdict(set)
+_lock = threading.Lock()
+
+
+class Subscription:
+    """
+    A queue of events published for a user.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = queue.Queue(MAX_PENDING)
+
+    def get(self, timeout):
+        """
+        Return the next (event, data) pair,
+        or raise queue.Empty after timeout seconds.
+        """
+        return self.queue.get(timeout=timeout)
+
+    def close(self):
+        with _lock:
+            _subscriptions[self.user_id].discard(self)
+            if not _subscriptions[self.user_id]:
+                del _subscriptions[self.user_id]
+
+
+def subscribe(user_id):
+    """
+    Return a new subscription to a user's events.
+    It must be closed when the stream ends.
+    """
+    subscription = Subscription(user_id)
+    with _lock:
+        _subscriptions[user_id].add(subscription)
+    return subscription
+
+
+def publish(user_id, event, data):
+    """
+    Send an event to all of a user's subscriptions.
+    data must be serializable as JSON.
+    """
+    with _lock:
+        subscriptions = list(_subscriptions.get(user_id, ()))
+
+    for subscription in subscriptions:
+        try:
+            subscription.queue.put_nowait((event, data))
+        except queue.Full:
+            pass
+
+
+def subscriber_count(user_id):
+    with _lock:
+        return len(_subscriptions.get(user_id, ()))
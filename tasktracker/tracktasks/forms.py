@@ -1,8 +1,24 @@
 from django import forms
-from .models import Task
+from .models import Task, RecurrenceRule
+from . import recurrence
 import datetime
 
 
+def check_recurrence(cleaned_data, date_field):
+    """
+    Raise a ValidationError if a recurring task's date can't recur,
+    like a monthly task in a week that some months don't have.
+    """
+    date = cleaned_data.get(date_field)
+    recurring = cleaned_data.get('recurring')
+    if (date and recurring and recurring != 'N' and
+            not recurrence.can_recur(date, recurring)):
+        raise forms.ValidationError({date_field: (
+                    "A monthly task can't repeat from this date, "
+                    "since some months don't have its week. "
+                    "Try a date earlier in the month.")})
+
+
 class ModifyTaskForm(forms.ModelForm):
 
     class Meta:
@@ -19,6 +35,31 @@ class ModifyTaskForm(forms.ModelForm):
             'is_disabled': 'Delete task',
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        check_recurrence(cleaned_data, 'date')
+        return cleaned_data
+
+
+class ModifyRecurrenceRuleForm(forms.ModelForm):
+
+    class Meta:
+        model = RecurrenceRule
+        fields = ['name', 'date_type', 'anchor_date', 'is_timed',
+                  'total_time', 'recurring', 'is_disabled']
+        widgets = {
+                'anchor_date':  forms.SelectDateWidget(),
+                'total_time': forms.TimeInput(attrs={'placeholder':'hh:mm:ss'}),
+        }
+        labels = {
+            'anchor_date': 'Starting',
+            'is_disabled': 'Delete task',
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        check_recurrence(cleaned_data, 'anchor_date')
+        return cleaned_data
 
 
 class CreateTaskForm(forms.ModelForm):
@@ -35,3 +76,19 @@ class CreateTaskForm(forms.ModelForm):
         }
         help_texts = {
         }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        check_recurrence(cleaned_data, 'date')
+        return cleaned_data
+
+
+class ImportTaskForm(CreateTaskForm):
+    """
+    Validates a task read from an import,
+    with the same rules as CreateTaskForm.
+    """
+
+    class Meta(CreateTaskForm.Meta):
+        fields = CreateTaskForm.Meta.fields + ['is_completed',
+                                               'completed_date']
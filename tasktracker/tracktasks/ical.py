@@ -0,0 +1,200 @@
+"""
+Per-user iCalendar feeds, for calendar clients to subscribe to.
+
+Tasks scheduled for a date are all day events,
+tasks due by a date are to-dos.
+Recurring series and recurrence rules are single entries
+with an RRULE, instead of an entry for every occurrence.
+
+Clients poll without a session, so a feed's url carries a signed user id.
+A feed's ETag is made from TaskManager.last_change,
+the same in every process,
+and rendered feeds are cached under it,
+so an unchanged feed is answered from two aggregates.
+"""
+import datetime
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .cache import TIMEOUT
+from .models import RecurrenceRule, Task
+
+FEED_KEY = 'tracktasks:calendar:{}:{}'
+TOKEN_SALT = 'tracktasks.calendar'
+
+# completed one-off tasks are left out once they're this old.
+COMPLETED_HISTORY = datetime.timedelta(days=30)
+
+RRULES = {
+    'D': 'FREQ=DAILY',
+    'W': 'FREQ=WEEKLY',
+    'B': 'FREQ=WEEKLY;INTERVAL=2',
+}
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+def feed_token(user_id):
+    return signing.dumps(user_id, salt=TOKEN_SALT)
+
+
+def token_user_id(token):
+    """
+    Return the user id of a feed token.
+    Raise signing.BadSignature for a token that wasn't made here.
+    """
+    return signing.loads(token, salt=TOKEN_SALT)
+
+
+def feed_validators(user_id):
+    """
+    Return the ETag and last modified time of the user's current feed,
+    without rendering it.
+
+    Completed tasks drop out of the feed with the day,
+    so both change with it too.
+    """
+    today = timezone.localtime(timezone.now()).date()
+    latest, count = Task.objects.last_change(user_id)
+    validator = '{}:{}:{}:{}'.format(user_id, today,
+                                     latest and latest.timestamp(), count)
+    etag = hashlib.md5(validator.encode('utf-8')).hexdigest()
+
+    start_of_day = timezone.make_aware(datetime.datetime.combine(
+                                                today, datetime.time()))
+    return etag, max(filter(None, [latest, start_of_day]))
+
+
+def get_feed(user_id, etag):
+    """
+    Return the body of the user's feed with the ETag,
+    rendering it if it isn't cached.
+    """
+    key = FEED_KEY.format(user_id, etag)
+    body = cache.get(key)
+
+    if body is None:
+        body = render_feed(user_id,
+                           timezone.now().replace(microsecond=0))
+        cache.set(key, body, TIMEOUT)
+
+    return body
+
+
+def render_feed(user_id, now):
+    """
+    Return the user's feed as text.
+    now: the DTSTAMP of every entry.
+    """
+    stamp = now.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    today = timezone.localtime(now).date()
+    lines = ['BEGIN:VCALENDAR',
+             'VERSION:2.0',
+             'PRODID:-//tasktracker//tracktasks//EN',
+             'CALSCALE:GREGORIAN',
+             'X-WR-CALNAME:tasks']
+
+    one_offs = Task.objects.filter(
+                    Q(is_completed=False) |
+                    Q(completed_date__gte=today - COMPLETED_HISTORY),
+                    user_id=user_id, is_disabled=False,
+                    recurring='N').order_by('date', 'pk')
+    for task in one_offs:
+        lines += entry('task-{}'.format(task.pk), task, task.date, stamp)
+
+    series = list(Task.objects.unique_recurring(user_id))
+    starts = dict(Task.objects.filter(
+                    recurring_id__in=[task.recurring_id for task in series],
+                    is_disabled=False).order_by().values_list(
+                    'recurring_id').annotate(Min('date')))
+    for task in series:
+        start = starts[task.recurring_id]
+        lines += entry('series-{}'.format(task.recurring_id), task, start,
+                       stamp, rrule(task.recurring, start))
+
+    for rule in RecurrenceRule.objects.filter(user_id=user_id,
+                                              is_disabled=False):
+        lines += entry('series-{}'.format(rule.recurring_id), rule,
+                       rule.anchor_date, stamp,
+                       rrule(rule.recurring, rule.anchor_date))
+
+    lines.append('END:VCALENDAR')
+    return ''.join(fold(line) + '\r\n' for line in lines)
+
+
+def entry(uid, task, date, stamp, repeat=None):
+    """
+    Return the lines of a task's entry, starting on date.
+    task: a Task or a RecurrenceRule.
+    repeat: an RRULE value, for series.
+    """
+    end = (date + datetime.timedelta(days=1)).strftime('%Y%m%d')
+    if task.date_type == 'S':
+        component = 'VEVENT'
+        period = ['DTEND;VALUE=DATE:' + end]
+    else:
+        component = 'VTODO'
+        period = ['DUE;VALUE=DATE:' + end]
+        if getattr(task, 'is_completed', False) and repeat is None:
+            period.append('STATUS:COMPLETED')
+
+    lines = ['BEGIN:' + component,
+             'UID:{}@tasktracker'.format(uid),
+             'DTSTAMP:' + stamp,
+             'SUMMARY:' + escape(task.name),
+             'DTSTART;VALUE=DATE:' + date.strftime('%Y%m%d')] + period
+    if repeat:
+        lines.append('RRULE:' + repeat)
+    lines.append('END:' + component)
+    return lines
+
+
+def rrule(frequency, start):
+    """
+    Return the RRULE value for a frequency, starting on start.
+
+    Monthly tasks recur on the same weekday of the same week of the month,
+    see tracktasks.recurrence. The nearest RRULE counts weeks
+    from the first of the month, and takes the fifth week as the last.
+    """
+    if frequency in RRULES:
+        return RRULES[frequency]
+    if frequency == 'M':
+        week = (start.day - 1) // 7 + 1
+        if week == 5:
+            week = -1
+        return 'FREQ=MONTHLY;BYDAY={}{}'.format(week,
+                                               WEEKDAYS[start.weekday()])
+    raise ValueError("{} is not a recurring frequency.".format(frequency))
+
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+                .replace(',', '\\,').replace('\r\n', '\\n')
+                .replace('\n', '\\n'))
+
+
+def fold(line):
+    """
+    Split a line into lines of at most 75 octets,
+    continued with a leading space.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+
+    parts = []
+    limit = 75
+    while len(encoded) > limit:
+        cut = limit
+        # don't split a multibyte character.
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
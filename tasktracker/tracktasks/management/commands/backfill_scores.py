@@ -0,0 +1,88 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from tracktasks.models import DailyScore, Task
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the daily scores from the tasks.
+
+    Users are handled in chunks of ids,
+    each rebuilt in its own transaction,
+    so the command can be stopped and restarted from a user id.
+    """
+    help = "Rebuild users' daily scores from their tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Users rebuilt per transaction.")
+        parser.add_argument('--start-user', type=int, default=0,
+                            help="The user id to start from.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_user_id = options['start_user'] - 1
+        scores = 0
+
+        while True:
+            user_ids = list(User.objects.filter(
+                                pk__gt=last_user_id).order_by(
+                                'pk').values_list('pk', flat=True)[
+                                :chunk_size])
+            if not user_ids:
+                break
+
+            scores += self.rebuild(user_ids)
+            last_user_id = user_ids[-1]
+            self.stdout.write("Rebuilt scores through user {}.".format(
+                                                                last_user_id))
+
+        self.stdout.write(self.style.SUCCESS(
+                            "Rebuilt {} daily scores.".format(scores)))
+
+    def rebuild(self, user_ids):
+        """
+        Replace the scores of the users with the provided ids.
+        Return the number of daily scores written.
+        """
+        today = datetime.date.today()
+        tasks = Task.objects.filter(user_id__in=user_ids,
+                                    is_disabled=False).order_by()
+
+        # completions count on the day they happened.
+        completions = tasks.filter(is_completed=True).values(
+                        'user_id', 'completed_date').annotate(
+                        completed=Count('pk'), earned=Sum('completed_val'))
+
+        # tasks completed after their date, or not at all by today,
+        # count as missed on their date.
+        misses = tasks.filter(Q(is_completed=False, date__lt=today) |
+                              Q(is_completed=True,
+                                completed_date__gt=F('date'))).values(
+                        'user_id', 'date').annotate(
+                        missed=Count('pk'), lost=Sum('not_completed_cost'))
+
+        scores = {}
+        for row in completions:
+            score = scores.setdefault(
+                        (row['user_id'], row['completed_date']),
+                        DailyScore(user_id=row['user_id'],
+                                   date=row['completed_date']))
+            score.completed = row['completed']
+            score.earned = row['earned']
+        for row in misses:
+            score = scores.setdefault(
+                        (row['user_id'], row['date']),
+                        DailyScore(user_id=row['user_id'], date=row['date']))
+            score.missed = row['missed']
+            score.lost = row['lost']
+
+        with transaction.atomic():
+            DailyScore.objects.filter(user_id__in=user_ids).delete()
+            DailyScore.objects.bulk_create(scores.values())
+        return len(scores)
@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracktasks.benchmarks import generator, in_test_database, suite
+
+
+def frequency_mix(text):
+    """
+    Parse a frequency mix like D=4,W=3,B=1,M=2.
+    """
+    try:
+        mix = {}
+        for part in text.split(','):
+            frequency, weight = part.split('=')
+            mix[frequency.strip().upper()] = float(weight)
+    except ValueError:
+        raise CommandError("{} isn't a frequency mix.".format(text))
+    if not set(mix) <= set(generator.FREQUENCY_MIX):
+        raise CommandError("Frequencies are D, W, B and M.")
+    return mix
+
+
+class Command(BaseCommand):
+    """
+    Generate a dataset in a test database,
+    time the benchmark scenarios against it
+    and print the results as JSON.
+    """
+    help = "Time TaskManager and the views against generated tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--tasks-per-user', type=int, default=100,
+                            help="One-off tasks for each user.")
+        parser.add_argument('--series-per-user', type=int, default=5,
+                            help="Recurring series for each user.")
+        parser.add_argument('--rules-per-user', type=int, default=1,
+                            help="Recurrence rules for each user.")
+        parser.add_argument('--frequency-mix', type=frequency_mix,
+                            default=generator.FREQUENCY_MIX,
+                            help="Weights of the frequencies of series "
+                                 "and rules, like D=4,W=3,B=1,M=2.")
+        parser.add_argument('--months', type=int, default=3,
+                            help="Months of history.")
+        parser.add_argument('--inactive-share', type=float, default=0.2,
+                            help="The share of users away for two weeks.")
+        parser.add_argument('--repeat', type=int, default=10,
+                            help="Timed runs of each scenario.")
+        parser.add_argument('--only',
+                            help="Only run scenarios with names containing "
+                                 "this.")
+        parser.add_argument('--output',
+                            help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        report = in_test_database(
+                    suite.run,
+                    repeat=options['repeat'],
+                    only=options['only'],
+                    seed=options['seed'],
+                    users=options['users'],
+                    tasks_per_user=options['tasks_per_user'],
+                    series_per_user=options['series_per_user'],
+                    rules_per_user=options['rules_per_user'],
+                    frequency_mix=options['frequency_mix'],
+                    months=options['months'],
+                    inactive_share=options['inactive_share'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as results:
+                results.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from tracktasks.benchmarks import in_test_database, analytics
+
+
+class Command(BaseCommand):
+    """
+    Run the analytics benchmark in a test database
+    and print its results as JSON.
+    """
+    help = "Time the analytics for increasing lengths of history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, nargs='+',
+                            default=[4, 52, 208],
+                            help="The lengths of history to time.")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Calls timed for each result.")
+
+    def handle(self, *args, **options):
+        results = in_test_database(analytics.run, options['weeks'],
+                                   options['repeat'])
+
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from tracktasks.benchmarks import in_test_database, rendering
+
+
+class Command(BaseCommand):
+    """
+    Run the dashboard rendering benchmark in a test database
+    and print its results as JSON.
+    """
+    help = "Time dashboard renders before and after caching rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-list', type=int, default=500,
+                            help="Tasks in each of the dashboard's lists.")
+        parser.add_argument('--repeat', type=int, default=10,
+                            help="Renders timed for each scenario.")
+
+    def handle(self, *args, **options):
+        results = in_test_database(rendering.run, options['per_list'],
+                                   options['repeat'])
+
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from tracktasks import transfer
+from tracktasks.benchmarks import in_test_database, transfer as benchmark
+
+
+class Command(BaseCommand):
+    """
+    Run the export and import benchmark in a test database
+    and print its results as JSON.
+    """
+    help = "Time exports and imports of increasing numbers of tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1000, 10000, 100000],
+                            help="The numbers of tasks to time.")
+        parser.add_argument('--format', choices=sorted(transfer.FORMATS),
+                            default='csv')
+
+    def handle(self, *args, **options):
+        results = in_test_database(benchmark.run, options['sizes'],
+                                   options['format'])
+
+        self.stdout.write(json.dumps(results, indent=2))
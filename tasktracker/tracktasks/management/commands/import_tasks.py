@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tracktasks import transfer
+
+
+class Command(BaseCommand):
+    """
+    Import a CSV or JSON Lines export of tasks for a user.
+    Nothing is imported if any of the rows are invalid.
+    """
+    help = "Import tasks for a user from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(transfer.FORMATS),
+                            help="Defaults to the file's extension.")
+        parser.add_argument('--batch-size', type=int,
+                            default=transfer.IMPORT_BATCH_SIZE,
+                            help="Tasks written per query.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError("No user named {}.".format(
+                                                    options['username']))
+
+        format = options['format'] or transfer.format_of(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                created = transfer.import_tasks(
+                                user, transfer.read_rows(stream, format),
+                                options['batch_size'])
+        except transfer.InvalidImport as invalid:
+            for error in invalid.errors:
+                self.stderr.write("line {line}: {errors}".format(**error))
+            raise CommandError(str(invalid))
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS(
+                            "Imported {} tasks.".format(created)))
@@ -0,0 +1,318 @@
+"""
+Counters and histograms for the views and jobs,
+exposed in the Prometheus text format at /metrics,
+to scrapers sending TRACKTASKS_METRICS_TOKEN.
+
+Each process keeps its own values.
+With TRACKTASKS_METRICS_DIR set, each process also writes its values
+to a file of its own in that directory,
+at most once every FLUSH_SECONDS,
+and /metrics adds up the files of every process,
+so whichever worker is scraped answers for all of them.
+Without it, /metrics only has the values of the process that answers.
+
+Files are kept after their process exits so its counts aren't lost.
+Clear the directory when the app is restarted.
+"""
+import abc
+import atexit
+import bisect
+import collections
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# the longest a process's file lags behind its values.
+FLUSH_SECONDS = 1
+
+# upper bounds in seconds, for requests and for jobs.
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800)
+
+REGISTRY = collections.OrderedDict()
+
+_lock = threading.RLock()
+# held while writing, so an older snapshot can't replace a newer one.
+_write_lock = threading.Lock()
+_state = {'pid': os.getpid(), 'flushed': 0, 'timer': None}
+
+
+class Metric(abc.ABC):
+    """
+    A named metric, with a value for each combination of its labels.
+    """
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        if name in REGISTRY:
+            raise ValueError("{} is already a metric.".format(name))
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError("{} has labels {}.".format(self.name,
+                                                         self.labels))
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _update(self, labels, update):
+        key = self._key(labels)
+        with _lock:
+            _forget_parent()
+            self.values[key] = update(self.values.get(key))
+        _changed()
+
+    @abc.abstractmethod
+    def merge(self, value, other):
+        """
+        Return the sum of two values, from different processes.
+        """
+
+    @abc.abstractmethod
+    def samples(self, key, value):
+        """
+        Generate (suffix, extra labels, number) for a value.
+        """
+
+
+class Counter(Metric):
+    """
+    A count that only goes up.
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+    def merge(self, value, other):
+        return value + other
+
+    def samples(self, key, value):
+        yield '', (), value
+
+
+class Histogram(Metric):
+    """
+    Observations counted in buckets by upper bound,
+    with their count and sum.
+
+    A value is a list of the count in each bucket,
+    then the count over the last bound, then the sum.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, **labels):
+        def update(value):
+            # copied, since flush writes values outside the lock.
+            value = list(value or [0] * (len(self.buckets) + 2))
+            value[bisect.bisect_left(self.buckets, amount)] += 1
+            value[-1] += amount
+            return value
+        self._update(labels, update)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observe the seconds spent in a with block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, value, other):
+        return [a + b for a, b in zip(value, other)]
+
+    def samples(self, key, value):
+        count = 0
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for bound, bucket in zip(bounds, value):
+            count += bucket
+            yield '_bucket', (('le', bound),), count
+        yield '_count', (), count
+        yield '_sum', (), value[-1]
+
+
+def _forget_parent():
+    """
+    Start from nothing in a forked process,
+    instead of counting the parent's values again.
+    """
+    if _state['pid'] != os.getpid():
+        _state.update(pid=os.getpid(), flushed=0, timer=None)
+        for metric in REGISTRY.values():
+            metric.values = {}
+
+
+def directory():
+    return getattr(settings, 'TRACKTASKS_METRICS_DIR', None)
+
+
+def _changed():
+    """
+    Write this process's values now if they haven't been written lately,
+    or once FLUSH_SECONDS have passed.
+    """
+    if not directory():
+        return
+    with _lock:
+        wait = _state['flushed'] + FLUSH_SECONDS - time.monotonic()
+        if wait > 0:
+            if _state['timer'] is None:
+                timer = threading.Timer(wait, flush)
+                timer.daemon = True
+                _state['timer'] = timer
+                timer.start()
+            return
+        # so other threads wait for the timer instead of flushing too.
+        _state['flushed'] = time.monotonic()
+    flush()
+
+
+def _path(pid):
+    return os.path.join(directory(), 'metrics-{}.json'.format(pid))
+
+
+def flush():
+    """
+    Write this process's values to its file in the metrics directory.
+    """
+    if not directory():
+        return
+    with _write_lock:
+        with _lock:
+            _forget_parent()
+            _state['flushed'] = time.monotonic()
+            _state['timer'] = None
+            data = {metric.name: [[list(key), value]
+                                  for key, value in metric.values.items()]
+                    for metric in REGISTRY.values() if metric.values}
+
+        path = _path(os.getpid())
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as values:
+            json.dump(data, values)
+        os.replace(temporary, path)
+
+
+atexit.register(flush)
+
+
+def collect():
+    """
+    Return a dictionary of each metric's values, by name,
+    added up over every process writing to the metrics directory.
+    """
+    if not directory():
+        with _lock:
+            _forget_parent()
+            return {metric.name: dict(metric.values)
+                    for metric in REGISTRY.values()}
+
+    flush()
+    totals = {name: {} for name in REGISTRY}
+    for path in glob.glob(os.path.join(directory(), 'metrics-*.json')):
+        try:
+            with open(path) as values:
+                data = json.load(values)
+        except (OSError, ValueError):
+            # the process's file went away or isn't readable.
+            continue
+
+        for name, values in data.items():
+            metric = REGISTRY.get(name)
+            if metric is None:
+                continue
+            for key, value in values:
+                key = tuple(key)
+                if key in totals[name]:
+                    value = metric.merge(totals[name][key], value)
+                totals[name][key] = value
+    return totals
+
+
+def render():
+    """
+    Return every metric in the Prometheus text format.
+    """
+    values = collect()
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append('# HELP {} {}'.format(metric.name,
+                                           _escape(metric.help, False)))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        for key, value in sorted(values[metric.name].items()):
+            for suffix, extra, number in metric.samples(key, value):
+                labels = tuple(zip(metric.labels, key)) + extra
+                lines.append('{}{}{} {}'.format(metric.name, suffix,
+                                                _labels(labels),
+                                                _number(number)))
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value))
+                          for name, value in labels) + '}'
+
+
+def _escape(text, quotes=True):
+    text = text.replace('\\', '\\\\').replace('\n', '\\n')
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _number(number):
+    return repr(float(number))
+
+
+requests = Histogram(
+    'tracktasks_request_seconds',
+    "Time to answer requests, by URL name.",
+    ['view', 'method', 'status'])
+
+daily_updates_seconds = Histogram(
+    'tracktasks_daily_updates_shard_seconds',
+    "Time to run a shard of the daily updates.",
+    buckets=JOB_BUCKETS)
+daily_updates_scanned = Counter(
+    'tracktasks_daily_updates_scanned_total',
+    "Recurring tasks scanned by the daily updates.")
+daily_updates_created = Counter(
+    'tracktasks_daily_updates_created_total',
+    "Recurrences created by the daily updates.")
+
+catch_up_seconds = Histogram(
+    'tracktasks_catch_up_seconds',
+    "Time to create a returning user's missed recurrences, "
+    "during login or deferred to celery.",
+    ['mode'], buckets=JOB_BUCKETS)
+catch_up_created = Counter(
+    'tracktasks_catch_up_created_total',
+    "Missed recurrences created for returning users.",
+    ['mode'])
+
+timer_operations = Counter(
+    'tracktasks_timer_operations_total',
+    "Timer starts and stops, and whether they changed the timer.",
+    ['operation', 'result'])
+
+cache_lookups = Counter(
+    'tracktasks_cache_lookups_total',
+    "Lookups of cached task lists, by hit or miss.",
+    ['result'])
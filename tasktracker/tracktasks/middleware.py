@@ -0,0 +1,234 @@
+"""
+Times each request, its SQL queries and its template rendering,
+and profiles staff requests on demand.
+
+Django 1.10 has no connection.execute_wrapper,
+so queries are recorded the way DEBUG records them:
+the debug cursor logs each statement and its time to
+connection.queries_log, which is reset as each request starts.
+
+Every request is logged to tracktasks.logger at debug level,
+and responses to staff, or to everyone with DEBUG,
+get a Server-Timing header.
+Requests over one of the thresholds are logged as warnings
+with their slowest and most repeated statements,
+so that an N+1 shows up as one statement run many times.
+"""
+import collections
+import logging
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+from . import metrics, profiling
+
+logger = logging.getLogger('tracktasks.logger')
+
+# statements with their literals taken out,
+# so the same query with different parameters counts as a repeat.
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# statements logged with slow requests.
+SLOWEST = 3
+MAX_SQL_LENGTH = 300
+
+
+def thresholds():
+    """
+    Return the thresholds a request is slow over,
+    as (reason, key, threshold) triples.
+    """
+    return [
+        ('time', 'total_ms', settings.TRACKTASKS_SLOW_REQUEST_MS),
+        ('queries', 'queries', settings.TRACKTASKS_SLOW_REQUEST_QUERIES),
+        ('repeated queries', 'repeated',
+            settings.TRACKTASKS_REPEATED_QUERIES),
+    ]
+
+
+class RequestTimingMiddleware(object):
+    """
+    Record the queries and times of each request and log them.
+    They're added to responses as a Server-Timing header
+    only for staff or with DEBUG,
+    so other clients can't see how the database is doing.
+    Turned off by TRACKTASKS_REQUEST_TIMING.
+
+    total: the whole request, inside this middleware.
+    render: rendering the template response, if there was one.
+    view: the rest of the request, including its queries.
+    sql: the time spent in queries.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRACKTASKS_REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = {}
+        for connection in connections.all():
+            started[connection.alias] = (connection.force_debug_cursor,
+                                         len(connection.queries_log))
+            connection.force_debug_cursor = True
+
+        request.render_seconds = 0
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            seconds = time.perf_counter() - start
+            queries = []
+            for connection in connections.all():
+                force_debug_cursor, first = started.get(connection.alias,
+                                                        (False, 0))
+                connection.force_debug_cursor = force_debug_cursor
+                queries += list(connection.queries_log)[first:]
+
+        timing = summarize(request, response, seconds, queries)
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = ', '.join(
+                            filter(None, [response.get('Server-Timing'),
+                                          server_timing(timing)]))
+        log(timing)
+        return response
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.render_seconds = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class MetricsMiddleware(object):
+    """
+    Record the time to answer each request in metrics.requests,
+    by the name of the URL it resolved to.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        metrics.requests.observe(time.perf_counter() - start,
+                                 view=match.view_name if match else '',
+                                 method=request.method,
+                                 status=response.status_code)
+        return response
+
+
+class ProfilingMiddleware(object):
+    """
+    Profile a staff user's request when it has a profile query parameter
+    or an X-Profile header.
+
+    With profile=show, the profile's summary is returned
+    in place of the page.
+    Otherwise the profile is stored in TRACKTASKS_PROFILE_DIR,
+    and named in the response's X-Profile header.
+
+    Turned on by TRACKTASKS_PROFILING,
+    and left out of the middleware entirely when it's off.
+    Needs to come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRACKTASKS_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get('profile',
+                               request.META.get('HTTP_X_PROFILE'))
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+
+        response, profile = profiling.run(self.get_response, request)
+        if mode == 'show':
+            return HttpResponse(profiling.summary(profile),
+                                content_type='text/plain; charset=utf-8')
+
+        path = profiling.store(profile, request.path)
+        response['X-Profile'] = os.path.basename(path)
+        return response
+
+
+def summarize(request, response, seconds, queries):
+    """
+    Return a dictionary of the times and queries of a request.
+    """
+    sql_seconds = sum(float(query['time']) for query in queries)
+    statements = collections.Counter(LITERALS.sub('?', query['sql'])
+                                     for query in queries)
+    repeated_sql, repeated = (statements.most_common(1)[0]
+                              if statements else ('', 0))
+    slowest = sorted(queries, key=lambda query: float(query['time']),
+                     reverse=True)[:SLOWEST]
+
+    return {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': _ms(seconds),
+        'view_ms': _ms(seconds - request.render_seconds),
+        'render_ms': _ms(request.render_seconds),
+        'sql_ms': _ms(sql_seconds),
+        'queries': len(queries),
+        'repeated': repeated,
+        'repeated_sql': repeated_sql[:MAX_SQL_LENGTH],
+        'slowest': [{'ms': _ms(float(query['time'])),
+                     'sql': query['sql'][:MAX_SQL_LENGTH]}
+                    for query in slowest],
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def server_timing(timing):
+    """
+    Return the Server-Timing header value for a request's timing.
+    """
+    return ('sql;dur={sql_ms};desc="{queries} queries", '
+            'view;dur={view_ms}, render;dur={render_ms}, '
+            'total;dur={total_ms}').format(**timing)
+
+
+def log(timing):
+    """
+    Log a request's timing, as a warning if it's over a threshold.
+    The timing is attached to the record as request_timing.
+    """
+    reasons = [reason for reason, key, threshold in thresholds()
+               if threshold is not None and timing[key] > threshold]
+    extra = {'request_timing': timing}
+
+    if not reasons:
+        logger.debug("request: %(method)s %(path)s %(status)s "
+                     "in %(total_ms)s ms, %(queries)s queries "
+                     "in %(sql_ms)s ms, render %(render_ms)s ms",
+                     timing, extra=extra)
+        return
+
+    slowest = '; '.join('{ms} ms: {sql}'.format(**query)
+                        for query in timing['slowest'])
+    logger.warning("slow request (%s): %s %s %s in %s ms, "
+                   "%s queries in %s ms, render %s ms, "
+                   "%s runs of: %s, slowest: %s",
+                   ', '.join(reasons), timing['method'], timing['path'],
+                   timing['status'], timing['total_ms'], timing['queries'],
+                   timing['sql_ms'], timing['render_ms'], timing['repeated'],
+                   timing['repeated_sql'], slowest, extra=extra)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:10
+from __future__ import unicode_literals
+
+# tracktasks had no migrations before this one,
+# so databases created with syncdb already have its tables.
+# Migrate those with manage.py migrate --fake-initial.
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('priority', models.DecimalField(decimal_places=0, default=0, max_digits=2)),
+                ('is_completed', models.BooleanField(default=False)),
+                ('is_disabled', models.BooleanField(default=False)),
+                ('completed_date', models.DateField(blank=True, null=True)),
+                ('completed_val', models.IntegerField(default=0, verbose_name='completed value')),
+                ('not_completed_cost', models.IntegerField(default=0, verbose_name='not completed value')),
+                ('date_type', models.CharField(choices=[('S', 'scheduled for'), ('D', 'due by')], default='D', max_length=1, verbose_name='date type')),
+                ('date', models.DateField()),
+                ('is_timed', models.BooleanField(default=False)),
+                ('total_time', models.DurationField(blank=True, null=True, verbose_name='total time')),
+                ('start_time', models.DateTimeField(blank=True, null=True, verbose_name='start time')),
+                ('remaining_time', models.DurationField(blank=True, null=True, verbose_name='remaining time')),
+                ('anchor_date', models.DateField(auto_now_add=True, verbose_name='anchor date')),
+                ('recurring', models.CharField(choices=[('N', 'not recurring'), ('D', 'daily'), ('W', 'weekly'), ('B', 'biweekly'), ('M', 'monthly')], default='N', max_length=1)),
+                ('recurring_id', models.UUIDField(default='00000000-0000-0000-0000-000000000000', verbose_name='recurring id')),
+                ('is_most_recent', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:10
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+# SQLite also supports partial indexes, but its planner can't match them
+# against the bound parameters Django uses for boolean lookups.
+PARTIAL_INDEX_VENDORS = ('postgresql',)
+
+# name: (columns, condition column, condition value)
+PARTIAL_INDEXES = {
+    'tracktasks_task_incomplete_idx': (['user_id', 'date'],
+                                       'is_completed', False),
+    'tracktasks_task_most_recent_idx': (['date'],
+                                        'is_most_recent', True),
+}
+
+
+def add_partial_indexes(apps, schema_editor):
+    """
+    Add partial indexes for incomplete and most recent tasks.
+    """
+    if schema_editor.connection.vendor not in PARTIAL_INDEX_VENDORS:
+        return
+
+    quote_name = schema_editor.quote_name
+    for name, (columns, column, value) in PARTIAL_INDEXES.items():
+        schema_editor.execute(
+            "CREATE INDEX {} ON {} ({}) WHERE {} = {}".format(
+                quote_name(name),
+                quote_name('tracktasks_task'),
+                ", ".join(quote_name(column) for column in columns),
+                quote_name(column),
+                schema_editor.quote_value(value)))
+
+
+def remove_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in PARTIAL_INDEX_VENDORS:
+        return
+
+    for name in PARTIAL_INDEXES:
+        schema_editor.execute(
+            "DROP INDEX {}".format(schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracktasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('recurring_id', 'is_completed', 'date'), ('user', 'completed_date'), ('user', 'is_disabled', 'recurring', 'date')]),
+        ),
+        migrations.RunPython(add_partial_indexes, remove_partial_indexes),
+    ]
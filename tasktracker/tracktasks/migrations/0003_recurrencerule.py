@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:18
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracktasks', '0002_task_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recurring_id', models.UUIDField(default=uuid.uuid4, unique=True, verbose_name='recurring id')),
+                ('name', models.CharField(max_length=200)),
+                ('priority', models.DecimalField(decimal_places=0, default=0, max_digits=2)),
+                ('completed_val', models.IntegerField(default=0, verbose_name='completed value')),
+                ('not_completed_cost', models.IntegerField(default=0, verbose_name='not completed value')),
+                ('date_type', models.CharField(choices=[('S', 'scheduled for'), ('D', 'due by')], default='D', max_length=1, verbose_name='date type')),
+                ('is_timed', models.BooleanField(default=False)),
+                ('total_time', models.DurationField(blank=True, null=True, verbose_name='total time')),
+                ('anchor_date', models.DateField(verbose_name='anchor date')),
+                ('recurring', models.CharField(choices=[('D', 'daily'), ('W', 'weekly'), ('B', 'biweekly'), ('M', 'monthly')], default='D', max_length=1)),
+                ('is_disabled', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
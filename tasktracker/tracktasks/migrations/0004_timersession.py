@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:24
+from __future__ import unicode_literals
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracktasks', '0003_recurrencerule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTrackedTime',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('tracked_time', models.DurationField(default=datetime.timedelta(0), verbose_name='tracked time')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimerSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField()),
+                ('stopped', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.DurationField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='tracked_time',
+            field=models.DurationField(default=datetime.timedelta(0), verbose_name='tracked time'),
+        ),
+        migrations.AddField(
+            model_name='timersession',
+            name='task',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timer_sessions', to='tracktasks.Task'),
+        ),
+        migrations.AddField(
+            model_name='timersession',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterIndexTogether(
+            name='timersession',
+            index_together=set([('task', 'stopped')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailytrackedtime',
+            unique_together=set([('user', 'date')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracktasks', '0004_timersession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskAction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('complete', 'complete'), ('start_timer', 'start timer'), ('stop_timer', 'stop timer')], max_length=20)),
+                ('client_timestamp', models.DateTimeField(verbose_name='client timestamp')),
+                ('applied', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='tracktasks.Task')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='taskaction',
+            unique_together=set([('task', 'action', 'client_timestamp')]),
+        ),
+    ]
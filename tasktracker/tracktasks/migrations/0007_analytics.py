@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:31
+from __future__ import unicode_literals
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracktasks', '0006_dailyscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('changed_since', models.DateTimeField(verbose_name='changed since')),
+                ('refreshed_on', models.DateField(verbose_name='refreshed on')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WeeklySeriesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('recurring_id', models.UUIDField(verbose_name='recurring id')),
+                ('name', models.CharField(max_length=200)),
+                ('tasks', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('overdue', models.IntegerField(default=0)),
+                ('tracked_time', models.DurationField(default=datetime.timedelta(0), verbose_name='tracked time')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated at'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='weeklyseriesrollup',
+            unique_together=set([('user', 'week', 'recurring_id')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:50
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracktasks', '0007_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurrencerule',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='updated at'),
+        ),
+        migrations.AlterIndexTogether(
+            name='recurrencerule',
+            index_together=set([('user', 'updated_at')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('user', 'completed_date'), ('user', 'updated_at'), ('recurring_id', 'is_completed', 'date'), ('user', 'is_disabled', 'recurring', 'date')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracktasks', '0008_recurrencerule_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUpdatesRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(auto_now_add=True, verbose_name='started')),
+                ('shards', models.IntegerField()),
+                ('finished', models.IntegerField(default=0)),
+                ('reported', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyUpdatesShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_user_id', models.IntegerField(verbose_name='first user id')),
+                ('last_user_id', models.IntegerField(verbose_name='last user id')),
+                ('scanned', models.IntegerField(default=0)),
+                ('created', models.IntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('profile', models.CharField(blank=True, max_length=500)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shard_reports', to='tracktasks.DailyUpdatesRun')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyupdatesshard',
+            unique_together=set([('run', 'first_user_id')]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracktasks', '0009_daily_updates_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleRollupWeek',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(verbose_name='user id')),
+                ('week', models.DateField()),
+            ],
+        ),
+    ]
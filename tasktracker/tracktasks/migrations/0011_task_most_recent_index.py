@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:43
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracktasks', '0010_stalerollupweek'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('user', 'is_disabled', 'recurring', 'date'), ('user', 'updated_at'), ('user', 'completed_date'), ('recurring_id', 'is_completed', 'date'), ('is_most_recent', 'date')]),
+        ),
+    ]
@@ -1,12 +1,34 @@
 import datetime
-import calendar
+import logging
 import uuid
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Max, Q
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.http import HttpRequest
-from django.core.exceptions import ObjectDoesNotExist
+
+from . import events, metrics, recurrence
+from .cache import invalidate_user
+
+logger = logging.getLogger('tracktasks.logger')
+
+
+class DurationAdd(models.Func):
+    """
+    Add a timedelta to a duration field in the database.
+
+    Django can't combine durations on databases without a native
+    duration type, like SQLite, which store them as microseconds.
+    Adding the column and the value directly works on both.
+    """
+    arg_joiner = ' + '
+    template = '(%(expressions)s)'
+
+    def __init__(self, field, delta):
+        super().__init__(F(field),
+                         models.Value(delta,
+                                      output_field=models.DurationField()),
+                         output_field=models.DurationField())
 
 
 class TaskManager(models.Manager):
@@ -24,57 +46,77 @@ class TaskManager(models.Manager):
         the most recent incomplete instances
         of each group of active recurring tasks
         for the provided user.
+
+        The whole selection happens in a single query,
+        so the number of queries doesn't grow
+        with the number of recurring groups.
         """
         unique_ids = self._get_unique_recurring_ids(user)
-        latest_recurring_ids = self._get_latest_recurring(unique_ids, multiple)
-        latest_recurring = self.filter(pk__in=latest_recurring_ids)
+        recurring_group = self.filter(recurring_id__in=unique_ids)
+        latest_recurring = self._get_latest_recurring(recurring_group,
+                                                      multiple)
         return latest_recurring
 
     def _get_unique_recurring_ids(self, user):
         """
-        Return a set of unique recurring_ids
+        Return a values queryset of the recurring_ids
         for active recurring tasks.
+
+        It's lazy, so it gets used as a subquery
+        instead of loading every recurrence.
         """
-        unique_ids = set()
         recurrences = self.filter(user=user,
                                 is_disabled=False).exclude(recurring='N')
-        # construct set of unique recurring ids
-        for recurrence in recurrences:
-            recurring_id = recurrence.recurring_id
-            if recurring_id not in unique_ids:
-                unique_ids.add(recurring_id)
-        return(unique_ids)
+        # occurrences of recurrence rules are expanded separately.
+        recurrences = recurrences.exclude(
+                recurring_id__in=RecurrenceRule.objects.filter(
+                                        user=user).values('recurring_id'))
+        return recurrences.order_by().values('recurring_id')
 
-    def _get_latest_recurring(self, unique_ids, multiple=False):
+    def _get_latest_recurring(self, recurring_group, multiple=False):
         """
-        Return a list of the latest recurring instances.
+        Narrow recurring_group down to the latest recurring instances.
         If multiple is True, try to return multiple instances of the same task.
         If multiple is False, return only one instance per task.
+
+        Each instance is compared against the earliest incomplete instance
+        of its group, falling back on the latest completed one.
         """
-        latest_recurring = set()
+        table = self.model._meta.db_table
+        latest_sql = self._latest_recurring_sql()
 
-        for recurring_id in list(unique_ids):
-            recurring_group = self.filter(recurring_id=recurring_id)
+        if multiple:
+            where = "{0}.is_completed = %s OR {0}.id = ({1})".format(
+                                                        table, latest_sql)
+            params = [False, False]
+        else:
+            where = "{0}.id = ({1})".format(table, latest_sql)
+            params = [False]
 
-            if multiple:
-                candidates = recurring_group.filter(is_completed=False)
-                if len(candidates) != 0:
-                    for candidate in candidates:
-                        latest_recurring.add(candidate.id)
-                else:
-                    candidate = recurring_group.filter(
-                                            is_completed=True).latest('date')
-                    latest_recurring.add(candidate.id)
+        return recurring_group.extra(where=[where], params=params)
 
-            elif not multiple:
-                try:
-                    candidate = recurring_group.filter(
-                        is_completed=False).earliest('date')
-                except ObjectDoesNotExist:
-                    candidate = recurring_group.filter(
-                        is_completed=True).latest('date')
-                latest_recurring.add(candidate.id)
-        return latest_recurring
+    def _latest_recurring_sql(self):
+        """
+        Return a correlated subquery
+        selecting the id of the latest instance
+        of the outer task's recurring group.
+
+        Incomplete instances sort first, earliest date first.
+        Completed instances follow, latest date first.
+        It takes one parameter: False.
+
+        Only use it on the outermost query.
+        Django relabels the tables of subqueries
+        but not the contents of extra().
+        """
+        table = self.model._meta.db_table
+        return ("SELECT latest.id FROM {0} latest "
+                "WHERE latest.recurring_id = {0}.recurring_id "
+                "ORDER BY latest.is_completed, "
+                "CASE WHEN latest.is_completed = %s "
+                "THEN latest.date END, "
+                "latest.date DESC, latest.id "
+                "LIMIT 1").format(table)
 
     def non_recurring(self, user):
         """
@@ -95,6 +137,48 @@ class TaskManager(models.Manager):
         non_recurring_query = self.non_recurring(user)
         return (recurring_query | non_recurring_query).order_by('date')
 
+    def active_tasks_page(self, user, date, after=None, size=50):
+        """
+        Return a page of the user's active tasks,
+        with the next occurrence of each recurrence rule on date,
+        ordered by date and id,
+        and the key of the page's last task if there are more.
+
+        Pages are found by key rather than by offset,
+        so every page costs the same:
+        after: the key of the last task on the previous page.
+        See page_key.
+        """
+        tasks = self.active_tasks(user)
+        rule_tasks = self.next_rule_occurrences(user, date)
+
+        if after is not None:
+            after_date, after_id = after
+            tasks = tasks.filter(Q(date__gt=after_date) |
+                                 Q(date=after_date, pk__gt=after_id))
+            rule_tasks = [task for task in rule_tasks
+                          if self.page_key(task) > after]
+
+        # one extra row tells whether there's another page.
+        tasks = list(tasks.order_by('date', 'pk')[:size + 1])
+        page = sorted(tasks + rule_tasks, key=self.page_key)
+
+        if len(page) > size:
+            page = page[:size]
+            return page, self.page_key(page[-1])
+        return page, None
+
+    @staticmethod
+    def page_key(task):
+        """
+        Return the (date, id) key active_tasks_page orders tasks by.
+        Virtual occurrences of a recurrence rule have no id,
+        so they're keyed by the negated id of the rule.
+        """
+        if task.pk is None:
+            return (task.date, -task.rule.pk)
+        return (task.date, task.pk)
+
     def scheduled_for(self, user, date, completed=False):
         """
         Return the tasks scheduled for the datetime provided.
@@ -132,7 +216,199 @@ class TaskManager(models.Manager):
                         is_disabled=False,
                         user=user).order_by('-date')
 
-    def create_daily_recurring_tasks(self):
+    def last_change(self, user):
+        """
+        Return the latest updated_at of the user's tasks and rules,
+        and the number of them.
+        Together they change whenever a task or rule is written,
+        created or deleted, so they validate anything shown from them.
+
+        Both aggregates are read from the (user, updated_at) indexes.
+        """
+        latest = None
+        count = 0
+        for model in (self.model, RecurrenceRule):
+            change = model.objects.filter(user=user).aggregate(
+                                    latest=Max('updated_at'), count=Count('pk'))
+            if change['latest'] and (latest is None or
+                                     change['latest'] > latest):
+                latest = change['latest']
+            count += change['count']
+        return latest, count
+
+    def dashboard(self, user, date):
+        """
+        Return a dictionary with the lists of tasks
+        from scheduled_for, still_due_on, completed_on and overdue_on.
+
+        The candidate tasks are fetched in a single query
+        and split into the lists in one pass.
+        Occurrences of recurrence rules are added afterwards,
+        see rule_occurrences.
+        """
+        date = self.model._meta.get_field('date').to_python(date)
+        table = self.model._meta.db_table
+        rules = list(RecurrenceRule.objects.filter(user=user,
+                                                   is_disabled=False))
+        rule_ids = {rule.recurring_id for rule in rules}
+
+        # is_latest is what unique_recurring picks when multiple is False.
+        # Non-recurring tasks skip the subquery.
+        is_latest_sql = ("CASE WHEN {0}.recurring = %s THEN NULL "
+                         "ELSE {0}.id = ({1}) END").format(
+                                        table, self._latest_recurring_sql())
+
+        candidates = (self.active_tasks(user, multiple=True) |
+                      self.completed_on(user, date))
+        candidates = candidates.extra(
+                        select={'is_latest': is_latest_sql},
+                        select_params=['N', False]).only(
+                        'name', 'user', 'date_type', 'date', 'recurring',
+                        'recurring_id', 'is_completed', 'is_disabled',
+                        'completed_date', 'is_timed', 'start_time',
+                        'remaining_time', 'updated_at').order_by('date', 'pk')
+
+        dashboard = {
+            'scheduled_for': [],
+            'still_due_on': [],
+            'completed_on': [],
+            'overdue_on': [],
+        }
+
+        for task in candidates:
+            if task.recurring == 'N':
+                is_active = not task.is_completed
+                is_latest = is_active
+            elif task.recurring_id in rule_ids:
+                # pending rule occurrences are added below.
+                is_active = is_latest = False
+            else:
+                is_latest = bool(task.is_latest)
+                is_active = not task.is_completed or is_latest
+
+            is_users = (task.user_id == user.pk) and not task.is_disabled
+
+            if is_active and task.date == date:
+                dashboard['scheduled_for'].append(task)
+
+            if is_latest and task.date_type == 'D' and task.date >= date:
+                dashboard['still_due_on'].append(task)
+
+            if (is_users and task.is_completed and
+                    task.completed_date == date):
+                dashboard['completed_on'].append(task)
+
+            if (is_users and is_active and not task.is_completed and
+                    task.date < date):
+                dashboard['overdue_on'].append(task)
+
+        for occurrences in self.rule_occurrences(user, date,
+                                                 rules).values():
+            if not occurrences:
+                continue
+            for task in occurrences:
+                if task.date == date:
+                    dashboard['scheduled_for'].append(task)
+                elif task.date < date:
+                    dashboard['overdue_on'].append(task)
+
+            earliest = occurrences[0]
+            if earliest.date_type == 'D' and earliest.date >= date:
+                dashboard['still_due_on'].append(earliest)
+
+        by_date = lambda task: task.date
+        dashboard['scheduled_for'].sort(key=by_date)
+        dashboard['still_due_on'].sort(key=by_date)
+        dashboard['overdue_on'].sort(key=by_date, reverse=True)
+        return dashboard
+
+    def rule_occurrences(self, user, date, rules=None):
+        """
+        Return a dictionary mapping each of the user's active recurrence rules
+        to a list of its pending occurrences, ordered by date.
+        The list is empty for a rule whose series has run out.
+
+        Pending occurrences are the incomplete saved ones
+        and the virtual ones after the latest saved one through date,
+        plus the next virtual one after date.
+        Virtual occurrences before the latest saved one are skipped,
+        so completing an occurrence lets go of the ones before it.
+
+        rules: the user's active rules, if they've already been fetched.
+        """
+        if rules is None:
+            rules = list(RecurrenceRule.objects.filter(user=user,
+                                                       is_disabled=False))
+        if not rules:
+            return {}
+
+        recurring_ids = [rule.recurring_id for rule in rules]
+        saved = self.filter(recurring_id__in=recurring_ids).order_by()
+        latest_saved = dict(saved.values_list('recurring_id').annotate(
+                                                    models.Max('date')))
+        incomplete = saved.filter(is_completed=False, is_disabled=False)
+
+        occurrences = {rule: [] for rule in rules}
+        rules_by_id = {rule.recurring_id: rule for rule in rules}
+        for task in incomplete:
+            task.rule = rules_by_id[task.recurring_id]
+            occurrences[task.rule].append(task)
+
+        for rule in rules:
+            latest = latest_saved.get(rule.recurring_id)
+            start = rule.anchor_date
+            if latest is not None:
+                start = max(start, latest + datetime.timedelta(days=1))
+
+            for occurrence_date in recurrence.occurrences_from(
+                                    rule.anchor_date, rule.recurring, start):
+                occurrences[rule].append(rule.build_occurrence(
+                                                        occurrence_date))
+                if occurrence_date > date:
+                    break
+
+            occurrences[rule].sort(key=lambda task: task.date)
+
+        return occurrences
+
+    def next_rule_occurrences(self, user, date):
+        """
+        Return a list with the earliest pending occurrence
+        of each of the user's active recurrence rules.
+        """
+        return [occurrences[0] for occurrences
+                in self.rule_occurrences(user, date).values() if occurrences]
+
+    def get_occurrence(self, user, occurrence_id):
+        """
+        Return the user's task identified by occurrence_id.
+        Virtual occurrences of a recurrence rule are saved first.
+        See Task.occurrence_id.
+        """
+        occurrence_id = str(occurrence_id)
+        if '-' not in occurrence_id:
+            return self.get(pk=occurrence_id, user=user)
+
+        rule_pk, date = occurrence_id.split('-', 1)
+        rule = RecurrenceRule.objects.get(pk=rule_pk, user=user,
+                                          is_disabled=False)
+        date = datetime.datetime.strptime(date, '%Y%m%d').date()
+        return rule.materialize(date)
+
+    def due_to_recur(self, date):
+        """
+        Return a queryset of the most recent recurring tasks on date
+        of users active in the last week, ordered by id.
+        """
+        active_user_date = timezone.now() - datetime.timedelta(days=7)
+        return self.filter(date__exact=date,
+                           user__profile__most_recent_login__gte=\
+                           active_user_date,
+                           is_most_recent=True,
+                           is_disabled=False).exclude(
+                           recurring="N").order_by('pk')
+
+    def create_daily_recurring_tasks(self, chunk_size=1000, user_range=None):
         """
         Create a new recurrence
         for all most recent recurring tasks
@@ -142,21 +418,109 @@ class TaskManager(models.Manager):
 
         It checks for tomorrow to avoid timezone conflicts
         for those whose time zone is near the update time.
+
+        Tasks are read in chunks of chunk_size, ordered by id,
+        and each chunk is written in its own transaction
+        with one bulk insert and one update.
+
+        user_range: an optional (first, last) pair of user ids,
+        to only update those users' tasks, inclusive.
+
+        Return a dictionary with the number of tasks scanned and created.
         """
-        active_user_date = timezone.now() - datetime.timedelta(days=7)
         date_to_check = datetime.date.today() + datetime.timedelta(days=1)
+        queryset_to_repeat = self.due_to_recur(date_to_check)
+
+        if user_range is not None:
+            first_user_id, last_user_id = user_range
+            queryset_to_repeat = queryset_to_repeat.filter(
+                                            user_id__gte=first_user_id,
+                                            user_id__lte=last_user_id)
+
+        report = {'scanned': 0, 'created': 0}
+        last_pk = 0
+
+        while True:
+            with transaction.atomic():
+                chunk = list(queryset_to_repeat.filter(
+                                            pk__gt=last_pk)[:chunk_size])
+                if not chunk:
+                    break
+
+                new_tasks = []
+                advanced = []
+                for task in chunk:
+                    try:
+                        new_tasks.append(task.build_next_recurrence())
+                    except IndexError:
+                        # stored before monthly dates were validated.
+                        logger.warning("daily updates: task %s can't recur "
+                                       "from %s, skipped", task.pk, task.date)
+                        continue
+                    advanced.append(task.pk)
+
+                self.bulk_create(new_tasks)
+                self.filter(pk__in=advanced).update(
+                                                is_most_recent=False,
+                                                updated_at=timezone.now())
+
+                for user_id in set(task.user_id for task in chunk):
+                    invalidate_user(user_id)
+
+            last_pk = chunk[-1].pk
+            report['scanned'] += len(chunk)
+            report['created'] += len(new_tasks)
 
-        queryset_to_repeat = Task.objects.filter(
-                            date__exact=date_to_check,
-                            user__profile__most_recent_login__gte=\
-                            active_user_date,
-                            is_most_recent=True,
-                            is_disabled=False).exclude(recurring="N")
+        return report
 
-        for task in queryset_to_repeat:
-            task.add_next_recurring_date()
-            task.is_most_recent = False
+    def catch_up_recurring_tasks(self, user):
+        """
+        Create every missed recurrence of the user's recurring tasks,
+        through one recurrence beyond today.
+
+        Used for users whose tasks weren't updated daily
+        because they haven't logged in for a while.
+        All of the recurrences are created with one bulk insert.
+
+        Return the number of recurrences created.
+        """
+        today = datetime.date.today()
+        new_tasks = []
+
+        with transaction.atomic():
+            sources = list(self.filter(user=user,
+                                       is_most_recent=True,
+                                       is_disabled=False,
+                                       date__lte=today).exclude(
+                                       recurring='N').select_for_update())
+
+            advanced = []
+            for source in sources:
+                try:
+                    dates = recurrence.dates_through(source.date,
+                                                     source.recurring, today)
+                    last_date = dates[-1] if dates else source.date
+                    dates.append(recurrence.next_date(last_date,
+                                                      source.recurring))
+                except IndexError:
+                    logger.warning("catch up: task %s can't recur from %s, "
+                                   "skipped", source.pk, source.date)
+                    continue
+                advanced.append(source.pk)
+
+                recurrences = [source.build_recurrence(date)
+                               for date in dates]
+                for task in recurrences[:-1]:
+                    task.is_most_recent = False
+                new_tasks.extend(recurrences)
 
+            self.bulk_create(new_tasks)
+            self.filter(pk__in=advanced).update(
+                                                is_most_recent=False,
+                                                updated_at=timezone.now())
+            invalidate_user(user.pk)
+
+        return len(new_tasks)
 
     def get_task_group_incompletes(self, shared_id):
         """
@@ -174,9 +538,142 @@ class TaskManager(models.Manager):
         and set them as disabled.
         """
         recurrences = self.get_task_group_incompletes(shared_id)
-        for task in recurrences:
-            task.is_disabled = True
-            task.save()
+        user_ids = set(recurrences.values_list('user_id', flat=True))
+        recurrences.update(is_disabled=True, updated_at=timezone.now())
+
+        rules = RecurrenceRule.objects.filter(recurring_id=shared_id)
+        user_ids.update(rules.values_list('user_id', flat=True))
+        rules.update(is_disabled=True, updated_at=timezone.now())
+
+        for user_id in user_ids:
+            invalidate_user(user_id)
+
+    def apply_actions(self, user, actions):
+        """
+        Apply an ordered batch of task actions for the user
+        in a single transaction.
+
+        actions: a list of (task_id, action, client_timestamp) tuples,
+        with actions from TaskAction.ACTIONS.
+        task_id may also be the occurrence id of a virtual occurrence,
+        see Task.occurrence_id, which is saved first.
+        Each action is applied as of its client timestamp.
+        Actions already applied, as recorded in TaskAction,
+        are skipped, so a batch can be replayed safely.
+
+        Return a dictionary with the affected tasks, by id,
+        the ids the virtual occurrences were saved with,
+        and the number of actions applied and skipped.
+        Raise Task.DoesNotExist if a task isn't the user's,
+        or RecurrenceRule.DoesNotExist if an occurrence's rule isn't.
+        """
+        with transaction.atomic():
+            saved_ids = {occurrence_id:
+                         self.get_occurrence(user, occurrence_id).pk
+                         for occurrence_id, _, _ in actions
+                         if '-' in str(occurrence_id)}
+            actions = [(saved_ids.get(task_id, task_id), action, timestamp)
+                       for task_id, action, timestamp in actions]
+            task_ids = set(task_id for task_id, _, _ in actions)
+
+            tasks = self.filter(user=user).select_for_update().in_bulk(
+                                                                task_ids)
+            missing = task_ids - set(tasks)
+            if missing:
+                raise Task.DoesNotExist("No tasks with ids {}.".format(
+                                                    sorted(missing)))
+
+            logged = TaskAction.objects.filter(task_id__in=task_ids)
+            seen = set(logged.values_list('task_id', 'action',
+                                          'client_timestamp'))
+
+            applied = []
+            for task_id, action, timestamp in actions:
+                key = (task_id, action, timestamp)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                task = tasks[task_id]
+                if action == 'complete':
+                    task.mark_complete(timestamp)
+                elif action == 'start_timer':
+                    task.start_timer(timestamp)
+                elif action == 'stop_timer':
+                    task.stop_timer(timestamp)
+
+                applied.append(TaskAction(task=task, action=action,
+                                          client_timestamp=timestamp))
+
+            TaskAction.objects.bulk_create(applied)
+
+        return {'tasks': tasks,
+                'saved_ids': saved_ids,
+                'applied': len(applied),
+                'skipped': len(actions) - len(applied)}
+
+    def bulk_complete(self, user, task_ids):
+        """
+        Mark the user's incomplete tasks with the provided ids
+        as complete, in a single update,
+        and add their values to the user's score.
+        Return the number of tasks completed.
+        """
+        today = timezone.localtime(timezone.now()).date()
+        with transaction.atomic():
+            values = dict(self.filter(user=user, pk__in=task_ids,
+                                      is_completed=False).select_for_update(
+                                      ).order_by().values_list(
+                                                    'pk', 'completed_val'))
+            completed = self.filter(pk__in=values).update(
+                                        is_completed=True,
+                                        completed_date=today,
+                                        updated_at=timezone.now())
+            if completed:
+                DailyScore.add(user.pk, today,
+                               earned=sum(values.values()),
+                               completed=completed)
+
+        invalidate_user(user.pk)
+        return completed
+
+    def bulk_disable(self, user, task_ids=(), recurring_ids=()):
+        """
+        Disable the user's tasks with the provided ids
+        and the incomplete tasks of the provided recurring series,
+        along with the series' recurrence rules.
+        Return the number of tasks and rules disabled.
+        """
+        disabled = self.filter(
+                        Q(pk__in=task_ids) |
+                        Q(recurring_id__in=recurring_ids, is_completed=False),
+                        user=user,
+                        is_disabled=False).update(is_disabled=True,
+                                                  updated_at=timezone.now())
+        if recurring_ids:
+            disabled += RecurrenceRule.objects.filter(
+                        user=user,
+                        recurring_id__in=recurring_ids,
+                        is_disabled=False).update(is_disabled=True,
+                                                  updated_at=timezone.now())
+        invalidate_user(user.pk)
+        return disabled
+
+    def bulk_reschedule(self, user, task_ids, days):
+        """
+        Move the user's incomplete tasks with the provided ids
+        by a number of days, in a single update.
+        Return the number of tasks moved.
+        """
+        tasks = self.filter(user=user, pk__in=task_ids, is_completed=False)
+        with transaction.atomic():
+            StaleRollupWeek.mark(user.pk, tasks.order_by().values_list(
+                                            'date', flat=True).distinct())
+            moved = tasks.update(
+                                date=F('date') + datetime.timedelta(days=days),
+                                updated_at=timezone.now())
+        invalidate_user(user.pk)
+        return moved
 
 # Opted against inheritance for different types of tasks because
 # it doesn't translate well into a relational model.
@@ -229,13 +726,14 @@ class Task(models.Model):
 
     # The following fields only apply to timed events.
     # start_time is recorded at the start of a task. When the time is stopped,
-    # the total difference is subtracted from remaining_time. When it is
-    # restarted, start_time is overwritten.
-    # In the future it may be worth saving start/stop times and the task for
-    # analysis.
+    # the total difference is subtracted from remaining_time
+    # and added to tracked_time. When it is restarted, start_time is
+    # overwritten. Every start and stop is also logged as a TimerSession.
     start_time = models.DateTimeField('start time', null=True, blank=True)
     remaining_time =\
         models.DurationField('remaining time', null=True, blank=True)
+    tracked_time = models.DurationField('tracked time',
+                                        default=datetime.timedelta(0))
 
     # The recurring day depends on the anchor date. e.g. weekly recurring
     # happens on the same day of the week. Monthly recurring happens
@@ -256,33 +754,265 @@ class Task(models.Model):
     # for recurring tasks.
     is_most_recent = models.BooleanField(default=False)
 
+    # set by save(). update() skips auto_now,
+    # so every update has to set it too.
+    updated_at = models.DateTimeField('updated at', auto_now=True,
+                                      db_index=True)
+
+    class Meta:
+        # These match the filters used by TaskManager.
+        # Partial indexes for incomplete and most recent tasks
+        # are added in migrations on PostgreSQL.
+        index_together = [
+            ['user', 'is_disabled', 'recurring', 'date'],
+            ['recurring_id', 'is_completed', 'date'],
+            ['user', 'completed_date'],
+            ['user', 'updated_at'],
+            # the daily updates, on backends without the partial index.
+            ['is_most_recent', 'date'],
+        ]
+
     def __str__(self):
         return self.name
 
-    def complete(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the user and date the task was loaded with,
+        so the week it's moved out of can be marked stale.
+        Saving updates them, see signals.mark_week_moved_from.
+        """
+        task = super().from_db(db, field_names, values)
+        task.loaded_week = (task.__dict__.get('user_id'),
+                            task.__dict__.get('date'))
+        return task
+
+    @property
+    def occurrence_id(self):
+        """
+        Identify the task in forms.
+        Virtual occurrences of a recurrence rule aren't saved,
+        so they're identified by the rule and the date.
+        """
+        if self.pk is None and hasattr(self, 'rule'):
+            return '{}-{:%Y%m%d}'.format(self.rule.pk, self.date)
+        return self.pk
+
+    @property
+    def row_version(self):
+        """
+        Changes whenever the task's rendered row might,
+        see task_row.html.
+        Virtual occurrences change with their rule.
+        """
+        if self.pk is None and hasattr(self, 'rule'):
+            return self.rule.updated_at
+        return self.updated_at
+
+    def complete(self, now=None):
         """
         Mark a task as complete
         and set its completed date.
         """
         self.is_completed = True
-        self.completed_date = timezone.now()
+        now = now or timezone.now()
+        self.completed_date = timezone.localtime(now).date()
+
+    def mark_complete(self, now=None):
+        """
+        Complete the task and add its value to the user's score,
+        with a conditional update,
+        so a task that's already complete isn't scored twice.
+        Return True if the task was completed.
+        """
+        self.complete(now)
+        updated_at = timezone.now()
+        with transaction.atomic():
+            completed = Task.objects.filter(pk=self.pk,
+                                            is_completed=False).update(
+                                    is_completed=True,
+                                    completed_date=self.completed_date,
+                                    updated_at=updated_at)
+            if completed:
+                self.updated_at = updated_at
+                DailyScore.add(self.user_id, self.completed_date,
+                               earned=self.completed_val, completed=1)
+
+        invalidate_user(self.user_id)
+        return bool(completed)
+
+    def state(self):
+        """
+        Return the parts of the task that actions change,
+        ready to be sent as JSON. Times are in seconds.
+        """
+        def seconds(duration):
+            return None if duration is None else duration.total_seconds()
+
+        return {
+            'id': self.occurrence_id,
+            'is_completed': self.is_completed,
+            'completed_date': self.completed_date,
+            'start_time': self.start_time,
+            'remaining_time': seconds(self.remaining_time),
+            'tracked_time': seconds(self.tracked_time),
+        }
+
+    def dashboard_lists(self, date):
+        """
+        Return the names of the dashboard lists the task shows up in
+        on date, as returned by TaskManager.dashboard.
+        This checks the task itself, not the rest of its series.
+        """
+        if self.is_disabled:
+            return []
+        if self.is_completed:
+            if self.completed_date == date:
+                return ['completed_on']
+            return []
+
+        lists = []
+        if self.date == date:
+            lists.append('scheduled_for')
+        if self.date_type == 'D' and self.date >= date:
+            lists.append('still_due_on')
+        if self.date < date:
+            lists.append('overdue_on')
+        return lists
+
+    def start_timer(self, now=None):
+        """
+        Start the task's timer and log a new session.
+
+        The start is a conditional update,
+        so a timer that's already running isn't restarted.
+        Return True if the timer was started.
+        """
+        now = now or timezone.now()
+        updated_at = timezone.now()
+        with transaction.atomic():
+            started = Task.objects.filter(pk=self.pk,
+                                          start_time__isnull=True).update(
+                                                    start_time=now,
+                                                    updated_at=updated_at)
+            if started:
+                TimerSession.objects.create(task=self, user_id=self.user_id,
+                                            started=now)
+                self.start_time = now
+                self.updated_at = updated_at
+                self._publish_timer()
+
+        metrics.timer_operations.inc(operation='start',
+                                     result='started' if started
+                                     else 'already running')
+        invalidate_user(self.user_id)
+        return bool(started)
+
+    def stop_timer(self, now=None):
+        """
+        Stop the task's timer, close its session
+        and add the elapsed time to the tracked time rollups.
+        The task is completed once its remaining time runs out.
+
+        The stop is a conditional update on the start time it read,
+        with the times adjusted in the database,
+        so a second stop of the same session doesn't count twice.
+        Return True if the timer was stopped.
+        """
+        if self.start_time is None:
+            metrics.timer_operations.inc(operation='stop',
+                                         result='not running')
+            return False
+
+        now = now or timezone.now()
+        started = self.start_time
+        elapsed = max(now - started, datetime.timedelta(0))
+
+        with transaction.atomic():
+            stopped = Task.objects.filter(pk=self.pk,
+                                          start_time=started).update(
+                        start_time=None,
+                        remaining_time=DurationAdd('remaining_time', -elapsed),
+                        tracked_time=DurationAdd('tracked_time', elapsed),
+                        updated_at=timezone.now())
+            if not stopped:
+                metrics.timer_operations.inc(operation='stop',
+                                             result='not running')
+                return False
+
+            closed = TimerSession.objects.filter(task=self,
+                                                 stopped__isnull=True).update(
+                                                    stopped=now,
+                                                    duration=elapsed)
+            if not closed:
+                # the timer was started before sessions were logged.
+                TimerSession.objects.create(task=self, user_id=self.user_id,
+                                            started=started, stopped=now,
+                                            duration=elapsed)
+
+            DailyTrackedTime.add_session(self.user_id, started, now)
+
+            # only the days attribute of a timedelta
+            # will go negative.
+            completed_date = timezone.localtime(now).date()
+            completed = Task.objects.filter(
+                                pk=self.pk,
+                                is_completed=False,
+                                remaining_time__lt=datetime.timedelta(0)
+                                ).update(is_completed=True,
+                                         completed_date=completed_date,
+                                         updated_at=timezone.now())
+            if completed:
+                DailyScore.add(self.user_id, completed_date,
+                               earned=self.completed_val, completed=1)
+
+        self.refresh_from_db(fields=['start_time', 'remaining_time',
+                                     'tracked_time', 'is_completed',
+                                     'completed_date', 'updated_at'])
+        self._publish_timer()
+        metrics.timer_operations.inc(operation='stop', result='stopped')
+        invalidate_user(self.user_id)
+        return True
+
+    def _publish_timer(self):
+        """
+        Send the task's timer state to the user's event streams
+        once the change is committed.
+        """
+        state = self.state()
+        transaction.on_commit(
+                    lambda: events.publish(self.user_id, 'timer', state))
 
     def add_next_recurring_date(self):
         """
         create and return a new recurrance of a recurring task.
         """
+        new_task = self.build_next_recurrence()
+        new_task.save()
+
+        return new_task
+
+    def build_next_recurrence(self):
+        """
+        Return the next recurrence of a recurring task, without saving it.
+        """
+        return self.build_recurrence(self._assign_recurring_date())
+
+    def build_recurrence(self, date):
+        """
+        Return a recurrence of a recurring task on date, without saving it.
+        """
         new_task = Task()
         unchanged_fields = ['name', 'priority', 'completed_val',
                             'not_completed_cost', 'date_type',
-                            'is_timed', 'recurring', 'total_time', 'user',
+                            'is_timed', 'recurring', 'total_time', 'user_id',
                             'remaining_time', 'recurring_id', 'is_most_recent']
 
         for field in unchanged_fields:
             old_field_value = getattr(self, field)
             setattr(new_task, field, old_field_value)
 
-        new_task.date = self._assign_recurring_date()
-        new_task.save()
+        new_task.date = date
 
         return new_task
 
@@ -292,116 +1022,417 @@ class Task(models.Model):
 
         In the case of monthly recurring tasks, they happen on the same
         day of the week, of the same week of the month.
+        See tracktasks.recurrence.
         """
-        old_date = self.date
+        return recurrence.next_date(self.date, self.recurring)
+
+
+class RecurrenceRule(models.Model):
+    """
+    A recurring task stored once, as a rule,
+    instead of as a task for every recurrence.
+
+    Occurrences are expanded when they're read,
+    see TaskManager.rule_occurrences.
+    An occurrence is only saved as a Task
+    once it's completed, timed or edited on its own,
+    see views.modify_occurrence.
+    Saved occurrences share the rule's recurring_id
+    and override the virtual occurrence on their date.
+
+    Fields match the Task fields they're copied to.
+    anchor_date: the date of the first occurrence.
+    """
+    user = models.ForeignKey(User)
+    recurring_id = models.UUIDField('recurring id', default=uuid.uuid4,
+                                    unique=True)
+
+    name = models.CharField(max_length=200)
+    priority = models.DecimalField(default=0, max_digits=2, decimal_places=0)
+    completed_val = models.IntegerField('completed value', default=0)
+    not_completed_cost = models.IntegerField('not completed value', default=0)
+    date_type = models.CharField('date type', max_length=1,
+                                 choices=Task.DATE_TYPES, default='D')
+    is_timed = models.BooleanField(default=False)
+    total_time = models.DurationField('total time', null=True, blank=True)
+
+    anchor_date = models.DateField('anchor date')
+    recurring = models.CharField(max_length=1,
+                                 choices=Task.FREQUENCY[1:],
+                                 default='D')
+    is_disabled = models.BooleanField(default=False)
 
-        if self.recurring == 'D':
-            new_date = old_date + datetime.timedelta(days=1)
-        elif self.recurring == 'W':
-            new_date = old_date + datetime.timedelta(days=7)
-        elif self.recurring == 'B':
-            new_date = old_date + datetime.timedelta(days=14)
-        elif self.recurring == 'M':
+    # see Task.updated_at.
+    updated_at = models.DateTimeField('updated at', auto_now=True)
 
-            new_month, new_year = self._check_for_year_change(old_date)
+    class Meta:
+        index_together = [
+            ['user', 'updated_at'],
+        ]
 
-            recur_cal = calendar.Calendar(0)
-            oldcal = recur_cal.monthdatescalendar(old_date.year,
-                                                    old_date.month)
-            newcal = recur_cal.monthdatescalendar(new_year,
-                                                 new_month)
-            # get the original week and day numbers
-            for week in oldcal:
-                if old_date in week:
-                    week_num = oldcal.index(week)
-                    day_num = week.index(old_date)
+    def __str__(self):
+        return self.name
 
-            new_date = self._get_new_date(new_month, new_year, oldcal,
-                                          newcal, week_num, day_num)
+    # fields shared with the tasks of the rule's occurrences.
+    task_fields = ['name', 'priority', 'completed_val', 'not_completed_cost',
+                   'date_type', 'is_timed', 'total_time', 'recurring']
 
-        return new_date
+    @classmethod
+    def from_task(cls, task):
+        """
+        Return an unsaved rule recurring like the provided task,
+        anchored on its date.
+        The rule gets a new recurring_id.
+        """
+        rule = cls(anchor_date=task.date, user_id=task.user_id)
+        for field in cls.task_fields:
+            setattr(rule, field, getattr(task, field))
+        return rule
 
-    def _get_new_date(self, new_month, new_year, oldcal,
-                      newcal, week_num, day_num):
+    def build_occurrence(self, date):
         """
-        Return the next recurring date for monthly recurrence.
+        Return an unsaved task for the occurrence on date.
+        """
+        task = Task(user_id=self.user_id, date=date,
+                    recurring_id=self.recurring_id)
+        for field in self.task_fields:
+            setattr(task, field, getattr(self, field))
+        if task.is_timed:
+            task.remaining_time = task.total_time
+        task.rule = self
+        return task
 
-        Checks that the week isn't out of index.
-        Checks that the month is correct.
+    def materialize(self, date):
+        """
+        Return the saved occurrence on date, saving it if needed.
 
-        params:
-        new_month: the numeric value of the new task's month.
-        newcal: a monthdatescalendar object for the new month.
-        week_num: the original week number.
-        day_num: the original number for the day of the week.
+        The rule is locked while looking for the occurrence,
+        so two requests can't both save it.
         """
+        if date not in recurrence.dates_between(self.anchor_date,
+                                                self.recurring, date, date):
+            raise Task.DoesNotExist(
+                        "{} doesn't occur on {}.".format(self, date))
+
+        occurrence = self.build_occurrence(date)
+        defaults = {field.attname: getattr(occurrence, field.attname)
+                    for field in Task._meta.concrete_fields
+                    if not field.primary_key}
+        with transaction.atomic():
+            RecurrenceRule.objects.select_for_update().get(pk=self.pk)
+            task = Task.objects.filter(recurring_id=self.recurring_id,
+                                       date=date).order_by('pk').first()
+            if task is None:
+                task = Task.objects.create(**defaults)
+        task.rule = self
+        return task
+
+
+class TimerSession(models.Model):
+    """
+    A run of a task's timer, from its start to its stop.
+    Sessions are only ever added and then closed once.
+
+    duration: the time tracked, set when the session is stopped.
+    """
+    task = models.ForeignKey(Task, related_name='timer_sessions')
+    user = models.ForeignKey(User)
+    started = models.DateTimeField()
+    stopped = models.DateTimeField(null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True)
+
+    class Meta:
+        # stopping looks up the task's open session.
+        index_together = [['task', 'stopped']]
+
+
+class TaskAction(models.Model):
+    """
+    An action applied to a task from a batch,
+    kept so that replaying the batch doesn't apply it again.
+
+    client_timestamp: when the action was taken on the client.
+    """
+    ACTIONS = (('complete', 'complete'),
+               ('start_timer', 'start timer'),
+               ('stop_timer', 'stop timer'),
+              )
+    task = models.ForeignKey(Task, related_name='actions')
+    action = models.CharField(max_length=20, choices=ACTIONS)
+    client_timestamp = models.DateTimeField('client timestamp')
+    applied = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['task', 'action', 'client_timestamp']]
+
+
+class DailyTrackedTime(models.Model):
+    """
+    The time a user tracked on their tasks each day,
+    added to as timer sessions are stopped.
+    """
+    user = models.ForeignKey(User)
+    date = models.DateField()
+    tracked_time = models.DurationField('tracked time',
+                                        default=datetime.timedelta(0))
+
+    class Meta:
+        unique_together = [['user', 'date']]
+
+    @classmethod
+    def add_session(cls, user_id, started, stopped):
+        """
+        Add a session's time to the days it spans.
+        """
+        start = timezone.localtime(started)
+        stop = timezone.localtime(stopped)
+
+        while start < stop:
+            midnight = (start + datetime.timedelta(days=1)).replace(
+                            hour=0, minute=0, second=0, microsecond=0)
+            end = min(midnight, stop)
+            cls.add(user_id, start.date(), end - start)
+            start = end
+
+    @classmethod
+    def add(cls, user_id, date, duration):
+        """
+        Add a duration to a user's day,
+        with a conditional update rather than reading the total.
+        """
+        rollup = cls.objects.filter(user_id=user_id, date=date)
+        if rollup.update(tracked_time=DurationAdd('tracked_time', duration)):
+            return
 
         try:
-            new_date = newcal[week_num][day_num]
-        except IndexError:
-            # the error can happen
-            # when the number of weeks differs
-            # between the old and new month.
-            week_num -= 1
-            new_date = newcal[week_num][day_num]
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, date=date,
+                                   tracked_time=duration)
+        except IntegrityError:
+            # created by a concurrent stop.
+            rollup.update(tracked_time=DurationAdd('tracked_time', duration))
+
+
+class DailyScore(models.Model):
+    """
+    A user's score for a day.
+
+    earned: the completed value of the tasks completed that day.
+    completed: the number of tasks completed that day.
+    These are added to as tasks are completed.
+
+    lost: the not completed cost of the tasks left incomplete that day.
+    missed: the number of tasks left incomplete that day.
+    These are set once the day is over, see record_missed.
+    """
+    user = models.ForeignKey(User)
+    date = models.DateField()
+    earned = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    lost = models.IntegerField(default=0)
+    missed = models.IntegerField(default=0)
+
+    class Meta:
+        # also the index for reading a user's history.
+        unique_together = [['user', 'date']]
 
-        week_num = self._correct_week_num_offset(oldcal, newcal,
-                                                 day_num, week_num)
+    @property
+    def score(self):
+        return self.earned - self.lost
 
-        # Because the monthdatescalendar
-        # includes a week from the preceding and following month:
-        # ensure we're looking at the correct month.
-        if  new_date.month < new_month:
-            week_num += 1
+    @classmethod
+    def add(cls, user_id, date, **increments):
+        """
+        Add to the provided fields of a user's day,
+        with a conditional update rather than reading the totals.
+        """
+        score = cls.objects.filter(user_id=user_id, date=date)
+        changes = {field: F(field) + value
+                   for field, value in increments.items()}
+        if score.update(**changes):
+            return
 
-        if new_date.month > new_month:
-            week_num -= 1
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, date=date, **increments)
+        except IntegrityError:
+            # created by a concurrent completion.
+            score.update(**changes)
 
-        new_date = newcal[week_num][day_num]
-        return new_date
+    @classmethod
+    def missed_tasks(cls, date):
+        """
+        Return the tasks left incomplete on date,
+        grouped by user, with their count and total cost.
+        """
+        return Task.objects.filter(
+                        date=date,
+                        is_completed=False,
+                        is_disabled=False).exclude(user=None).values(
+                        'user_id').annotate(
+                        missed=models.Count('pk'),
+                        lost=models.Sum('not_completed_cost')).order_by()
 
-    def _correct_week_num_offset(self, oldcal, newcal, day_num, week_num):
+    @classmethod
+    def record_missed(cls, date):
         """
-        Return a week_num with an offset
-        based on the differences in weekday values
-        between two Calendar.monthdatescalendar objects.
+        Set every user's missed tasks and lost score for date.
+        Run once the day is over. Running it again sets the same values.
+        Return the number of users with missed tasks.
+        """
+        rows = list(cls.missed_tasks(date))
+        with transaction.atomic():
+            for row in rows:
+                updated = cls.objects.filter(user_id=row['user_id'],
+                                             date=date).update(
+                                                missed=row['missed'],
+                                                lost=row['lost'])
+                if not updated:
+                    cls.objects.create(user_id=row['user_id'], date=date,
+                                       missed=row['missed'],
+                                       lost=row['lost'])
+        return len(rows)
+
+
+class WeeklySeriesRollup(models.Model):
+    """
+    Totals for a user's tasks dated in a week,
+    for one recurring series,
+    or for all of their one-off tasks under Task.NULL_RECURRING.
+    Kept up to date by tracktasks.analytics.refresh.
+
+    week: the Monday the week starts on.
+    name: the name of the series' tasks.
+    tasks: the number of tasks.
+    completed: the number of them completed.
+    overdue: the number of them completed late or past their date.
+    tracked_time: the time tracked on them.
+    """
+    user = models.ForeignKey(User)
+    week = models.DateField()
+    recurring_id = models.UUIDField('recurring id')
+    name = models.CharField(max_length=200)
+    tasks = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    overdue = models.IntegerField(default=0)
+    tracked_time = models.DurationField('tracked time',
+                                        default=datetime.timedelta(0))
+
+    class Meta:
+        # also the index for reading a user's weeks.
+        unique_together = [['user', 'week', 'recurring_id']]
 
-        Explanation:
-        The monthdatescalendar includes
-        a week from the prior month.
 
-        In some cases a weekday
-        from the current month
-        can occur in that week.
+class StaleRollupWeek(models.Model):
+    """
+    A week whose rollups counted a task that has since
+    been moved out of it or deleted.
+    The task no longer says where it was,
+    so the week is recorded as it leaves,
+    and rebuilt and cleared by the next refresh.
+
+    user_id: not a foreign key,
+    since tasks are deleted along with their user.
+    week: the Monday the week starts on.
+    """
+    user_id = models.IntegerField('user id')
+    week = models.DateField()
 
-        When this happens in one and only one of the passed monthdatescalendars,
-        we need to create an offset to account for the difference.
+    @classmethod
+    def mark(cls, user_id, dates):
+        """
+        Record the weeks of the user's dates as stale.
         """
-        old_first_week_day = oldcal[0][day_num]
-        old_third_week_day = oldcal[2][day_num]
-        new_first_week_day = newcal[0][day_num]
-        new_third_week_day = newcal[2][day_num]
-        old_offset = (old_first_week_day.month == old_third_week_day.month)
-        new_offset = (new_first_week_day.month == new_third_week_day.month)
+        weeks = {date - datetime.timedelta(days=date.weekday())
+                 for date in dates if date is not None}
+        cls.objects.bulk_create(cls(user_id=user_id, week=week)
+                                for week in weeks)
 
-        if old_offset and not new_offset:
-            week_num += 1
 
-        elif new_offset and not old_offset:
-            week_num -= 1
+class AnalyticsWatermark(models.Model):
+    """
+    How far the analytics rollups have been brought up to date.
+
+    changed_since: tasks updated after this haven't been rolled up.
+    refreshed_on: the date of the last refresh,
+    after which tasks may have become overdue.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    changed_since = models.DateTimeField('changed since')
+    refreshed_on = models.DateField('refreshed on')
+
 
-        return week_num
+class DailyUpdatesRun(models.Model):
+    """
+    A run of the daily updates, split into shards of user ids.
+    Each shard stores its report as it finishes,
+    and the last one to finish sends the run's report,
+    so no result backend is needed to wait on them.
+
+    shards: the number of shards dispatched.
+    finished: the number of shards that have stored their reports.
+    reported: whether the run's report has been sent.
+    """
+    started = models.DateTimeField('started', auto_now_add=True)
+    shards = models.IntegerField()
+    finished = models.IntegerField(default=0)
+    reported = models.BooleanField(default=False)
 
-    def _check_for_year_change(self, old_date):
+    def finish_shard(self, report):
         """
-        Return the new month and year,
-        one month advanced from the old date.
+        Store a shard's report.
+        Return True if it was the last of the run's shards to finish,
+        and the run's report should be sent.
         """
-        if old_date.month == 12:
-            new_month = 1
-            new_year = old_date.year + 1
-        else:
-            new_month = old_date.month + 1
-            new_year = old_date.year
+        try:
+            with transaction.atomic():
+                DailyUpdatesShard.objects.create(
+                        run=self,
+                        first_user_id=report['first_user_id'],
+                        last_user_id=report['last_user_id'],
+                        scanned=report['scanned'],
+                        created=report['created'],
+                        seconds=report['seconds'],
+                        profile=report.get('profile', ''))
+                DailyUpdatesRun.objects.filter(pk=self.pk).update(
+                                            finished=F('finished') + 1)
+        except IntegrityError:
+            # the shard was run again, and already counted.
+            pass
+
+        # a conditional update, so only one shard sends the report.
+        return bool(DailyUpdatesRun.objects.filter(
+                            pk=self.pk, finished__gte=F('shards'),
+                            reported=False).update(reported=True))
+
+
+class DailyUpdatesShard(models.Model):
+    """
+    The report of one shard of a run of the daily updates.
+
+    scanned: the recurring tasks due to repeat.
+    created: the recurrences created.
+    profile: the path of the shard's profile, if it was profiled.
+    """
+    run = models.ForeignKey(DailyUpdatesRun, related_name='shard_reports')
+    first_user_id = models.IntegerField('first user id')
+    last_user_id = models.IntegerField('last user id')
+    scanned = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    seconds = models.FloatField(default=0)
+    profile = models.CharField(max_length=500, blank=True)
+
+    class Meta:
+        unique_together = [['run', 'first_user_id']]
 
-        return new_month, new_year
+    def as_report(self):
+        report = {
+            'first_user_id': self.first_user_id,
+            'last_user_id': self.last_user_id,
+            'scanned': self.scanned,
+            'created': self.created,
+            'seconds': self.seconds,
+        }
+        if self.profile:
+            report['profile'] = self.profile
+        return report
@@ -0,0 +1,59 @@
+"""
+Profiles requests and jobs with cProfile, on demand.
+
+A stored profile is written to TRACKTASKS_PROFILE_DIR twice:
+as a pstats dump, name.prof, to load into pstats or a viewer,
+and as a summary of the TOP functions by cumulative time, name.txt.
+"""
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import re
+
+from django.conf import settings
+
+# functions in a summary.
+TOP = 40
+
+
+def run(function, *args, **kwargs):
+    """
+    Call function under cProfile.
+    Return its result and the profile.
+    """
+    profile = cProfile.Profile()
+    result = profile.runcall(function, *args, **kwargs)
+    return result, profile
+
+
+def summary(profile, top=TOP):
+    """
+    Return the top functions of a profile by cumulative time, as text.
+    """
+    text = io.StringIO()
+    stats = pstats.Stats(profile, stream=text)
+    stats.sort_stats('cumulative').print_stats(top)
+    return text.getvalue()
+
+
+def store(profile, label):
+    """
+    Write a profile and its summary to the profile directory,
+    named for the time, the label and the process.
+    Return the path they were written to, without an extension.
+    """
+    directory = settings.TRACKTASKS_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    name = '{}-{}-{}'.format(
+                datetime.datetime.now().strftime('%Y%m%d-%H%M%S.%f'),
+                re.sub(r'[^\w-]+', '_', label).strip('_') or 'root',
+                os.getpid())
+    path = os.path.join(directory, name)
+
+    profile.dump_stats(path + '.prof')
+    with open(path + '.txt', 'w') as text:
+        text.write(summary(profile))
+    return path
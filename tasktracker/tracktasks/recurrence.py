@@ -0,0 +1,224 @@
+"""
+Calculates the dates of recurring tasks.
+
+Daily, weekly and biweekly tasks recur after a fixed number of days.
+
+Monthly tasks recur on the same day of the week,
+of the same week of the month.
+Weeks are the rows of a Monday-first calendar grid,
+like the ones from calendar.Calendar(0).monthdatescalendar.
+A grid is fully described by the weekday of the month's first day
+and the number of days in the month,
+so positions are calculated from those instead of building grids,
+and the mapping between positions is cached.
+"""
+import calendar
+import datetime
+import functools
+
+FREQUENCY_DAYS = {
+    'D': 1,
+    'W': 7,
+    'B': 14,
+}
+
+# monthly dates without a next recurrence run out within a few months.
+CHECKED_RECURRENCES = 12
+
+
+def next_date(date, frequency):
+    """
+    Return the date of the recurrence following date.
+    frequency: one of Task.FREQUENCY, other than 'N'.
+    """
+    if frequency in FREQUENCY_DAYS:
+        return date + datetime.timedelta(days=FREQUENCY_DAYS[frequency])
+    elif frequency == 'M':
+        return _next_monthly_date(date)
+
+    raise ValueError("{} is not a recurring frequency.".format(frequency))
+
+
+def next_dates(date, frequency, count):
+    """
+    Return a list of the next count recurrences following date.
+    """
+    dates = []
+    for _ in range(count):
+        date = next_date(date, frequency)
+        dates.append(date)
+    return dates
+
+
+def can_recur(date, frequency, count=CHECKED_RECURRENCES):
+    """
+    Return whether the next count recurrences following date exist.
+    Some monthly dates run into a week that a later month doesn't have.
+    """
+    try:
+        next_dates(date, frequency, count)
+    except IndexError:
+        return False
+    return True
+
+
+def next_occurrences(pairs, count):
+    """
+    Return a list with the next count recurrences
+    for each (date, frequency) pair.
+    """
+    return [next_dates(date, frequency, count) for date, frequency in pairs]
+
+
+def dates_through(date, frequency, end):
+    """
+    Return a list of the recurrences following date,
+    up to and including end.
+    """
+    dates = []
+    date = next_date(date, frequency)
+    while date <= end:
+        dates.append(date)
+        date = next_date(date, frequency)
+    return dates
+
+
+def dates_between(anchor, frequency, start, end):
+    """
+    Return a list of the dates a rule anchored on anchor occurs on,
+    from start through end.
+    The anchor is the first occurrence.
+    """
+    dates = []
+    for date in occurrences_from(anchor, frequency, start):
+        if date > end:
+            break
+        dates.append(date)
+    return dates
+
+
+def occurrences_from(anchor, frequency, start):
+    """
+    Generate the dates a rule anchored on anchor occurs on,
+    starting from start.
+    Stops at a monthly date without a next recurrence.
+    """
+    date = anchor
+    step = FREQUENCY_DAYS.get(frequency)
+
+    # fixed frequencies can skip straight to start.
+    if step and date < start:
+        steps = -(-(start - date).days // step)
+        date += datetime.timedelta(days=steps * step)
+
+    while True:
+        if date >= start:
+            yield date
+        try:
+            date = next_date(date, frequency)
+        except IndexError:
+            return
+
+
+@functools.lru_cache(maxsize=None)
+def _month_shape(year, month):
+    """
+    Return the weekday of the first day of the month
+    and the number of days in it.
+    """
+    return calendar.monthrange(year, month)
+
+
+def _next_month(year, month):
+    """
+    Return the year and month following the provided ones.
+    """
+    if month == 12:
+        return year + 1, 1
+    return year, month + 1
+
+
+def _next_monthly_date(date):
+    """
+    Return the next monthly recurrence of date.
+    """
+    new_year, new_month = _next_month(date.year, date.month)
+    old_first_weekday, old_days = _month_shape(date.year, date.month)
+    new_first_weekday, new_days = _month_shape(new_year, new_month)
+
+    day_num = date.weekday()
+    week_num = (date.day - 1 + old_first_weekday) // 7
+
+    # the month number only matters around the change of year.
+    month_kind = new_month if new_month in (1, 12) else None
+
+    week_num = _new_week_num(old_first_weekday, old_days,
+                             new_first_weekday, new_days,
+                             month_kind, week_num, day_num)
+
+    grid_start = (datetime.date(new_year, new_month, 1) -
+                  datetime.timedelta(days=new_first_weekday))
+    return grid_start + datetime.timedelta(days=7 * week_num + day_num)
+
+
+@functools.lru_cache(maxsize=None)
+def _new_week_num(old_first_weekday, old_days, new_first_weekday, new_days,
+                  month_kind, week_num, day_num):
+    """
+    Return the row of the new month's grid that a monthly recurrence
+    falls on, given the row and column of the previous date.
+
+    Rows are counted the way list indexes are,
+    so a row past the end of the grid raises an IndexError.
+
+    month_kind: the new month's number if it's 1 or 12, otherwise None.
+    """
+    new_rows = _grid_rows(new_first_weekday, new_days)
+
+    # the number of weeks can differ between the old and new month.
+    if not -new_rows <= week_num < new_rows:
+        week_num -= 1
+    first_guess = _grid_row(new_rows, week_num)
+
+    # a weekday from the current month can occur in the first row,
+    # which holds the end of the prior month.
+    old_offset = day_num >= old_first_weekday
+    new_offset = day_num >= new_first_weekday
+    if old_offset and not new_offset:
+        week_num += 1
+    elif new_offset and not old_offset:
+        week_num -= 1
+
+    # make sure the first guess is in the new month.
+    # around the change of year,
+    # December and January compare the other way around.
+    position = 7 * first_guess + day_num - new_first_weekday
+    if position < 0:
+        if month_kind == 1:
+            week_num -= 1
+        else:
+            week_num += 1
+    elif position >= new_days:
+        if month_kind == 12:
+            week_num += 1
+        else:
+            week_num -= 1
+
+    return _grid_row(new_rows, week_num)
+
+
+def _grid_rows(first_weekday, days):
+    """
+    Return the number of rows in a month's calendar grid.
+    """
+    return (first_weekday + days + 6) // 7
+
+
+def _grid_row(rows, week_num):
+    """
+    Return the row that week_num indexes in a grid with the number of rows,
+    like a list index.
+    """
+    if not -rows <= week_num < rows:
+        raise IndexError("week {} is out of range.".format(week_num))
+    return week_num % rows
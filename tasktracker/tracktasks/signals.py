@@ -1,9 +1,53 @@
-from django.utils import timezone
 import datetime
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from tracktasks.models import Task
+from tracktasks.models import Task, RecurrenceRule, StaleRollupWeek
+from tracktasks.cache import invalidate_user, set_catching_up
+from tracktasks import metrics
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=RecurrenceRule)
+@receiver(post_delete, sender=RecurrenceRule)
+def invalidate_cached_tasks(sender, instance, **kwargs):
+    """
+    When a task or recurrence rule is written,
+    invalidate its user's cached task lists.
+
+    Writes that skip save() (update, bulk_create)
+    need to call invalidate_user themselves.
+    """
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Task)
+def mark_week_moved_from(sender, instance, created, **kwargs):
+    """
+    When a task is saved with another date or user,
+    mark the week it was in stale for the analytics refresh.
+
+    Writes that skip save() and change dates (update)
+    need to mark the weeks themselves.
+    """
+    user_id, date = getattr(instance, 'loaded_week', (None, None))
+    if not created and user_id is not None and \
+            (user_id, date) != (instance.user_id, instance.date):
+        StaleRollupWeek.mark(user_id, [date])
+    instance.loaded_week = (instance.user_id, instance.date)
+
+
+@receiver(post_delete, sender=Task)
+def mark_week_deleted_from(sender, instance, **kwargs):
+    """
+    When a task is deleted,
+    mark its week stale for the analytics refresh.
+    """
+    if instance.user_id is not None:
+        StaleRollupWeek.mark(instance.user_id, [instance.date])
 
 
 @receiver(user_logged_in)
@@ -13,6 +57,9 @@ def update_recurring_tasks(sender, request, user, **kwargs):
     update recurring tasks
     from their last login
     through one beyond today.
+
+    With TRACKTASKS_DEFER_CATCH_UP,
+    the update runs as a celery task instead of holding up the login.
     """
 
     # only run if the user hasn't logged in for a week.
@@ -20,28 +67,12 @@ def update_recurring_tasks(sender, request, user, **kwargs):
     if user.profile.most_recent_login <\
     datetime.date.today() - datetime.timedelta(days=7):
 
-        # get all tasks from last login until today where the user is the
-        # current user and recurring is not none.
-        queryset_to_repeat = Task.objects.filter(date__lte=timezone.now(),
-                            date__gt=user.profile.most_recent_login,
-                            user=user).exclude(recurring="N")
-
-        # tasks get appended here because
-        # can't append to a queryset.
-        # Acts as a queue.
-        list_to_repeat = []
-
-        # go over the lists, creating new recurring tasks
-        # from last login through
-        # one recurrence beyond today
-        for task in queryset_to_repeat:
-
-            if task.date <= datetime.date.today():
-                next_task = task.add_next_recurring_date()
-                list_to_repeat.append(next_task)
-
-        for task in list_to_repeat:
-
-            if task.date <= datetime.date.today():
-                next_task = task.add_next_recurring_date()
-                list_to_repeat.append()
+        if getattr(settings, 'TRACKTASKS_DEFER_CATCH_UP', False):
+            # imported here because the celery app imports the models.
+            from tracktasks.tasks import catch_up
+            set_catching_up(user.pk)
+            catch_up.delay(user.pk)
+        else:
+            with metrics.catch_up_seconds.time(mode='login'):
+                created = Task.objects.catch_up_recurring_tasks(user)
+            metrics.catch_up_created.inc(created, mode='login')
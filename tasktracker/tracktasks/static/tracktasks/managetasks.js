@@ -0,0 +1,32 @@
+"use strict";
+
+// Loads the next page of tasks
+// when the load more button is clicked.
+
+
+function prepareLoadMore() {
+    var button = document.getElementById("more_tasks");
+    if (!button) {
+        return;
+    }
+
+    button.addEventListener('click', function() {
+        button.disabled = true;
+        $.getJSON(button.getAttribute("data-url"),
+                  {'cursor': button.getAttribute("data-cursor")},
+                  function(data) {
+            $("#user_tasks").append(data.html);
+
+            if (data.next_cursor) {
+                button.setAttribute("data-cursor", data.next_cursor);
+                button.disabled = false;
+            }
+            else {
+                button.parentNode.removeChild(button);
+            }
+        });
+    });
+}
+
+
+$( prepareLoadMore );
@@ -0,0 +1,84 @@
+"use strict";
+
+// Listens for changes to the user's tasks
+// made in other tabs or devices.
+
+// changes this soon after one of this page's own requests
+// are assumed to be from it.
+var OWN_CHANGE_MS = 3000;
+var lastOwnChange = 0;
+
+
+function listenForTaskEvents() {
+    if (!window.EventSource) {
+        return;
+    }
+    var script = document.getElementById("task_events_script");
+    var source = new EventSource(script.getAttribute("data-url"));
+
+    $(document).ajaxSend(function() {
+        lastOwnChange = Date.now();
+    });
+
+    source.addEventListener("timer", function(evt) {
+        updateTimer(JSON.parse(evt.data));
+    });
+
+    source.addEventListener("tasks", function(evt) {
+        if (Date.now() - lastOwnChange > OWN_CHANGE_MS) {
+            showTasksChanged();
+        }
+    });
+}
+
+/*
+Show a timer's remaining time and button
+as they were left by another tab.
+*/
+function updateTimer(state) {
+    var newid = String(state.id);
+    var counterobj = findCounter(newid);
+    if (!counterobj || state.remaining_time === null) {
+        return;
+    }
+
+    var button = document.getElementById("start" + newid) ||
+                 document.getElementById("stop" + newid);
+    var running = state.start_time !== null;
+    if (button && button.id.includes("stop") !== running) {
+        changeButton(button, newid);
+    }
+
+    if (!running) {
+        var timeObj = CountDownTimer.parse(Math.max(state.remaining_time, 0));
+        var display = counterobj.counter;
+        if (typeof timeObj.hours != "undefined") {
+            display.textContent = timeObj.hours + 'h:' + timeObj.minutes +
+                                  'm:' + timeObj.seconds + "s";
+        }
+        else if (typeof timeObj.minutes != "undefined") {
+            display.textContent = timeObj.minutes + 'm:' +
+                                  timeObj.seconds + "s";
+        }
+        else {
+            display.textContent = timeObj.seconds + "s";
+        }
+    }
+}
+
+/*
+Let the user know their tasks changed elsewhere.
+*/
+function showTasksChanged() {
+    if (document.getElementById("tasks_changed")) {
+        return;
+    }
+    var notice = document.createElement("p");
+    notice.id = "tasks_changed";
+    notice.innerHTML = "Your tasks have changed. Refresh to see them.";
+    var content = document.getElementById("daily_div") || document.body;
+    content.parentNode.insertBefore(notice, content);
+}
+
+
+$( listenForTaskEvents );
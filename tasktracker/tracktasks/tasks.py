@@ -1,10 +1,173 @@
-from tracktasks.models import Task
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Min, Max
+from tracktasks.models import Task, DailyScore, DailyUpdatesRun
+from tracktasks.cache import clear_catching_up
+from tracktasks import analytics, metrics, profiling
 from django_celery_beat.models import PeriodicTask, CrontabSchedule
 from tasktracker.celery import app
 from celery.schedules import crontab
 
+import logging
+
+logger = logging.getLogger('tracktasks.logger')
+
+
+@app.task
+def daily_updates(profile=False):
+    """
+    Split the daily updates into shards of user ids
+    and run them in parallel,
+    with daily_updates_report summing up the shards.
+
+    The shards are tracked by a DailyUpdatesRun
+    rather than a chord, which would need a result backend.
+    The last shard to finish sends the report.
+
+    With profile, each shard is profiled
+    and stored in TRACKTASKS_PROFILE_DIR, for a single run like:
+    celery -A tasktracker call tracktasks.tasks.daily_updates \\
+        --kwargs '{"profile": true}'
+
+    Return the number of shards dispatched.
+    """
+    shards = get_user_shards(
+                settings.TRACKTASKS_DAILY_UPDATES_SHARD_SIZE,
+                settings.TRACKTASKS_DAILY_UPDATES_CONCURRENCY)
+
+    run = DailyUpdatesRun.objects.create(shards=len(shards),
+                                         reported=not shards)
+    if not shards:
+        daily_updates_report.delay(run.pk)
+
+    for first_user_id, last_user_id in shards:
+        daily_updates_shard.delay(first_user_id, last_user_id, profile,
+                                  run_id=run.pk)
+
+    return len(shards)
+
+
+def get_user_shards(shard_size, concurrency):
+    """
+    Return a list of (first, last) user id ranges covering all users,
+    each shard_size ids long,
+    or longer if it takes more than concurrency shards.
+    """
+    ids = User.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if ids['first'] is None:
+        return []
+
+    span = ids['last'] - ids['first'] + 1
+    shard_size = max(shard_size, -(-span // concurrency))
+
+    return [(first, min(first + shard_size - 1, ids['last']))
+            for first in range(ids['first'], ids['last'] + 1, shard_size)]
+
+
+@app.task
+def daily_updates_shard(first_user_id, last_user_id, profile=False,
+                        run_id=None):
+    """
+    Run the daily updates for users with ids
+    from first_user_id through last_user_id.
+    With profile, the path of the stored profile is in the report.
+
+    With run_id, the report is stored with the run,
+    and sent on by the last of the run's shards.
+    """
+    user_range = (first_user_id, last_user_id)
+    start = time.monotonic()
+    if profile:
+        report, stats = profiling.run(
+                            Task.objects.create_daily_recurring_tasks,
+                            user_range=user_range)
+        report['profile'] = profiling.store(
+                                stats, 'daily_updates-{}-{}'.format(
+                                                        *user_range))
+    else:
+        report = Task.objects.create_daily_recurring_tasks(
+                                                    user_range=user_range)
+    report['first_user_id'] = first_user_id
+    report['last_user_id'] = last_user_id
+    report['seconds'] = time.monotonic() - start
+
+    metrics.daily_updates_seconds.observe(report['seconds'])
+    metrics.daily_updates_scanned.inc(report['scanned'])
+    metrics.daily_updates_created.inc(report['created'])
+
+    if run_id is not None:
+        run = DailyUpdatesRun.objects.get(pk=run_id)
+        if run.finish_shard(report):
+            daily_updates_report.delay(run_id)
+    return report
+
+
+@app.task
+def daily_updates_report(run_id):
+    """
+    Sum up the reports of a run's shards.
+    """
+    shard_reports = [shard.as_report() for shard in
+                     DailyUpdatesRun.objects.get(
+                        pk=run_id).shard_reports.order_by('first_user_id')]
+    report = {
+        'shards': len(shard_reports),
+        'scanned': sum(shard['scanned'] for shard in shard_reports),
+        'created': sum(shard['created'] for shard in shard_reports),
+        'slowest_seconds': max([shard['seconds'] for shard in shard_reports],
+                               default=0),
+        'shard_reports': shard_reports,
+    }
+    logger.info("daily updates: scanned %(scanned)s tasks, "
+                "created %(created)s recurrences in %(shards)s shards, "
+                "slowest took %(slowest_seconds).2fs", report)
+    for shard in shard_reports:
+        if 'profile' in shard:
+            logger.info("daily updates: profiled users %s through %s "
+                        "in %s", shard['first_user_id'],
+                        shard['last_user_id'], shard['profile'])
+    return report
 
 
 @app.task
-def daily_updates():
-    Task.objects.create_daily_recurring_tasks()
+def score_missed_tasks():
+    """
+    Score the tasks left incomplete yesterday.
+    """
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    users = DailyScore.record_missed(yesterday)
+    logger.info("scored missed tasks on %s for %s users", yesterday, users)
+    return users
+
+
+@app.task
+def refresh_analytics(full=False):
+    """
+    Roll up the tasks changed since the last refresh.
+    """
+    weeks = analytics.refresh(full)
+    logger.info("refreshed analytics for %s weeks", weeks)
+    return weeks
+
+
+@app.task
+def catch_up(user_id):
+    """
+    Create the missed recurrences for a user who logged in
+    after a week or more away.
+    """
+    try:
+        with metrics.catch_up_seconds.time(mode='deferred'):
+            created = Task.objects.catch_up_recurring_tasks(
+                                            User.objects.get(pk=user_id))
+    finally:
+        clear_catching_up(user_id)
+
+    metrics.catch_up_created.inc(created, mode='deferred')
+
+    logger.info("catch up: created %s recurrences for user %s",
+                created, user_id)
+    return created
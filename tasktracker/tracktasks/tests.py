@@ -1,14 +1,48 @@
+import calendar
 import datetime
+import io
+import json
+import os
+import queue
+import re
+import tempfile
 import uuid
-from django.test import TestCase, RequestFactory
-from .models import Task
+from unittest import mock
+from django.test import (TestCase, TransactionTestCase, RequestFactory,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from .models import (Task, RecurrenceRule, TimerSession,
+                     DailyTrackedTime, DailyScore, WeeklySeriesRollup,
+                     AnalyticsWatermark, DailyUpdatesRun, StaleRollupWeek)
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.template.loader import render_to_string
+from django.http import HttpResponse
+from django.db import models, connection, transaction
+from unittest import skipUnless
+from django.conf import settings
+from django.core.cache import cache, caches, CacheHandler
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 from .views import IndexView
+from .cache import (cached_for_user, counters, get_user_version,
+                    invalidate_user, set_catching_up, is_catching_up,
+                    clear_catching_up)
+from . import (analytics, events, ical, metrics, middleware, transfer)
+from . import recurrence as recurrence_engine
+from .benchmarks import generator
+from .tasks import (catch_up, daily_updates, daily_updates_report,
+                    daily_updates_shard, get_user_shards)
+from tasktracker.celery import app
 from userprofiles.models import Profile
 
+# for counting the app's own queries,
+# without the lookups of the database cache in settings.
+LOCAL_CACHES = dict(settings.CACHES, default={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+})
 
 # Create your tests here.
 
@@ -329,6 +363,48 @@ class TaskManagerTestCases(TestCase):
         self.assertQuerysetEqual(recurring_qs_multi, recurring_tasks,
                                 ordered=False)
 
+    def test_unique_recurring_latest_completed(self):
+        """
+        Test that a group with no incomplete instances
+        falls back on its latest completed instance.
+        """
+        recurring_task = Task.objects.get(pk=1)
+        next_task = recurring_task.add_next_recurring_date()
+        Task.objects.filter(recurring_id=recurring_task.recurring_id).update(
+                                    is_completed=True,
+                                    completed_date=timezone.now())
+
+        recurring_qs = Task.objects.unique_recurring(self.user)
+        self.assertIn(next_task, recurring_qs)
+        self.assertNotIn(recurring_task, recurring_qs)
+
+        recurring_qs_multi = Task.objects.unique_recurring(self.user,
+                                                           multiple=True)
+        self.assertIn(next_task, recurring_qs_multi)
+        self.assertNotIn(recurring_task, recurring_qs_multi)
+
+    def test_unique_recurring_query_count(self):
+        """
+        Ensure that the number of queries
+        doesn't grow with the number of recurring groups.
+        """
+        for task in Task.objects.unique_recurring(self.user):
+            task.add_next_recurring_date()
+
+        today = timezone.now()
+        with self.assertNumQueries(1):
+            list(Task.objects.unique_recurring(self.user))
+        with self.assertNumQueries(1):
+            list(Task.objects.unique_recurring(self.user, multiple=True))
+        with self.assertNumQueries(1):
+            list(Task.objects.active_tasks(self.user))
+        with self.assertNumQueries(1):
+            list(Task.objects.scheduled_for(self.user, today))
+        with self.assertNumQueries(1):
+            list(Task.objects.still_due_on(self.user, today))
+        with self.assertNumQueries(1):
+            list(Task.objects.overdue_on(self.user, today))
+
     def test_non_recurring(self):
         """
         Ensure that this gets all of the non-recurring, incomplete tasks.
@@ -428,6 +504,36 @@ class TaskManagerTestCases(TestCase):
 
 
 
+    def test_dashboard(self):
+        """
+        Ensure that dashboard returns the same lists
+        as the separate methods, using a single query for the tasks
+        and one for the (absent) recurrence rules.
+        """
+        today = datetime.date.today()
+
+        for task in Task.objects.unique_recurring(self.user):
+            task.add_next_recurring_date()
+        completed = Task.objects.filter(pk__in=[1, 5, 13])
+        for task in completed:
+            task.complete()
+            task.save()
+
+        with self.assertNumQueries(2):
+            dashboard = Task.objects.dashboard(self.user, today)
+
+        expected = {
+            'scheduled_for': Task.objects.scheduled_for(self.user, today),
+            'still_due_on': Task.objects.still_due_on(self.user, today),
+            'completed_on': Task.objects.completed_on(self.user, today),
+            'overdue_on': Task.objects.overdue_on(self.user, today),
+        }
+        for name, queryset in expected.items():
+            self.assertCountEqual(dashboard[name], queryset)
+
+        overdue_dates = [task.date for task in dashboard['overdue_on']]
+        self.assertEqual(overdue_dates, sorted(overdue_dates, reverse=True))
+
     def test_create_daily_recurring_tasks(self):
         """
         Ensure that for every recurring task, the most recent recurring instance
@@ -466,6 +572,54 @@ class TaskManagerTestCases(TestCase):
             if len(task_group) == 1:
                 self.assertEqual(task_group[0].pk, task.pk)
 
+    def test_create_daily_recurring_tasks_report(self):
+        """
+        Ensure that the sources are counted, their next recurrences created
+        and that the sources are no longer marked as most recent.
+        """
+        report = Task.objects.create_daily_recurring_tasks(chunk_size=1)
+        self.assertEqual(report, {'scanned': 2, 'created': 2})
+
+        for source in Task.objects.filter(pk__in=[3, 15]):
+            self.assertFalse(source.is_most_recent)
+            next_task = Task.objects.get(recurring_id=source.recurring_id,
+                                         is_most_recent=True)
+            self.assertEqual(next_task.date,
+                             source.date + datetime.timedelta(days=1))
+
+        # nothing left to repeat.
+        report = Task.objects.create_daily_recurring_tasks()
+        self.assertEqual(report, {'scanned': 0, 'created': 0})
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_create_daily_recurring_tasks_query_count(self):
+        """
+        Ensure that a chunk costs the same number of queries
+        however many tasks it holds.
+        """
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        for i in range(10):
+            Task.objects.create(name="extra recurring {}".format(i),
+                                recurring="W",
+                                recurring_id=uuid.uuid4(),
+                                user=self.user2,
+                                date=tomorrow,
+                                is_most_recent=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            report = Task.objects.create_daily_recurring_tasks()
+        self.assertEqual(report['created'], 12)
+
+        Task.objects.filter(date__gt=tomorrow).delete()
+        Task.objects.filter(date=tomorrow).update(is_most_recent=True)
+        with CaptureQueriesContext(connection) as chunked_queries:
+            Task.objects.create_daily_recurring_tasks(chunk_size=6)
+
+        # the first run was one full chunk and one empty chunk,
+        # which takes three queries: savepoint, select and release.
+        chunk_queries = len(queries) - 3
+        self.assertEqual(len(chunked_queries), len(queries) + chunk_queries)
+
     def test_get_task_group_incompletes(self):
         """
         Test that for a given shared_id, it returns all recurrences
@@ -505,6 +659,222 @@ class TaskManagerTestCases(TestCase):
 
 
 
+def legacy_next_monthly_date(old_date):
+    """
+    The monthly recurrence algorithm from before tracktasks.recurrence,
+    kept as a reference.
+    """
+    if old_date.month == 12:
+        new_month, new_year = 1, old_date.year + 1
+    else:
+        new_month, new_year = old_date.month + 1, old_date.year
+
+    recur_cal = calendar.Calendar(0)
+    oldcal = recur_cal.monthdatescalendar(old_date.year, old_date.month)
+    newcal = recur_cal.monthdatescalendar(new_year, new_month)
+    for week in oldcal:
+        if old_date in week:
+            week_num = oldcal.index(week)
+            day_num = week.index(old_date)
+
+    try:
+        new_date = newcal[week_num][day_num]
+    except IndexError:
+        week_num -= 1
+        new_date = newcal[week_num][day_num]
+
+    old_offset = oldcal[0][day_num].month == oldcal[2][day_num].month
+    new_offset = newcal[0][day_num].month == newcal[2][day_num].month
+    if old_offset and not new_offset:
+        week_num += 1
+    elif new_offset and not old_offset:
+        week_num -= 1
+
+    if new_date.month < new_month:
+        week_num += 1
+    if new_date.month > new_month:
+        week_num -= 1
+
+    return newcal[week_num][day_num]
+
+
+class RecurrenceTestCases(TestCase):
+
+    def test_fixed_frequencies(self):
+        date = datetime.date(2017, 1, 16)
+        self.assertEqual(recurrence_engine.next_date(date, 'D'),
+                         datetime.date(2017, 1, 17))
+        self.assertEqual(recurrence_engine.next_date(date, 'W'),
+                         datetime.date(2017, 1, 23))
+        self.assertEqual(recurrence_engine.next_date(date, 'B'),
+                         datetime.date(2017, 1, 30))
+        with self.assertRaises(ValueError):
+            recurrence_engine.next_date(date, 'N')
+
+    def test_monthly_matches_legacy(self):
+        """
+        Compare every date from 1970 through 2069
+        against the calendar based algorithm.
+        Dates where it raised an IndexError have to raise one too.
+        """
+        date = datetime.date(1970, 1, 1)
+        while date.year < 2070:
+            try:
+                expected = legacy_next_monthly_date(date)
+            except IndexError:
+                with self.assertRaises(IndexError, msg=str(date)):
+                    recurrence_engine.next_date(date, 'M')
+            else:
+                self.assertEqual(recurrence_engine.next_date(date, 'M'),
+                                 expected, msg=str(date))
+            date += datetime.timedelta(days=1)
+
+    def test_next_occurrences(self):
+        """
+        Test the next recurrences for several dates and frequencies at once.
+        """
+        pairs = [(datetime.date(2017, 1, 16), 'W'),
+                 (datetime.date(2016, 12, 10), 'M')]
+        self.assertEqual(recurrence_engine.next_occurrences(pairs, 2),
+                         [[datetime.date(2017, 1, 23),
+                           datetime.date(2017, 1, 30)],
+                          [datetime.date(2017, 1, 14),
+                           datetime.date(2017, 2, 11)]])
+
+    def test_dates_through(self):
+        self.assertEqual(recurrence_engine.dates_through(
+                                                datetime.date(2017, 1, 1),
+                                                'D',
+                                                datetime.date(2017, 1, 3)),
+                         [datetime.date(2017, 1, 2),
+                          datetime.date(2017, 1, 3)])
+
+    def test_dates_between(self):
+        """
+        Test that rule occurrences include the anchor
+        and skip ahead to the start.
+        """
+        anchor = datetime.date(2017, 1, 1)
+        self.assertEqual(recurrence_engine.dates_between(
+                                                anchor, 'W', anchor,
+                                                datetime.date(2017, 1, 8)),
+                         [anchor, datetime.date(2017, 1, 8)])
+        self.assertEqual(recurrence_engine.dates_between(
+                                                anchor, 'B',
+                                                datetime.date(2017, 3, 1),
+                                                datetime.date(2017, 3, 31)),
+                         [datetime.date(2017, 3, 12),
+                          datetime.date(2017, 3, 26)])
+        self.assertEqual(recurrence_engine.dates_between(
+                                                datetime.date(2016, 12, 10),
+                                                'M',
+                                                datetime.date(2017, 1, 1),
+                                                datetime.date(2017, 2, 28)),
+                         [datetime.date(2017, 1, 14),
+                          datetime.date(2017, 2, 11)])
+
+
+@skipUnless(connection.vendor == 'sqlite', "query plans are SQLite specific")
+class TaskIndexTestCases(TestCase):
+    """
+    Check the query plans of the TaskManager methods,
+    so that a dropped index shows up as a failing test.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.today = datetime.date.today()
+
+        self.user_index = self._index_name(
+                            ['user_id', 'is_disabled', 'recurring', 'date'])
+        self.recurring_index = self._index_name(
+                            ['recurring_id', 'is_completed', 'date'])
+        self.completed_index = self._index_name(
+                            ['user_id', 'completed_date'])
+        self.most_recent_index = self._index_name(
+                            ['is_most_recent', 'date'])
+
+    def _index_name(self, columns, model=Task):
+        """
+        Return the name of the index on the provided columns.
+        """
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                                            cursor, model._meta.db_table)
+        for name, constraint in constraints.items():
+            if constraint['index'] and constraint['columns'] == columns:
+                return name
+        self.fail("No index on {}".format(", ".join(columns)))
+
+    def _query_plan(self, queryset):
+        """
+        Return the EXPLAIN QUERY PLAN output for a queryset as one string.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return "\n".join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndexes(self, queryset, *indexes):
+        plan = self._query_plan(queryset)
+        for index in indexes:
+            self.assertIn(index, plan)
+
+    def test_unique_recurring_plan(self):
+        self.assertUsesIndexes(Task.objects.unique_recurring(self.user),
+                               self.user_index, self.recurring_index)
+        self.assertUsesIndexes(Task.objects.unique_recurring(self.user,
+                                                             multiple=True),
+                               self.user_index, self.recurring_index)
+
+    def test_unique_recurring_reads_users_rules(self):
+        """
+        Test that only the user's rules are read to leave out their series.
+        """
+        self.assertUsesIndexes(Task.objects.unique_recurring(self.user),
+                               self._index_name(['user_id'], RecurrenceRule))
+
+    def test_non_recurring_plan(self):
+        self.assertUsesIndexes(Task.objects.non_recurring(self.user),
+                               self.user_index)
+
+    def test_active_tasks_plan(self):
+        self.assertUsesIndexes(Task.objects.active_tasks(self.user),
+                               self.user_index, self.recurring_index)
+
+    def test_scheduled_for_plan(self):
+        self.assertUsesIndexes(Task.objects.scheduled_for(self.user,
+                                                          self.today),
+                               self.user_index, self.recurring_index)
+
+    def test_completed_on_plan(self):
+        self.assertUsesIndexes(Task.objects.completed_on(self.user,
+                                                         self.today),
+                               self.completed_index)
+
+    def test_still_due_on_plan(self):
+        self.assertUsesIndexes(Task.objects.still_due_on(self.user,
+                                                         self.today),
+                               self.user_index, self.recurring_index)
+
+    def test_overdue_on_plan(self):
+        self.assertUsesIndexes(Task.objects.overdue_on(self.user,
+                                                       self.today),
+                               self.user_index, self.recurring_index)
+
+    def test_due_to_recur_plan(self):
+        """
+        Test the daily updates' query, see create_daily_recurring_tasks.
+        """
+        self.assertUsesIndexes(Task.objects.due_to_recur(self.today),
+                               self.most_recent_index)
+
+    def test_get_task_group_incompletes_plan(self):
+        recurrences = Task.objects.get_task_group_incompletes(uuid.uuid4())
+        self.assertUsesIndexes(recurrences, self.recurring_index)
+
+
 
 # for the TaskManager methods, build data to check different cases.
 # should include three of every category that could get pulled.
@@ -519,3 +889,2135 @@ class TaskManagerTestCases(TestCase):
     #     request.user = self.user
     #     response = IndexView.as_view()(request)
     #     self.assertEqual(response.status_code, 200)
+
+
+class IndexViewTestCases(TestCase):
+
+    def setUp(self):
+        one_day = datetime.timedelta(days=1)
+        today = datetime.date.today()
+
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        # log in with a fresh instance so that the profile comes from the db.
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+        for date in (today - one_day, today, today + one_day):
+            Task.objects.create(name="recurring {}".format(date),
+                                recurring="D",
+                                recurring_id=uuid.uuid4(),
+                                user=self.user,
+                                date_type="D",
+                                date=date,
+                                is_most_recent=True)
+            Task.objects.create(name="timed {}".format(date),
+                                user=self.user,
+                                date_type="S",
+                                date=date,
+                                is_timed=True,
+                                total_time=datetime.timedelta(minutes=5),
+                                remaining_time=datetime.timedelta(minutes=5))
+
+        completed = Task.objects.create(name="completed today",
+                                        user=self.user,
+                                        date_type="S",
+                                        date=today)
+        completed.complete()
+        completed.save()
+
+    def _strip_csrf(self, content):
+        """
+        Remove csrf tokens, which are different for every render.
+        """
+        return re.sub(r"name='csrfmiddlewaretoken' value='[^']*'", "",
+                      content.decode())
+
+    def test_index_matches_separate_queries(self):
+        """
+        Ensure that the rendered index is the same
+        as when each list was queried separately.
+        """
+        today = datetime.date.today()
+        response = self.client.get(reverse('tracktasks:index'))
+        self.assertEqual(response.status_code, 200)
+
+        context = {
+            'daily_tasks_list': Task.objects.scheduled_for(self.user, today),
+            'still_due_tasks_list': Task.objects.still_due_on(self.user,
+                                                              today),
+            'completed_tasks_list': Task.objects.completed_on(self.user,
+                                                              today),
+            'overdue_tasks_list': Task.objects.overdue_on(self.user, today),
+        }
+        expected = render_to_string('tracktasks/index.html', context,
+                                    request=response.wsgi_request)
+
+        self.assertEqual(self._strip_csrf(response.content),
+                         self._strip_csrf(expected.encode()))
+
+
+class TaskCacheTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        counters.clear()
+        self.today = datetime.date.today()
+
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+        self.task = Task.objects.create(name="untimed today",
+                                        user=self.user,
+                                        date_type="S",
+                                        date=self.today)
+        self.recurring_task = Task.objects.create(name="recurring today",
+                                                  recurring="D",
+                                                  recurring_id=uuid.uuid4(),
+                                                  user=self.user,
+                                                  date_type="S",
+                                                  date=self.today,
+                                                  is_most_recent=True)
+
+    def _daily_names(self):
+        response = self.client.get(reverse('tracktasks:index'))
+        return [task.name for task in response.context['daily_tasks_list']]
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_cached_for_user_hits_and_misses(self):
+        """
+        Test that the first lookup is a miss and the second a hit.
+        """
+        compute = lambda: Task.objects.dashboard(self.user, self.today)
+        cached_for_user('dashboard', self.user, self.today, compute)
+        with self.assertNumQueries(0):
+            cached_for_user('dashboard', self.user, self.today, compute)
+        self.assertEqual(counters['misses'], 1)
+        self.assertEqual(counters['hits'], 1)
+
+    def test_save_invalidates(self):
+        """
+        Test that saving a task bumps its user's version.
+        """
+        version = get_user_version(self.user.pk)
+        self.task.save()
+        self.assertGreater(get_user_version(self.user.pk), version)
+
+    def test_other_process_invalidates(self):
+        """
+        Test that a write in another process, like a celery worker,
+        reaches this process's cached lists and catching-up flag.
+        A local memory cache would share its entries within
+        this process but not across processes, so it isn't allowed.
+        """
+        self.assertNotIsInstance(caches['default'], LocMemCache)
+        set_catching_up(self.user.pk)
+        self.assertIn("untimed today", self._daily_names())
+
+        other_process = CacheHandler()['default']
+        with mock.patch('tracktasks.cache.cache', other_process):
+            Task.objects.filter(pk=self.task.pk).update(name="renamed")
+            invalidate_user(self.user.pk)
+            clear_catching_up(self.user.pk)
+
+        self.assertFalse(is_catching_up(self.user.pk))
+        self.assertIn("renamed", self._daily_names())
+
+    def test_mark_task_complete_invalidates(self):
+        self.assertIn("untimed today", self._daily_names())
+        self.client.post(reverse('tracktasks:mark complete'),
+                         {'selected_task': self.task.pk, 'name': 'completed'},
+                         HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotIn("untimed today", self._daily_names())
+
+    def test_create_task_invalidates(self):
+        self.assertNotIn("new task", self._daily_names())
+        self.client.post(reverse('tracktasks:create task'),
+                         {'name': "new task",
+                          'date_type': "S",
+                          'date_year': self.today.year,
+                          'date_month': self.today.month,
+                          'date_day': self.today.day,
+                          'recurring': "N"})
+        self.assertIn("new task", self._daily_names())
+
+    def test_modify_task_invalidates(self):
+        self.assertIn("recurring today", self._daily_names())
+        self.client.post(reverse('tracktasks:modify task',
+                                 kwargs={'pk': self.recurring_task.pk}),
+                         {'name': "recurring today",
+                          'date_type': "S",
+                          'date_year': self.today.year,
+                          'date_month': self.today.month,
+                          'date_day': self.today.day,
+                          'recurring': "D",
+                          'is_disabled': True})
+        self.assertNotIn("recurring today", self._daily_names())
+
+    def test_recurrence_generation_invalidates(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        compute = lambda: Task.objects.dashboard(self.user, tomorrow)
+
+        dashboard = cached_for_user('dashboard', self.user, tomorrow, compute)
+        self.assertEqual(dashboard['scheduled_for'], [])
+
+        next_task = self.recurring_task.add_next_recurring_date()
+        dashboard = cached_for_user('dashboard', self.user, tomorrow, compute)
+        self.assertEqual(dashboard['scheduled_for'], [next_task])
+
+
+class CatchUpTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.user.profile.most_recent_login = (self.today -
+                                               datetime.timedelta(days=30))
+        self.user.profile.save()
+
+        self.daily = Task.objects.create(name="daily",
+                                         recurring="D",
+                                         recurring_id=uuid.uuid4(),
+                                         user=self.user,
+                                         date=(self.today -
+                                               datetime.timedelta(days=30)),
+                                         is_most_recent=True)
+        self.weekly = Task.objects.create(name="weekly",
+                                          recurring="W",
+                                          recurring_id=uuid.uuid4(),
+                                          user=self.user,
+                                          date=(self.today -
+                                                datetime.timedelta(days=20)),
+                                          is_most_recent=True)
+
+    def _login(self):
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def test_login_creates_missed_recurrences(self):
+        """
+        Test that every missed recurrence is created,
+        through one recurrence beyond today.
+        """
+        self._login()
+
+        daily = Task.objects.filter(recurring_id=self.daily.recurring_id)
+        self.assertEqual(daily.count(), 32)
+        self.assertEqual(daily.last().date,
+                         self.today + datetime.timedelta(days=1))
+
+        weekly = Task.objects.filter(recurring_id=self.weekly.recurring_id)
+        self.assertEqual(weekly.count(), 4)
+        self.assertEqual(weekly.last().date,
+                         self.today + datetime.timedelta(days=1))
+
+        for group in (daily, weekly):
+            most_recent = group.get(is_most_recent=True)
+            self.assertEqual(most_recent, group.last())
+
+        # logging in again doesn't repeat anything.
+        self._login()
+        self.assertEqual(daily.count(), 32)
+
+    @override_settings(TRACKTASKS_DEFER_CATCH_UP=True)
+    def test_deferred_catch_up(self):
+        """
+        Test that the catch up runs as a celery task
+        and that the index shows it's catching up in the meantime.
+        """
+        with mock.patch('tracktasks.tasks.catch_up.delay') as delay:
+            self._login()
+        delay.assert_called_once_with(self.user.pk)
+        self.assertEqual(Task.objects.count(), 2)
+
+        response = self.client.get(reverse('tracktasks:index'))
+        self.assertContains(response, 'id="catching_up"')
+
+        catch_up(self.user.pk)
+        self.assertEqual(Task.objects.count(), 36)
+        response = self.client.get(reverse('tracktasks:index'))
+        self.assertNotContains(response, 'id="catching_up"')
+
+    def test_create_task_marks_next_recurrence(self):
+        """
+        Test that the daily updates will repeat a newly created task.
+        """
+        self._login()
+        self.client.post(reverse('tracktasks:create task'),
+                         {'name': "new recurring",
+                          'date_type': "S",
+                          'date_year': self.today.year,
+                          'date_month': self.today.month,
+                          'date_day': self.today.day,
+                          'recurring': "D"})
+
+        new_tasks = Task.objects.filter(name="new recurring")
+        self.assertEqual(new_tasks.count(), 2)
+        self.assertEqual(new_tasks.get(is_most_recent=True).date,
+                         self.today + datetime.timedelta(days=1))
+
+
+class DailyUpdatesTestCases(TestCase):
+
+    def setUp(self):
+        self.tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        self.users = [User.objects.create(username="user{}".format(i),
+                                          password="secure")
+                      for i in range(5)]
+        for user in self.users:
+            Task.objects.create(name="daily",
+                                recurring="D",
+                                recurring_id=uuid.uuid4(),
+                                user=user,
+                                date=self.tomorrow,
+                                is_most_recent=True)
+
+    def test_get_user_shards(self):
+        first = self.users[0].pk
+        self.assertEqual(get_user_shards(2, 8),
+                         [(first, first + 1), (first + 2, first + 3),
+                          (first + 4, first + 4)])
+
+        # shards grow to stay within the concurrency.
+        self.assertEqual(get_user_shards(1, 2),
+                         [(first, first + 2), (first + 3, first + 4)])
+
+    @override_settings(TRACKTASKS_DAILY_UPDATES_SHARD_SIZE=2,
+                       TRACKTASKS_DAILY_UPDATES_CONCURRENCY=8)
+    def test_daily_updates_shards(self):
+        """
+        Test that every shard runs and that their reports are summed up.
+        """
+        # run the chord in process.
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+        with self.assertLogs('tracktasks.logger') as logs:
+            self.assertEqual(daily_updates(), 3)
+
+        self.assertIn("created 5 recurrences in 3 shards", logs.output[0])
+        self.assertEqual(Task.objects.filter(date=self.tomorrow +
+                                             datetime.timedelta(days=1),
+                                             is_most_recent=True).count(), 5)
+
+    @override_settings(TRACKTASKS_DAILY_UPDATES_SHARD_SIZE=2,
+                       TRACKTASKS_DAILY_UPDATES_CONCURRENCY=8)
+    def test_daily_updates_without_eager_mode(self):
+        """
+        Test the shards and report with tasks sent to a broker,
+        and no result backend, the way they run in production.
+        """
+        sent = []
+
+        def send_task(name, args, kwargs, **options):
+            sent.append((name, args, kwargs))
+
+        self.assertFalse(app.conf.task_always_eager)
+        with mock.patch.object(app, 'send_task', side_effect=send_task):
+            self.assertEqual(daily_updates(), 3)
+            self.assertEqual([name for name, _, _ in sent],
+                             ['tracktasks.tasks.daily_updates_shard'] * 3)
+
+            # a worker runs each task, in any order.
+            with self.assertLogs('tracktasks.logger') as logs:
+                while sent:
+                    name, args, kwargs = sent.pop()
+                    app.tasks[name](*args, **kwargs)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("created 5 recurrences in 3 shards", logs.output[0])
+        run = DailyUpdatesRun.objects.get()
+        self.assertEqual((run.finished, run.reported), (3, True))
+
+        # a shard run again isn't counted or reported twice.
+        with mock.patch.object(app, 'send_task') as send:
+            daily_updates_shard(self.users[0].pk, self.users[1].pk,
+                                run_id=run.pk)
+        self.assertFalse(send.called)
+        self.assertEqual(DailyUpdatesRun.objects.get().finished, 3)
+
+    def test_daily_updates_report(self):
+        run = DailyUpdatesRun.objects.create(shards=2)
+        run.finish_shard({'first_user_id': 1, 'last_user_id': 2,
+                          'scanned': 3, 'created': 3, 'seconds': 0.5})
+        run.finish_shard({'first_user_id': 3, 'last_user_id': 4,
+                          'scanned': 1, 'created': 1, 'seconds': 1.5})
+        report = daily_updates_report(run.pk)
+        self.assertEqual(report['shards'], 2)
+        self.assertEqual(report['scanned'], 4)
+        self.assertEqual(report['created'], 4)
+        self.assertEqual(report['slowest_seconds'], 1.5)
+
+    def test_daily_updates_without_users(self):
+        User.objects.all().delete()
+        self.assertEqual(get_user_shards(2, 8), [])
+        run = DailyUpdatesRun.objects.create(shards=0)
+        self.assertEqual(daily_updates_report(run.pk)['created'], 0)
+
+
+class VirtualRecurrenceTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.other_user = User.objects.create(username="not_ben",
+                                              password="secure")
+
+        self.daily = RecurrenceRule.objects.create(
+                                name="daily",
+                                user=self.user,
+                                date_type="S",
+                                recurring="D",
+                                anchor_date=(self.today -
+                                             datetime.timedelta(days=2)))
+        self.weekly = RecurrenceRule.objects.create(
+                                name="weekly",
+                                user=self.user,
+                                date_type="D",
+                                recurring="W",
+                                anchor_date=(self.today +
+                                             datetime.timedelta(days=3)))
+
+    def _login(self):
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def _complete(self, occurrence_id):
+        return self.client.post(reverse('tracktasks:mark complete'),
+                                {'selected_task': occurrence_id,
+                                 'name': "completed"},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_dashboard_expands_rules(self):
+        """
+        Test that rule occurrences are listed without saving any tasks.
+        """
+        dashboard = Task.objects.dashboard(self.user, self.today)
+        self.assertEqual(Task.objects.count(), 0)
+
+        self.assertEqual([(task.name, task.date)
+                          for task in dashboard['scheduled_for']],
+                         [("daily", self.today)])
+        self.assertEqual([(task.name, task.date)
+                          for task in dashboard['overdue_on']],
+                         [("daily", self.today - datetime.timedelta(days=1)),
+                          ("daily", self.today - datetime.timedelta(days=2))])
+        self.assertEqual([(task.name, task.date)
+                          for task in dashboard['still_due_on']],
+                         [("weekly", self.today + datetime.timedelta(days=3))])
+
+    def test_complete_virtual_occurrence(self):
+        """
+        Test that completing an occurrence saves it
+        and lets go of the occurrences before it.
+        """
+        self._login()
+        occurrence_id = '{}-{:%Y%m%d}'.format(self.daily.pk, self.today)
+        self._complete(occurrence_id)
+
+        task = Task.objects.get()
+        self.assertTrue(task.is_completed)
+        self.assertEqual(task.date, self.today)
+        self.assertEqual(task.recurring_id, self.daily.recurring_id)
+
+        dashboard = Task.objects.dashboard(self.user, self.today)
+        self.assertEqual(dashboard['completed_on'], [task])
+        self.assertEqual(dashboard['scheduled_for'], [])
+        self.assertEqual(dashboard['overdue_on'], [])
+
+        # completing it again doesn't save another task.
+        self._complete(occurrence_id)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_complete_other_users_occurrence(self):
+        """
+        Test that occurrences are scoped to the user
+        and to the dates the rule occurs on.
+        """
+        self.client.force_login(User.objects.get(pk=self.other_user.pk))
+        response = self._complete('{}-{:%Y%m%d}'.format(self.daily.pk,
+                                                        self.today))
+        self.assertEqual(response.status_code, 404)
+
+        self._login()
+        weekly_id = '{}-{:%Y%m%d}'.format(self.weekly.pk, self.today)
+        self.assertEqual(self._complete(weekly_id).status_code, 404)
+        self.assertEqual(Task.objects.count(), 0)
+
+    def test_index_shows_occurrences(self):
+        self._login()
+        response = self.client.get(reverse('tracktasks:index'))
+        self.assertContains(response, 'id="completed{}-{:%Y%m%d}"'.format(
+                                                self.daily.pk, self.today))
+
+    def test_rules_skipped_by_daily_updates(self):
+        """
+        Test that saved occurrences aren't repeated by the daily updates.
+        """
+        self.daily.materialize(self.today)
+        report = Task.objects.create_daily_recurring_tasks()
+        self.assertEqual(report['created'], 0)
+        self.assertEqual(list(Task.objects.unique_recurring(self.user, True)),
+                         [])
+
+    def test_materialize_saves_once(self):
+        """
+        Test that materializing a date twice returns the same task,
+        even if an earlier race saved it twice.
+        """
+        task = self.daily.materialize(self.today)
+        self.assertEqual(self.daily.materialize(self.today).pk, task.pk)
+        self.assertEqual(Task.objects.filter(
+                                recurring_id=self.daily.recurring_id,
+                                date=self.today).count(), 1)
+
+        Task.objects.create(name="daily", user=self.user,
+                            recurring_id=self.daily.recurring_id,
+                            date=self.today)
+        self.assertEqual(self.daily.materialize(self.today).pk, task.pk)
+
+    def test_dashboard_query_count(self):
+        for day in range(5):
+            self.daily.materialize(self.daily.anchor_date +
+                                   datetime.timedelta(days=day))
+        with self.assertNumQueries(4):
+            Task.objects.dashboard(self.user, self.today)
+
+    @override_settings(TRACKTASKS_VIRTUAL_RECURRENCES=True)
+    def test_create_rule(self):
+        """
+        Test that recurring tasks are created as a rule.
+        """
+        # every month has the second week.
+        date = self.today.replace(day=8)
+        self._login()
+        self.client.post(reverse('tracktasks:create task'),
+                         {'name': "new recurring",
+                          'date_type': "S",
+                          'date_year': date.year,
+                          'date_month': date.month,
+                          'date_day': date.day,
+                          'recurring': "M"})
+
+        self.assertEqual(Task.objects.count(), 0)
+        rule = RecurrenceRule.objects.get(name="new recurring")
+        self.assertEqual(rule.anchor_date, date)
+        self.assertEqual(rule.recurring, "M")
+        self.assertNotEqual(str(rule.recurring_id), Task.NULL_RECURRING)
+
+    @override_settings(TRACKTASKS_VIRTUAL_RECURRENCES=True)
+    def test_rule_that_cant_recur(self):
+        """
+        Test that a monthly rule in a week the next month doesn't have
+        isn't saved, and that one already saved ends its series
+        instead of breaking the pages.
+        """
+        date = datetime.date(2026, 9, 29)
+        self._login()
+        response = self.client.post(reverse('tracktasks:create task'),
+                                    {'name': "month end",
+                                     'date_type': "S",
+                                     'date_year': date.year,
+                                     'date_month': date.month,
+                                     'date_day': date.day,
+                                     'recurring': "M"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('date', response.context['form'].errors)
+        self.assertFalse(RecurrenceRule.objects.filter(
+                                            name="month end").exists())
+
+        response = self.client.post(reverse('tracktasks:modify rule',
+                                            kwargs={'pk': self.weekly.pk}),
+                                    {'name': "weekly",
+                                     'date_type': "D",
+                                     'anchor_date_year': date.year,
+                                     'anchor_date_month': date.month,
+                                     'anchor_date_day': date.day,
+                                     'recurring': "M"})
+        self.assertIn('anchor_date', response.context['form'].errors)
+
+        rule = RecurrenceRule.objects.create(name="month end",
+                                             user=self.user,
+                                             recurring="M",
+                                             anchor_date=date)
+        occurrences = Task.objects.rule_occurrences(
+                            self.user, date + datetime.timedelta(days=90))
+        self.assertEqual([task.date for task in occurrences[rule]], [date])
+        self.assertEqual(self.client.get(
+                            reverse('tracktasks:index')).status_code, 200)
+        self.assertEqual(self.client.get(
+                            reverse('tracktasks:manage tasks')).status_code,
+                         200)
+
+    def test_modify_occurrence(self):
+        """
+        Test that editing one occurrence saves it,
+        and that deleting it leaves the rest of the series.
+        """
+        self._login()
+        occurrence_id = '{}-{:%Y%m%d}'.format(self.daily.pk, self.today)
+        response = self.client.post(reverse('tracktasks:modify occurrence',
+                                            args=[occurrence_id]))
+        task = Task.objects.get(recurring_id=self.daily.recurring_id,
+                                date=self.today)
+        self.assertRedirects(response, reverse('tracktasks:modify task',
+                                               kwargs={'pk': task.pk}))
+
+        self.client.post(reverse('tracktasks:modify task',
+                                 kwargs={'pk': task.pk}),
+                         {'name': "just today",
+                          'date_type': "S",
+                          'date_year': self.today.year,
+                          'date_month': self.today.month,
+                          'date_day': self.today.day,
+                          'recurring': "D",
+                          'is_disabled': True})
+        task.refresh_from_db()
+        self.assertEqual(task.name, "just today")
+        self.assertTrue(task.is_disabled)
+        self.daily.refresh_from_db()
+        self.assertFalse(self.daily.is_disabled)
+
+        response = self.client.post(reverse('tracktasks:modify occurrence',
+                                            args=['{}-20000101'.format(
+                                                        self.daily.pk)]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_task_that_cant_recur(self):
+        """
+        Test that a stored monthly task can't be moved to a date
+        it can't recur from, and that one already stored
+        is skipped by the daily updates and the catch up
+        without stopping the other tasks.
+        """
+        self._login()
+        tomorrow = self.today + datetime.timedelta(days=1)
+        monthly = Task.objects.create(name="monthly", user=self.user,
+                                      recurring="M",
+                                      recurring_id=uuid.uuid4(),
+                                      date=tomorrow, is_most_recent=True)
+        daily = Task.objects.create(name="daily", user=self.user,
+                                    recurring="D",
+                                    recurring_id=uuid.uuid4(),
+                                    date=tomorrow, is_most_recent=True)
+
+        date = datetime.date(2026, 9, 29)
+        response = self.client.post(reverse('tracktasks:modify task',
+                                            kwargs={'pk': monthly.pk}),
+                                    {'name': "monthly",
+                                     'date_type': "S",
+                                     'date_year': date.year,
+                                     'date_month': date.month,
+                                     'date_day': date.day,
+                                     'recurring': "M"})
+        self.assertIn('date', response.context['form'].errors)
+
+        next_date = recurrence_engine.next_date
+
+        def stuck_monthly(date, frequency):
+            if frequency == 'M':
+                raise IndexError("list index out of range")
+            return next_date(date, frequency)
+
+        with mock.patch.object(recurrence_engine, 'next_date',
+                               stuck_monthly):
+            with self.assertLogs('tracktasks.logger', 'WARNING'):
+                report = Task.objects.create_daily_recurring_tasks()
+            self.assertEqual(report, {'scanned': 2, 'created': 1})
+            self.assertTrue(Task.objects.get(pk=monthly.pk).is_most_recent)
+            self.assertFalse(Task.objects.get(pk=daily.pk).is_most_recent)
+
+            Task.objects.filter(pk=monthly.pk).update(
+                            date=self.today - datetime.timedelta(days=40))
+            with self.assertLogs('tracktasks.logger', 'WARNING'):
+                Task.objects.catch_up_recurring_tasks(self.user)
+
+    def test_disable_rule(self):
+        """
+        Test that deleting a rule disables it and its saved occurrences.
+        """
+        self._login()
+        self.daily.materialize(self.today + datetime.timedelta(days=1))
+        response = self.client.get(reverse('tracktasks:manage tasks'))
+        self.assertContains(response, reverse('tracktasks:modify rule',
+                                              kwargs={'pk': self.daily.pk}))
+
+        self.client.post(reverse('tracktasks:modify rule',
+                                 kwargs={'pk': self.daily.pk}),
+                         {'name': "daily",
+                          'date_type': "S",
+                          'anchor_date_year': self.daily.anchor_date.year,
+                          'anchor_date_month': self.daily.anchor_date.month,
+                          'anchor_date_day': self.daily.anchor_date.day,
+                          'recurring': "D",
+                          'is_disabled': True})
+
+        self.daily.refresh_from_db()
+        self.assertTrue(self.daily.is_disabled)
+        self.assertTrue(Task.objects.get().is_disabled)
+        dashboard = Task.objects.dashboard(self.user, self.today)
+        self.assertEqual(dashboard['scheduled_for'], [])
+
+
+class BulkOperationTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.other_user = User.objects.create(username="not_ben",
+                                              password="secure")
+
+        self.tasks = [Task.objects.create(name="task {}".format(i),
+                                          user=self.user,
+                                          date=self.today)
+                      for i in range(3)]
+        self.other_task = Task.objects.create(name="other",
+                                              user=self.other_user,
+                                              date=self.today)
+
+        self.series_id = uuid.uuid4()
+        for day in range(3):
+            Task.objects.create(name="recurring",
+                                user=self.user,
+                                recurring="D",
+                                recurring_id=self.series_id,
+                                date=(self.today +
+                                      datetime.timedelta(days=day)))
+
+    def _ids(self):
+        return [task.pk for task in self.tasks] + [self.other_task.pk]
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_bulk_complete(self):
+        # a select, the update and the score's upsert, in savepoints,
+        # however many tasks there are.
+        with self.assertNumQueries(8):
+            completed = Task.objects.bulk_complete(self.user, self._ids())
+        self.assertEqual(completed, 3)
+        self.assertEqual(Task.objects.filter(is_completed=True,
+                                             completed_date=self.today,
+                                             user=self.user).count(), 3)
+        self.other_task.refresh_from_db()
+        self.assertFalse(self.other_task.is_completed)
+
+        # completed tasks aren't counted again.
+        self.assertEqual(Task.objects.bulk_complete(self.user, self._ids()),
+                         0)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_bulk_disable(self):
+        with self.assertNumQueries(2):
+            disabled = Task.objects.bulk_disable(self.user,
+                                                 [self.tasks[0].pk,
+                                                  self.other_task.pk],
+                                                 [self.series_id])
+        self.assertEqual(disabled, 4)
+        self.assertEqual(Task.objects.filter(is_disabled=True).count(), 4)
+
+    def test_bulk_disable_rule(self):
+        """
+        Test that disabling a series kept as a rule is counted,
+        and changes the dashboard's ETag.
+        """
+        rule = RecurrenceRule.objects.create(name="rule", user=self.user,
+                                             anchor_date=self.today)
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        index = reverse('tracktasks:index')
+        etag = self.client.get(index)['ETag']
+
+        response = self.client.post(reverse('tracktasks:bulk update'),
+                                    {'action': 'disable',
+                                     'recurring_ids': [rule.recurring_id]})
+        self.assertEqual(response.json()['affected'], 1)
+        rule.refresh_from_db()
+        self.assertTrue(rule.is_disabled)
+
+        response = self.client.get(index, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_bulk_reschedule(self):
+        # the update, and reading and marking the weeks the tasks leave
+        # in a savepoint, however many tasks there are.
+        with self.assertNumQueries(5):
+            moved = Task.objects.bulk_reschedule(self.user, self._ids(), -3)
+        self.assertEqual(moved, 3)
+        for task in self.tasks:
+            task.refresh_from_db()
+            self.assertEqual(task.date,
+                             self.today - datetime.timedelta(days=3))
+        self.other_task.refresh_from_db()
+        self.assertEqual(self.other_task.date, self.today)
+
+    def test_bulk_update_view(self):
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        url = reverse('tracktasks:bulk update')
+
+        response = self.client.post(url, {'action': 'reschedule',
+                                          'task_ids': self._ids(),
+                                          'days': 1})
+        self.assertEqual(response.json(), {'action': 'reschedule',
+                                           'affected': 3})
+
+        response = self.client.post(url, {'action': 'disable',
+                                          'recurring_ids': [self.series_id]})
+        self.assertEqual(response.json()['affected'], 3)
+
+        response = self.client.post(url, {'action': 'reschedule',
+                                          'task_ids': self._ids()})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'action': 'reschedule',
+                                          'task_ids': self._ids(),
+                                          'days': 10000000000})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'action': 'delete'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+    def test_bulk_update_invalidates(self):
+        dashboard = lambda: Task.objects.dashboard(self.user, self.today)
+        cached_for_user('dashboard', self.user, self.today, dashboard)
+
+        Task.objects.bulk_complete(self.user, self._ids())
+        cached = cached_for_user('dashboard', self.user, self.today,
+                                 dashboard)
+        self.assertEqual(len(cached['completed_on']), 3)
+
+
+class TimerTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.task = Task.objects.create(name="timed",
+                                        user=self.user,
+                                        date=datetime.date.today(),
+                                        is_timed=True,
+                                        total_time=datetime.timedelta(
+                                                            minutes=30),
+                                        remaining_time=datetime.timedelta(
+                                                            minutes=30))
+        self.start = timezone.make_aware(datetime.datetime(2017, 1, 16, 9))
+
+    def _minutes(self, minutes):
+        return self.start + datetime.timedelta(minutes=minutes)
+
+    def test_start_and_stop(self):
+        self.assertTrue(self.task.start_timer(self.start))
+        self.assertTrue(self.task.stop_timer(self._minutes(10)))
+
+        self.task.refresh_from_db()
+        self.assertIsNone(self.task.start_time)
+        self.assertEqual(self.task.remaining_time,
+                         datetime.timedelta(minutes=20))
+        self.assertEqual(self.task.tracked_time,
+                         datetime.timedelta(minutes=10))
+
+        session = TimerSession.objects.get()
+        self.assertEqual(session.stopped, self._minutes(10))
+        self.assertEqual(session.duration, datetime.timedelta(minutes=10))
+        self.assertEqual(DailyTrackedTime.objects.get().tracked_time,
+                         datetime.timedelta(minutes=10))
+
+    def test_racing_clicks(self):
+        """
+        Test that a second start or stop of the same session
+        doesn't change anything.
+        """
+        stale = Task.objects.get(pk=self.task.pk)
+        self.assertTrue(self.task.start_timer(self.start))
+        self.assertFalse(Task.objects.get(pk=self.task.pk).start_timer(
+                                                        self._minutes(1)))
+        self.assertEqual(TimerSession.objects.count(), 1)
+
+        first = Task.objects.get(pk=self.task.pk)
+        second = Task.objects.get(pk=self.task.pk)
+        self.assertTrue(first.stop_timer(self._minutes(10)))
+        self.assertFalse(second.stop_timer(self._minutes(11)))
+        self.assertFalse(stale.stop_timer(self._minutes(12)))
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.tracked_time,
+                         datetime.timedelta(minutes=10))
+        self.assertEqual(DailyTrackedTime.objects.get().tracked_time,
+                         datetime.timedelta(minutes=10))
+
+    def test_rollups_add_up(self):
+        """
+        Test that sessions are added to the rollups,
+        split at midnight.
+        """
+        late = timezone.make_aware(datetime.datetime(2017, 1, 16, 23, 30))
+        for start, stop in [(self._minutes(0), self._minutes(5)),
+                            (self._minutes(60), self._minutes(70)),
+                            (late, late + datetime.timedelta(hours=1))]:
+            self.task.start_timer(start)
+            self.task.stop_timer(stop)
+
+        rollups = dict(DailyTrackedTime.objects.values_list('date',
+                                                            'tracked_time'))
+        self.assertEqual(rollups, {
+            datetime.date(2017, 1, 16): datetime.timedelta(minutes=45),
+            datetime.date(2017, 1, 17): datetime.timedelta(minutes=30),
+        })
+        self.assertEqual(Task.objects.get(pk=self.task.pk).tracked_time,
+                         datetime.timedelta(minutes=75))
+
+    def test_stop_completes_when_time_runs_out(self):
+        self.task.start_timer(self.start)
+        self.task.stop_timer(self._minutes(31))
+        self.assertTrue(Task.objects.get(pk=self.task.pk).is_completed)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_stop_query_count(self):
+        self.task.start_timer(self.start)
+        self.task.stop_timer(self._minutes(1))
+        self.task.start_timer(self._minutes(2))
+
+        # update the task, close the session, update the rollup,
+        # check completion and refresh, in a transaction.
+        with self.assertNumQueries(7):
+            self.task.stop_timer(self._minutes(3))
+
+    def test_mark_task_complete_timer(self):
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        for name in ("start_timer", "stop_timer"):
+            self.client.post(reverse('tracktasks:mark complete'),
+                             {'selected_task': self.task.pk,
+                              'name': name},
+                             HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        session = TimerSession.objects.get()
+        self.assertIsNotNone(session.stopped)
+        self.assertIsNone(Task.objects.get(pk=self.task.pk).start_time)
+
+
+class TaskActionTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.other_user = User.objects.create(username="not_ben",
+                                              password="secure")
+        self.timed = Task.objects.create(name="timed",
+                                         user=self.user,
+                                         date=datetime.date(2017, 1, 16),
+                                         is_timed=True,
+                                         remaining_time=datetime.timedelta(
+                                                                minutes=30))
+        self.untimed = Task.objects.create(name="untimed",
+                                           user=self.user,
+                                           date=datetime.date(2017, 1, 16))
+        self.other_task = Task.objects.create(name="other",
+                                              user=self.other_user,
+                                              date=datetime.date(2017, 1, 16))
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def _post(self, actions):
+        return self.client.post(reverse('tracktasks:task actions'),
+                                json.dumps({'actions': actions}),
+                                content_type='application/json')
+
+    def _batch(self):
+        return [{'task': self.timed.pk, 'action': 'start_timer',
+                 'timestamp': '2017-01-16T14:00:00Z'},
+                {'task': self.timed.pk, 'action': 'stop_timer',
+                 'timestamp': '2017-01-16T14:10:00Z'},
+                {'task': self.untimed.pk, 'action': 'complete',
+                 'timestamp': '2017-01-16T15:00:00Z'}]
+
+    def test_apply_batch(self):
+        response = self._post(self._batch())
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['applied'], 3)
+        self.assertEqual(data['skipped'], 0)
+
+        states = {task['id']: task for task in data['tasks']}
+        self.assertTrue(states[self.untimed.pk]['is_completed'])
+        self.assertEqual(states[self.untimed.pk]['completed_date'],
+                         '2017-01-16')
+        self.assertIsNone(states[self.timed.pk]['start_time'])
+
+        self.timed.refresh_from_db()
+        self.assertEqual(self.timed.remaining_time,
+                         datetime.timedelta(minutes=20))
+
+    def test_replay_is_idempotent(self):
+        self._post(self._batch())
+        data = self._post(self._batch()).json()
+        self.assertEqual(data['applied'], 0)
+        self.assertEqual(data['skipped'], 3)
+
+        self.timed.refresh_from_db()
+        self.assertEqual(self.timed.remaining_time,
+                         datetime.timedelta(minutes=20))
+        self.assertEqual(TimerSession.objects.count(), 1)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_single_fetch(self):
+        """
+        Test that the tasks and the log are read once,
+        however many actions there are.
+        """
+        actions = [{'task': task.pk, 'action': 'complete',
+                    'timestamp': '2017-01-16T15:00:00Z'}
+                   for task in (self.timed, self.untimed)]
+        with CaptureQueriesContext(connection) as queries:
+            self._post(actions)
+        selects = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and
+                   'tracktasks_' in query['sql']]
+        self.assertEqual(len(selects), 2)
+
+    def test_invalid_batches(self):
+        response = self._post([{'task': self.other_task.pk,
+                                'action': 'complete',
+                                'timestamp': '2017-01-16T15:00:00Z'}])
+        self.assertEqual(response.status_code, 404)
+
+        response = self._post([{'task': self.untimed.pk,
+                                'action': 'delete',
+                                'timestamp': '2017-01-16T15:00:00Z'}])
+        self.assertEqual(response.status_code, 400)
+
+        response = self._post([{'task': self.untimed.pk,
+                                'action': 'complete',
+                                'timestamp': 'yesterday'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Task.objects.filter(is_completed=True).exists())
+
+    def test_virtual_occurrences(self):
+        """
+        Test that a rule's virtual occurrence is saved and acted on,
+        and that replaying the batch acts on the same task.
+        """
+        rule = RecurrenceRule.objects.create(name="daily",
+                                             user=self.user,
+                                             recurring="D",
+                                             anchor_date=datetime.date(
+                                                                2017, 1, 16))
+        occurrence_id = '{}-20170117'.format(rule.pk)
+        actions = [{'task': occurrence_id, 'action': 'complete',
+                    'timestamp': '2017-01-17T09:00:00Z'}]
+
+        data = self._post(actions).json()
+        task = Task.objects.get(recurring_id=rule.recurring_id,
+                                date=datetime.date(2017, 1, 17))
+        self.assertTrue(task.is_completed)
+        self.assertEqual(data['saved_ids'], {occurrence_id: task.pk})
+        self.assertEqual(data['tasks'][0]['id'], task.pk)
+
+        data = self._post(actions).json()
+        self.assertEqual((data['applied'], data['skipped']), (0, 1))
+
+        response = self._post([{'task': '{}-20170117'.format(rule.pk + 1),
+                                'action': 'complete',
+                                'timestamp': '2017-01-17T09:00:00Z'}])
+        self.assertEqual(response.status_code, 404)
+
+
+class MarkTaskCompleteTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+        self.task = Task.objects.create(name="untimed today",
+                                        user=self.user,
+                                        date_type="S",
+                                        date=self.today)
+        self.timed = Task.objects.create(name="timed due later",
+                                         user=self.user,
+                                         date_type="D",
+                                         date=(self.today +
+                                               datetime.timedelta(days=2)),
+                                         is_timed=True,
+                                         total_time=datetime.timedelta(
+                                                                minutes=5),
+                                         remaining_time=datetime.timedelta(
+                                                                minutes=5))
+
+    def _post(self, task_id, name):
+        return self.client.post(reverse('tracktasks:mark complete'),
+                                {'selected_task': task_id, 'name': name},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_complete_moves_to_completed(self):
+        data = self._post(self.task.pk, 'completed').json()
+        self.assertTrue(data['task']['is_completed'])
+        self.assertEqual(data['lists'], ['completed_on'])
+        self.assertHTMLEqual(data['html']['completed_on'],
+                             '<li class="list-group-item">untimed today</li>')
+
+    def test_start_timer_fragment(self):
+        """
+        Test that the returned row matches the row in the dashboard.
+        """
+        data = self._post(self.timed.pk, 'start_timer').json()
+        self.assertEqual(data['lists'], ['still_due_on'])
+        fragment = data['html']['still_due_on']
+        self.assertIn('id="stop{}"'.format(self.timed.pk), fragment)
+
+        index = self.client.get(reverse('tracktasks:index'))
+        strip_token = lambda html: re.sub(
+                        r"name='csrfmiddlewaretoken' value='[^']*'", '', html)
+        self.assertIn(strip_token(fragment).strip(),
+                      strip_token(index.content.decode('utf-8')))
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_query_count(self):
+        """
+        Test that a click costs the task lookup, its update
+        and the score's upsert, without the dashboard queries.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self._post(self.task.pk, 'completed')
+        tasks_queries = [query['sql'] for query in queries.captured_queries
+                         if 'tracktasks_' in query['sql']]
+        self.assertEqual(len(tasks_queries), 4)
+
+    def test_other_users_task(self):
+        other_user = User.objects.create(username="not_ben",
+                                         password="secure")
+        self.client.force_login(User.objects.get(pk=other_user.pk))
+        self.assertEqual(self._post(self.task.pk, 'completed').status_code,
+                         404)
+
+
+class TaskEventTestCases(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def test_publish(self):
+        subscription = events.subscribe(self.user.pk)
+        other = events.subscribe(self.user.pk + 1)
+
+        events.publish(self.user.pk, 'timer', {'id': 1})
+        self.assertEqual(subscription.get(timeout=0), ('timer', {'id': 1}))
+        with self.assertRaises(queue.Empty):
+            other.get(timeout=0)
+
+        subscription.close()
+        other.close()
+        self.assertEqual(events.subscriber_count(self.user.pk), 0)
+
+    def test_streams_off(self):
+        response = self.client.get(reverse('tracktasks:task events'))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotContains(self.client.get(reverse('tracktasks:index')),
+                               'task_events_script')
+
+    @override_settings(TRACKTASKS_EVENT_STREAMS=True)
+    def test_index_listens_for_events(self):
+        self.assertContains(self.client.get(reverse('tracktasks:index')),
+                            'task_events_script')
+
+    @override_settings(TRACKTASKS_EVENT_STREAMS=True)
+    @mock.patch.object(events, 'KEEPALIVE', 0.01)
+    def test_stream(self):
+        response = self.client.get(reverse('tracktasks:task events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+
+        self.assertEqual(next(stream), b'retry: 3000\n\n')
+        self.assertEqual(events.subscriber_count(self.user.pk), 1)
+        self.assertEqual(next(stream), b': keepalive\n\n')
+
+        events.publish(self.user.pk, 'tasks', {})
+        self.assertEqual(next(stream), b'event: tasks\ndata: {}\n\n')
+
+        response.close()
+        self.assertEqual(events.subscriber_count(self.user.pk), 0)
+
+    @override_settings(TRACKTASKS_EVENT_STREAMS=True)
+    @mock.patch.object(events, 'STREAM_LIFETIME', 0)
+    def test_stream_closes(self):
+        response = self.client.get(reverse('tracktasks:task events'))
+        self.assertEqual(list(response.streaming_content),
+                         [b'retry: 3000\n\n'])
+        self.assertEqual(events.subscriber_count(self.user.pk), 0)
+
+
+class TaskEventPublishTestCases(TransactionTestCase):
+    """
+    Events are published on commit,
+    which TestCase never gets to.
+    """
+
+    def test_timer_publishes_on_commit(self):
+        user = User.objects.create(username="ben", password="secure")
+        task = Task.objects.create(name="timed",
+                                   user=user,
+                                   date=datetime.date.today(),
+                                   is_timed=True,
+                                   remaining_time=datetime.timedelta(
+                                                                minutes=5))
+        subscription = events.subscribe(user.pk)
+        self.addCleanup(subscription.close)
+
+        with transaction.atomic():
+            task.start_timer()
+            with self.assertRaises(queue.Empty):
+                subscription.get(timeout=0)
+
+        published = [subscription.get(timeout=0) for _ in range(2)]
+        self.assertEqual(published[0][0], 'timer')
+        self.assertEqual(published[0][1]['id'], task.pk)
+        self.assertIsNotNone(published[0][1]['start_time'])
+        self.assertEqual(published[1], ('tasks', {}))
+
+
+class ManageTasksPaginationTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+        # several tasks share each date, so ties are ordered by id.
+        for i in range(12):
+            Task.objects.create(name="task {}".format(i),
+                                user=self.user,
+                                date=(self.today +
+                                      datetime.timedelta(days=i // 3)))
+        self.rule = RecurrenceRule.objects.create(
+                                name="rule",
+                                user=self.user,
+                                recurring="W",
+                                anchor_date=(self.today +
+                                             datetime.timedelta(days=1)))
+
+    def _all_pages(self, size):
+        keys, after = [], None
+        while True:
+            page, after = Task.objects.active_tasks_page(
+                                    self.user, self.today, after, size)
+            keys.append([Task.objects.page_key(task) for task in page])
+            if after is None:
+                return keys
+
+    def test_pages_cover_all_tasks(self):
+        """
+        Test that the pages hold every task once, in (date, id) order,
+        with the rule's occurrence in its place.
+        """
+        pages = self._all_pages(5)
+        self.assertEqual([len(page) for page in pages], [5, 5, 3])
+
+        keys = [key for page in pages for key in page]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), 13)
+        self.assertIn((self.rule.anchor_date, -self.rule.pk), keys)
+
+    def test_page_query_count(self):
+        """
+        Test that deep pages cost the same as the first, without offsets.
+        """
+        with CaptureQueriesContext(connection) as first:
+            Task.objects.active_tasks_page(self.user, self.today, None, 2)
+        with CaptureQueriesContext(connection) as deep:
+            Task.objects.active_tasks_page(self.user, self.today,
+                                           (self.today +
+                                            datetime.timedelta(days=3), 0), 2)
+        self.assertEqual(len(first), len(deep))
+        for query in deep.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    @mock.patch('tracktasks.views.MANAGE_TASKS_PAGE_SIZE', 5)
+    def test_load_more(self):
+        response = self.client.get(reverse('tracktasks:manage tasks'))
+        self.assertEqual(len(response.context['user_tasks']), 5)
+        cursor = response.context['next_cursor']
+        self.assertContains(response, 'data-cursor="{}"'.format(cursor))
+
+        names = []
+        while cursor:
+            data = self.client.get(reverse('tracktasks:more tasks'),
+                                   {'cursor': cursor}).json()
+            names += re.findall(r'<span class="task_name">([^<]*)</span>',
+                                data['html'])
+            cursor = data['next_cursor']
+        self.assertEqual(len(names), 8)
+
+    def test_load_more_bad_cursor(self):
+        response = self.client.get(reverse('tracktasks:more tasks'),
+                                   {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ScoreTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+
+        self.tasks = [Task.objects.create(name="task {}".format(i),
+                                          user=self.user,
+                                          date=self.yesterday,
+                                          completed_val=i + 1,
+                                          not_completed_cost=10 * (i + 1))
+                      for i in range(3)]
+
+    def _score(self, date):
+        return DailyScore.objects.get(user=self.user, date=date)
+
+    def test_mark_complete_scores_once(self):
+        self.assertTrue(self.tasks[0].mark_complete())
+        self.assertFalse(Task.objects.get(
+                                pk=self.tasks[0].pk).mark_complete())
+
+        score = self._score(self.today)
+        self.assertEqual((score.earned, score.completed), (1, 1))
+
+    def test_bulk_complete_scores(self):
+        Task.objects.bulk_complete(self.user,
+                                   [task.pk for task in self.tasks])
+        Task.objects.bulk_complete(self.user,
+                                   [task.pk for task in self.tasks])
+        score = self._score(self.today)
+        self.assertEqual((score.earned, score.completed), (6, 3))
+
+    def test_timer_completion_scores(self):
+        task = self.tasks[2]
+        task.is_timed = True
+        task.remaining_time = datetime.timedelta(minutes=1)
+        task.save()
+
+        start = timezone.now() - datetime.timedelta(minutes=2)
+        task.start_timer(start)
+        task.stop_timer(start + datetime.timedelta(minutes=2))
+        self.assertEqual(self._score(timezone.localtime(
+                                        timezone.now()).date()).earned, 3)
+
+    def test_record_missed(self):
+        self.tasks[0].mark_complete()
+        for _ in range(2):
+            self.assertEqual(DailyScore.record_missed(self.yesterday), 1)
+
+        score = self._score(self.yesterday)
+        self.assertEqual((score.missed, score.lost), (2, 50))
+        self.assertEqual(score.score, -50)
+
+    def test_backfill_matches_incremental(self):
+        """
+        Test that rebuilding the scores gives the same totals
+        as keeping them up to date.
+        """
+        self.tasks[0].mark_complete()
+        DailyScore.record_missed(self.yesterday)
+        fields = ('date', 'earned', 'completed', 'lost', 'missed')
+        incremental = list(DailyScore.objects.order_by('date').values_list(
+                                                                *fields))
+
+        call_command('backfill_scores', chunk_size=1, stdout=io.StringIO())
+        backfilled = list(DailyScore.objects.order_by('date').values_list(
+                                                                *fields))
+
+        # the early completion also counts as missed, since it was late.
+        self.assertEqual(backfilled[0][:3], incremental[0][:3])
+        self.assertEqual(backfilled[0][3:], (60, 3))
+        self.assertEqual(backfilled[1], incremental[1])
+
+    def test_score_history(self):
+        self.tasks[0].mark_complete()
+        DailyScore.record_missed(self.yesterday)
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('tracktasks:score history'),
+                                       {'days': 7})
+        score_queries = [query for query in queries.captured_queries
+                         if 'tracktasks_dailyscore' in query['sql']]
+        self.assertEqual(len(score_queries), 1)
+
+        days = response.json()['days']
+        self.assertEqual(len(days), 7)
+        self.assertEqual(days[-1]['date'], self.today.isoformat())
+        self.assertEqual(days[-1]['earned'], 1)
+        self.assertEqual(days[-2]['score'], -50)
+        self.assertEqual(days[0]['score'], 0)
+
+        response = self.client.get(reverse('tracktasks:score history'),
+                                   {'days': 'all'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalyticsTestCases(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localtime(timezone.now()).date()
+        self.week = analytics.week_start(self.today)
+        self.last_week = self.week - datetime.timedelta(weeks=1)
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+
+        self.series_id = uuid.uuid4()
+        self.series = [Task.objects.create(name="daily",
+                                           user=self.user,
+                                           recurring="D",
+                                           recurring_id=self.series_id,
+                                           date=(self.last_week +
+                                                 datetime.timedelta(days=day)))
+                       for day in range(7)]
+        for task in self.series[:4]:
+            task.mark_complete()
+        Task.objects.filter(pk=self.series[0].pk).update(
+                        tracked_time=datetime.timedelta(hours=2))
+
+        self.one_off = Task.objects.create(name="one off",
+                                           user=self.user,
+                                           date=self.today)
+
+    def _rollup(self, week, recurring_id):
+        return WeeklySeriesRollup.objects.get(user=self.user, week=week,
+                                              recurring_id=recurring_id)
+
+    def test_full_refresh(self):
+        self.assertEqual(analytics.refresh(), 2)
+
+        rollup = self._rollup(self.last_week, self.series_id)
+        self.assertEqual(rollup.name, "daily")
+        self.assertEqual((rollup.tasks, rollup.completed, rollup.overdue),
+                         (7, 4, 7))
+        self.assertEqual(rollup.tracked_time, datetime.timedelta(hours=2))
+
+        rollup = self._rollup(self.week, Task.NULL_RECURRING)
+        self.assertEqual((rollup.tasks, rollup.completed, rollup.overdue),
+                         (1, 0, 0))
+
+    def test_incremental_refresh(self):
+        """
+        Test that only the weeks with changed tasks are rebuilt.
+        """
+        analytics.refresh()
+        AnalyticsWatermark.objects.update(
+                changed_since=timezone.now() + analytics.OVERLAP)
+
+        self.one_off.mark_complete()
+        self.assertEqual(analytics.refresh(), 1)
+        self.assertEqual(self._rollup(self.week,
+                                      Task.NULL_RECURRING).completed, 1)
+
+        AnalyticsWatermark.objects.update(
+                changed_since=timezone.now() + analytics.OVERLAP)
+        self.assertEqual(analytics.refresh(), 0)
+
+    def test_refresh_counts_new_overdue_tasks(self):
+        analytics.refresh()
+        AnalyticsWatermark.objects.update(
+                changed_since=timezone.now() + analytics.OVERLAP,
+                refreshed_on=self.last_week)
+        self.assertEqual(analytics.refresh(), 1)
+
+    def test_refresh_rebuilds_weeks_tasks_left(self):
+        """
+        Test that moving or deleting a task rebuilds the week it was in.
+        """
+        analytics.refresh()
+
+        self.one_off.date = self.last_week
+        self.one_off.save()
+        analytics.refresh()
+        self.assertFalse(WeeklySeriesRollup.objects.filter(
+                                user=self.user, week=self.week).exists())
+        self.assertEqual(self._rollup(self.last_week,
+                                      Task.NULL_RECURRING).tasks, 1)
+
+        Task.objects.bulk_reschedule(self.user, [self.one_off.pk], 7)
+        analytics.refresh()
+        self.assertFalse(WeeklySeriesRollup.objects.filter(
+                                user=self.user, week=self.last_week,
+                                recurring_id=Task.NULL_RECURRING).exists())
+
+        Task.objects.get(pk=self.series[6].pk).delete()
+        AnalyticsWatermark.objects.update(
+                changed_since=timezone.now() + analytics.OVERLAP)
+        self.assertEqual(analytics.refresh(), 1)
+        self.assertEqual(self._rollup(self.last_week, self.series_id).tasks,
+                         6)
+        self.assertFalse(StaleRollupWeek.objects.exists())
+
+    def test_view_reads_rollups(self):
+        analytics.refresh()
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('tracktasks:analytics'))
+        for query in queries.captured_queries:
+            self.assertNotIn('"tracktasks_task"', query['sql'])
+
+        weeks = response.context['weeks']
+        self.assertEqual([week['key'] for week in weeks],
+                         [self.last_week, self.week])
+        self.assertEqual(weeks[0]['completion_rate'], 4 / 7)
+        self.assertEqual(response.context['series'][0]['name'], "daily")
+        self.assertContains(response, "one-off tasks")
+
+
+class TransferTestCases(TestCase):
+
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.other_user = User.objects.create(username="not_ben",
+                                              password="secure")
+
+        self.series_id = uuid.uuid4()
+        for day in range(3):
+            Task.objects.create(name="recurring",
+                                user=self.user,
+                                recurring="D",
+                                recurring_id=self.series_id,
+                                is_most_recent=day == 2,
+                                date=(self.today +
+                                      datetime.timedelta(days=day)))
+        Task.objects.create(name="timed", user=self.user, date=self.today,
+                            date_type="S", is_timed=True,
+                            total_time=datetime.timedelta(minutes=90))
+        Task.objects.create(name="done, with a comma", user=self.user,
+                            date=self.today, is_completed=True,
+                            completed_date=self.today)
+        Task.objects.create(name="deleted", user=self.user,
+                            date=self.today, is_disabled=True)
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def _export(self, format):
+        response = self.client.get(reverse('tracktasks:export tasks'),
+                                   {'format': format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def _import(self, user, text, format):
+        return transfer.import_tasks(
+                    user, transfer.read_rows(io.StringIO(text), format),
+                    batch_size=2)
+
+    def _rows(self, user):
+        """
+        Return the user's exported rows, with series numbered by first use.
+        """
+        series = {}
+        rows = []
+        for chunk in transfer.export_chunks(user):
+            for row in chunk:
+                if row['series']:
+                    row['series'] = series.setdefault(row['series'],
+                                                      len(series))
+                rows.append(row)
+        return rows
+
+    def test_round_trip(self):
+        for format in transfer.FORMATS:
+            Task.objects.filter(user=self.other_user).delete()
+
+            created = self._import(self.other_user, self._export(format),
+                                   format)
+
+            self.assertEqual(created, 5)
+            self.assertEqual(self._rows(self.other_user),
+                             self._rows(self.user))
+
+    def test_import_assigns_new_series(self):
+        self._import(self.other_user, self._export('csv'), 'csv')
+
+        imported = Task.objects.filter(user=self.other_user,
+                                       recurring="D")
+        recurring_ids = set(imported.values_list('recurring_id', flat=True))
+        self.assertEqual(len(recurring_ids), 1)
+        self.assertNotIn(self.series_id, recurring_ids)
+        self.assertEqual(imported.get(is_most_recent=True).date,
+                         self.today + datetime.timedelta(days=2))
+
+        timed = Task.objects.get(user=self.other_user, name="timed")
+        self.assertEqual(timed.remaining_time, timed.total_time)
+
+    def test_invalid_import_creates_nothing(self):
+        fine = {'name': "fine", 'date': str(self.today),
+                'date_type': "D", 'recurring': "N"}
+        text = (json.dumps(fine) + "\n" +
+                json.dumps({'name': "no date"}) + "\n" +
+                "not json\n")
+
+        with self.assertRaises(transfer.InvalidImport) as raised:
+            self._import(self.other_user, text, 'jsonl')
+
+        self.assertEqual([error['line'] for error in raised.exception.errors],
+                         [2, 3])
+        self.assertIn('date', raised.exception.errors[0]['errors'])
+        self.assertFalse(Task.objects.filter(user=self.other_user).exists())
+
+    def test_export_reads_in_chunks(self):
+        # one query per chunk, and one to find there are no more.
+        with self.assertNumQueries(4):
+            chunks = list(transfer.export_chunks(self.user, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+    def test_import_view(self):
+        upload = SimpleUploadedFile("tasks.csv",
+                                    self._export('csv').encode('utf-8'))
+        self.client.force_login(User.objects.get(pk=self.other_user.pk))
+
+        response = self.client.post(reverse('tracktasks:import tasks'),
+                                    {'tasks': upload})
+
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'created': 5})
+        self.assertEqual(Task.objects.filter(user=self.other_user).count(), 5)
+
+    def test_import_view_rejects_unreadable_csv(self):
+        upload = SimpleUploadedFile("tasks.csv",
+                                    b"name,date\nfirst,2026-10-18\n"
+                                    b"sec\x00ond,2026-10-19\n")
+        self.client.force_login(User.objects.get(pk=self.other_user.pk))
+
+        response = self.client.post(reverse('tracktasks:import tasks'),
+                                    {'tasks': upload})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("after line 2", response.json()['error'])
+        self.assertFalse(Task.objects.filter(user=self.other_user).exists())
+
+    def test_import_view_rejects_unknown_format(self):
+        upload = SimpleUploadedFile("tasks.xls", b"")
+        response = self.client.post(reverse('tracktasks:import tasks'),
+                                    {'tasks': upload})
+        self.assertEqual(response.status_code, 400)
+
+
+class CalendarFeedTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+
+        self.event = Task.objects.create(name="meeting; with, notes",
+                                         user=self.user, date_type="S",
+                                         date=self.today)
+        self.todo = Task.objects.create(name="report", user=self.user,
+                                        date=self.today)
+        self.series_id = uuid.uuid4()
+        for day in range(3):
+            Task.objects.create(name="daily",
+                                user=self.user,
+                                recurring="D",
+                                recurring_id=self.series_id,
+                                date=(self.today +
+                                      datetime.timedelta(days=day)))
+        self.rule = RecurrenceRule.objects.create(
+                            name="monthly", user=self.user, recurring="M",
+                            anchor_date=datetime.date(2017, 1, 10))
+
+        self.url = reverse('tracktasks:calendar feed',
+                           args=[ical.feed_token(self.user.pk)])
+
+    def test_feed(self):
+        response = self.client.get(self.url)
+        body = response.content.decode('utf-8')
+
+        self.assertEqual(response['Content-Type'],
+                         'text/calendar; charset=utf-8')
+        self.assertIn("BEGIN:VEVENT\r\nUID:task-{}@tasktracker".format(
+                        self.event.pk), body)
+        self.assertIn(r"SUMMARY:meeting\; with\, notes", body)
+        self.assertIn("BEGIN:VTODO\r\nUID:task-{}@tasktracker".format(
+                        self.todo.pk), body)
+
+        # a series is one entry, starting on its first date.
+        self.assertEqual(body.count("series-{}".format(self.series_id)), 1)
+        self.assertIn("SUMMARY:daily\r\nDTSTART;VALUE=DATE:{:%Y%m%d}".format(
+                        self.today), body)
+        self.assertIn("RRULE:FREQ=DAILY", body)
+        self.assertIn("RRULE:FREQ=MONTHLY;BYDAY=2TU", body)
+        self.assertEqual(body.count("BEGIN:V"), 5)
+
+    def test_rrule(self):
+        self.assertEqual(ical.rrule('B', self.today),
+                         'FREQ=WEEKLY;INTERVAL=2')
+        self.assertEqual(ical.rrule('M', datetime.date(2017, 1, 31)),
+                         'FREQ=MONTHLY;BYDAY=-1TU')
+
+    def test_fold(self):
+        line = "SUMMARY:" + "é" * 80
+        folded = ical.fold(line).split('\r\n ')
+
+        self.assertEqual(''.join(folded), line)
+        self.assertLessEqual(len(folded[0].encode('utf-8')), 75)
+        for part in folded[1:]:
+            self.assertLessEqual(len(part.encode('utf-8')), 74)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_unchanged_feed_is_not_modified(self):
+        response = self.client.get(self.url)
+
+        # the tasks' and the rules' last change.
+        with self.assertNumQueries(2):
+            not_modified = self.client.get(
+                        self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        not_modified = self.client.get(
+                        self.url,
+                        HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_feed_body_is_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_feed(self):
+        response = self.client.get(self.url)
+
+        self.todo.name = "renamed"
+        self.todo.save()
+
+        changed = self.client.get(self.url,
+                                  HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertIn("SUMMARY:renamed", changed.content.decode('utf-8'))
+
+    def test_write_without_invalidation(self):
+        """
+        Test that the feed changes with a write
+        that this process's cache wasn't told about.
+        """
+        response = self.client.get(self.url)
+
+        # update() doesn't invalidate the user's cached lists.
+        Task.objects.filter(pk=self.todo.pk).update(
+                        name="renamed", updated_at=timezone.now())
+
+        changed = self.client.get(self.url,
+                                  HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn("SUMMARY:renamed", changed.content.decode('utf-8'))
+
+    def test_bad_token(self):
+        response = self.client.get(reverse('tracktasks:calendar feed',
+                                           args=["MQ:forged"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalViewTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.task = Task.objects.create(name="task", user=self.user,
+                                        date=self.today, is_timed=True,
+                                        total_time=datetime.timedelta(hours=1),
+                                        remaining_time=datetime.timedelta(
+                                                                    hours=1))
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def _task_queries(self, queries):
+        return [query['sql'] for query in queries.captured_queries
+                if '"tracktasks_task"' in query['sql']]
+
+    def test_unchanged_index_is_not_modified(self):
+        url = reverse('tracktasks:index')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.client.get(
+                            url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(not_modified.status_code, 304)
+        # only the aggregate.
+        self.assertEqual(len(self._task_queries(queries)), 1)
+        self.assertIn('no-cache', not_modified['Cache-Control'])
+
+        not_modified = self.client.get(
+                            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_unchanged_manage_tasks_is_not_modified(self):
+        url = reverse('tracktasks:manage tasks')
+        response = self.client.get(url)
+
+        not_modified = self.client.get(url,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        url = reverse('tracktasks:index')
+        etags = [self.client.get(url)['ETag']]
+
+        writes = [
+            lambda: self.task.start_timer(),
+            lambda: Task.objects.bulk_reschedule(self.user, [self.task.pk], 1),
+            lambda: RecurrenceRule.objects.create(
+                            name="rule", user=self.user,
+                            anchor_date=self.today),
+            lambda: Task.objects.filter(pk=self.task.pk).delete(),
+        ]
+        for write in writes:
+            write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(response.status_code, 200)
+            etags.append(response['ETag'])
+
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_last_change(self):
+        latest, count = Task.objects.last_change(self.user)
+        self.assertEqual((latest, count), (self.task.updated_at, 1))
+
+        Task.objects.bulk_complete(self.user, [self.task.pk])
+        self.task.refresh_from_db()
+        self.assertGreater(self.task.updated_at, latest)
+        self.assertEqual(Task.objects.last_change(self.user),
+                         (self.task.updated_at, 1))
+
+
+class TaskRowCacheTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['template_fragments'].clear()
+        self.today = datetime.date.today()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.task = Task.objects.create(name="timed", user=self.user,
+                                        date=self.today, is_timed=True,
+                                        total_time=datetime.timedelta(hours=1),
+                                        remaining_time=datetime.timedelta(
+                                                                    hours=1))
+        self.factory = RequestFactory()
+
+    def _render(self, task, date_label=None):
+        return render_to_string('tracktasks/task_row.html',
+                                {'task': task, 'date_label': date_label,
+                                 'mark_complete_url': "/complete/"},
+                                request=self.factory.get('/'))
+
+    def test_rows_are_cached_by_version(self):
+        self._render(self.task)
+
+        # unsaved changes don't change the version.
+        self.task.name = "renamed"
+        self.assertNotIn("renamed", self._render(self.task))
+
+        self.task.save()
+        self.assertIn("renamed", self._render(self.task))
+
+    def test_rows_are_cached_by_label(self):
+        self.assertNotIn("was due", self._render(self.task))
+        self.assertIn("was due", self._render(self.task, "was due"))
+
+    def test_csrf_token_is_not_cached(self):
+        token = re.compile(r"name=.csrfmiddlewaretoken. value=.(\w+)")
+        first = token.search(self._render(self.task)).group(1)
+        second = token.search(self._render(self.task)).group(1)
+        self.assertNotEqual(first, second)
+
+    def test_timer_changes_the_row(self):
+        self.assertIn('id="start{}"'.format(self.task.pk),
+                      self._render(self.task))
+
+        self.task.start_timer()
+        self.assertIn('id="stop{}"'.format(self.task.pk),
+                      self._render(self.task))
+
+        self.task.stop_timer()
+        self.assertIn('id="start{}"'.format(self.task.pk),
+                      self._render(self.task))
+
+    def test_rule_changes_virtual_rows(self):
+        rule = RecurrenceRule.objects.create(name="rule", user=self.user,
+                                             anchor_date=self.today)
+        self._render(rule.build_occurrence(self.today))
+
+        rule.name = "renamed rule"
+        rule.save()
+        self.assertIn("renamed rule",
+                      self._render(rule.build_occurrence(self.today)))
+
+
+class BenchmarkGeneratorTestCases(TestCase):
+
+    def _tasks(self, seed):
+        dataset = generator.generate(seed=seed, users=2, tasks_per_user=10,
+                                     series_per_user=2, months=1,
+                                     inactive_share=0.5)
+        tasks = Task.objects.filter(user_id__in=dataset['user_ids'])
+        return dataset, list(tasks.order_by('pk').values_list(
+                    'name', 'date', 'recurring', 'recurring_id',
+                    'is_completed', 'is_most_recent'))
+
+    def test_same_seed_generates_same_tasks(self):
+        _, first = self._tasks(1)
+        Task.objects.all().delete()
+        User.objects.all().delete()
+        _, second = self._tasks(1)
+        self.assertEqual(first, second)
+
+    def test_generates_settings(self):
+        dataset, tasks = self._tasks(2)
+        self.assertEqual(dataset['tasks'], len(tasks))
+        self.assertEqual(dataset['rules'], 2)
+        self.assertEqual(len([task for task in tasks
+                              if task[2] == 'N']), 20)
+        # one most recent task for each series.
+        self.assertEqual(len([task for task in tasks if task[5]]), 4)
+
+        away = datetime.timedelta(days=generator.INACTIVE_DAYS)
+        inactive = Profile.objects.get(user_id=dataset['inactive_user_id'])
+        self.assertEqual(inactive.most_recent_login,
+                         datetime.date.today() - away)
+
+
+class RequestTimingTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        Task.objects.create(name="task", user=self.user,
+                            date=datetime.date.today())
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def test_server_timing_header(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        with self.assertLogs('tracktasks.logger', 'DEBUG') as logs:
+            response = self.client.get(reverse('tracktasks:index'))
+
+        timing = re.match(r'sql;dur=[\d.]+;desc="(\d+) queries", '
+                          r'view;dur=[\d.]+, render;dur=([\d.]+), '
+                          r'total;dur=[\d.]+$', response['Server-Timing'])
+        self.assertIsNotNone(timing)
+        self.assertGreater(int(timing.group(1)), 0)
+        self.assertGreater(float(timing.group(2)), 0)
+
+        record = logs.records[0]
+        self.assertEqual(record.levelname, 'DEBUG')
+        self.assertEqual(record.request_timing['path'],
+                         reverse('tracktasks:index'))
+        self.assertEqual(record.request_timing['queries'],
+                         int(timing.group(1)))
+
+    @override_settings(TRACKTASKS_SLOW_REQUEST_QUERIES=1)
+    def test_logs_slow_requests(self):
+        with self.assertLogs('tracktasks.logger', 'WARNING') as logs:
+            self.client.get(reverse('tracktasks:index'))
+
+        self.assertIn("slow request (queries)", logs.output[0])
+        self.assertTrue(logs.records[0].request_timing['slowest'])
+
+    def test_no_header_for_other_users(self):
+        with self.assertLogs('tracktasks.logger', 'DEBUG'):
+            response = self.client.get(reverse('tracktasks:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        self.client.logout()
+        response = self.client.get(reverse('tracktasks:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(TRACKTASKS_REQUEST_TIMING=False)
+    def test_turned_off(self):
+        response = self.client.get(reverse('tracktasks:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_counts_repeated_statements(self):
+        request = RequestFactory().get('/')
+        request.render_seconds = 0
+        queries = [{'sql': 'SELECT * FROM "t" WHERE "id" = {}'.format(pk),
+                    'time': '0.001'} for pk in range(12)]
+        queries.append({'sql': "SELECT 'a''b'", 'time': '0.010'})
+
+        timing = middleware.summarize(request, HttpResponse(), 0.1, queries)
+        self.assertEqual(timing['repeated'], 12)
+        self.assertEqual(timing['repeated_sql'],
+                         'SELECT * FROM "t" WHERE "id" = ?')
+        self.assertEqual(timing['slowest'][0]['sql'], "SELECT 'a''b'")
+        self.assertEqual(timing['sql_ms'], 22.0)
+
+
+class MetricsTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for metric in metrics.REGISTRY.values():
+            metric.values = {}
+        self.user = User.objects.create(username="ben",
+                                        password="secure")
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+
+    def test_metric_types_define_merge_and_samples(self):
+        class Gauge(metrics.Metric):
+            type = 'gauge'
+
+        with self.assertRaises(TypeError):
+            Gauge('tracktasks_test_gauge', "A gauge without samples.")
+        self.assertNotIn('tracktasks_test_gauge', metrics.REGISTRY)
+
+    def test_records_requests_by_url_name(self):
+        self.client.get(reverse('tracktasks:index'))
+        self.client.get(reverse('tracktasks:index'))
+
+        value = metrics.requests.values[('tracktasks:index', 'GET', '200')]
+        self.assertEqual(sum(value[:-1]), 2)
+        # the dashboard is cached on the first request.
+        self.assertEqual(metrics.cache_lookups.values[('miss',)], 1)
+        self.assertEqual(metrics.cache_lookups.values[('hit',)], 1)
+
+    def test_records_timer_operations(self):
+        task = Task.objects.create(name="task", user=self.user,
+                                   date=datetime.date.today(),
+                                   is_timed=True,
+                                   total_time=datetime.timedelta(hours=1),
+                                   remaining_time=datetime.timedelta(hours=1))
+        task.start_timer()
+        task.stop_timer()
+        task.stop_timer()
+
+        self.assertEqual(metrics.timer_operations.values, {
+            ('start', 'started'): 1,
+            ('stop', 'stopped'): 1,
+            ('stop', 'not running'): 1,
+        })
+
+    @override_settings(TRACKTASKS_METRICS_TOKEN='scraper')
+    def test_renders_text_format(self):
+        metrics.catch_up_created.inc(3, mode='login')
+        metrics.catch_up_seconds.observe(0.7, mode='login')
+
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+
+        self.assertIn('# TYPE tracktasks_catch_up_created_total counter\n'
+                      'tracktasks_catch_up_created_total{mode="login"} 3.0\n',
+                      text)
+        self.assertIn('tracktasks_catch_up_seconds_bucket'
+                      '{mode="login",le="0.5"} 0.0\n', text)
+        self.assertIn('tracktasks_catch_up_seconds_bucket'
+                      '{mode="login",le="1.0"} 1.0\n', text)
+        self.assertIn('tracktasks_catch_up_seconds_bucket'
+                      '{mode="login",le="+Inf"} 1.0\n', text)
+        self.assertIn('tracktasks_catch_up_seconds_count{mode="login"} 1.0\n',
+                      text)
+
+    def test_requires_token(self):
+        with override_settings(TRACKTASKS_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                             404)
+
+        with override_settings(TRACKTASKS_METRICS_TOKEN='scraper'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                             401)
+            response = self.client.get(reverse('metrics'),
+                                       HTTP_AUTHORIZATION='Bearer guess')
+            self.assertEqual(response.status_code, 401)
+            self.assertNotIn('tracktasks_', response.content.decode())
+
+    def test_adds_up_processes(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(TRACKTASKS_METRICS_DIR=directory):
+            metrics.catch_up_created.inc(2, mode='login')
+            metrics.catch_up_seconds.observe(0.2, mode='login')
+
+            # another process's file.
+            other = {
+                'tracktasks_catch_up_created_total': [[['login'], 5]],
+                'tracktasks_catch_up_seconds': [
+                    [['login'], [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0.7]]],
+            }
+            path = '{}/metrics-0.json'.format(directory)
+            with open(path, 'w') as values:
+                json.dump(other, values)
+
+            collected = metrics.collect()
+
+        self.assertEqual(
+            collected['tracktasks_catch_up_created_total'][('login',)], 7)
+        seconds = collected['tracktasks_catch_up_seconds'][('login',)]
+        self.assertEqual(seconds[1:3], [1, 1])
+        self.assertAlmostEqual(seconds[-1], 0.9)
+
+
+class ProfilingTestCases(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="ben", password="secure",
+                                        is_staff=True)
+        Task.objects.create(name="task", user=self.user,
+                            date=datetime.date.today())
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_off_by_default(self):
+        response = self.client.get(reverse('tracktasks:index'),
+                                   {'profile': 'show'})
+        self.assertContains(response, 'id="daily_div"')
+
+    @override_settings(TRACKTASKS_PROFILING=True)
+    def test_shows_profile(self):
+        response = self.client.get(reverse('tracktasks:index'),
+                                   {'profile': 'show'})
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertContains(response, "cumulative")
+        self.assertNotContains(response, 'id="daily_div"')
+
+    @override_settings(TRACKTASKS_PROFILING=True)
+    def test_stores_profile(self):
+        with override_settings(TRACKTASKS_PROFILE_DIR=self.directory):
+            response = self.client.get(reverse('tracktasks:index'),
+                                       HTTP_X_PROFILE='store')
+        self.assertContains(response, 'id="daily_div"')
+
+        name = response['X-Profile']
+        self.assertIn('tracktasks', name)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         [name + '.prof', name + '.txt'])
+
+    @override_settings(TRACKTASKS_PROFILING=True)
+    def test_only_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(reverse('tracktasks:index'),
+                                   {'profile': 'show'})
+        self.assertContains(response, 'id="daily_div"')
+        self.assertFalse(response.has_header('X-Profile'))
+
+    def test_profiles_daily_updates(self):
+        with override_settings(TRACKTASKS_PROFILE_DIR=self.directory):
+            report = daily_updates_shard(self.user.pk, self.user.pk,
+                                         profile=True)
+        self.assertTrue(os.path.exists(report['profile'] + '.prof'))
+        with open(report['profile'] + '.txt') as summary:
+            self.assertIn("create_daily_recurring_tasks", summary.read())
@@ -0,0 +1,227 @@
+"""
+Exports a user's tasks as CSV or JSON Lines, and imports them back.
+
+Exports are generated a chunk of tasks at a time,
+so they can be streamed without holding every task in memory.
+Imports are validated with the rules of CreateTaskForm
+and written in batches.
+
+Recurring series are exported with their recurring id as the series.
+An import gives each series a new recurring id,
+so tasks can be imported into another account, or twice,
+without joining existing series.
+"""
+import csv
+import datetime
+import io
+import json
+import os
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.duration import duration_string
+
+from .cache import invalidate_user
+from .forms import ImportTaskForm
+from .models import Task
+
+# formats and their content types.
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+TASK_FIELDS = ['name', 'date_type', 'date', 'is_timed', 'total_time',
+               'recurring', 'is_completed', 'completed_date']
+FIELDS = TASK_FIELDS + ['series']
+
+# tasks read per query while exporting.
+EXPORT_CHUNK_SIZE = 1000
+
+# tasks written per query while importing.
+IMPORT_BATCH_SIZE = 500
+
+# an import stops after this many invalid rows.
+MAX_ERRORS = 20
+
+_NULL_RECURRING = uuid.UUID(Task.NULL_RECURRING)
+
+
+class InvalidImport(Exception):
+    """
+    Raised when an import has invalid rows.
+    errors: a list of {'line': ..., 'errors': {field: [message, ...]}}
+    """
+
+    def __init__(self, errors):
+        super().__init__("{} invalid rows.".format(len(errors)))
+        self.errors = errors
+
+
+def format_of(filename):
+    """
+    Return the format of a file, by its extension.
+    """
+    return os.path.splitext(filename)[1].lstrip('.').lower()
+
+
+def export_chunks(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generate lists of the user's tasks as dicts of FIELDS.
+    Deleted tasks are left out.
+    """
+    tasks = Task.objects.filter(user=user, is_disabled=False).order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(tasks.filter(pk__gt=last_pk).values_list(
+                            'pk', 'recurring_id', *TASK_FIELDS)[:chunk_size])
+        if not chunk:
+            return
+
+        rows = []
+        for values in chunk:
+            row = dict(zip(TASK_FIELDS, values[2:]))
+            row['series'] = '' if values[1] == _NULL_RECURRING else str(
+                                                                    values[1])
+            rows.append(row)
+        yield rows
+        last_pk = chunk[-1][0]
+
+
+def export_tasks(user, format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generate the user's tasks in format, a chunk at a time.
+    """
+    if format not in FORMATS:
+        raise ValueError("{} is not an export format.".format(format))
+
+    chunks = export_chunks(user, chunk_size)
+    if format == 'csv':
+        yield _csv_line(FIELDS)
+        for rows in chunks:
+            yield ''.join(_csv_line([_text(row[field]) for field in FIELDS])
+                          for row in rows)
+    else:
+        for rows in chunks:
+            yield ''.join(json.dumps({field: _json_value(row[field])
+                                      for field in FIELDS}) + '\n'
+                          for row in rows)
+
+
+def _csv_line(values):
+    line = io.StringIO()
+    csv.writer(line).writerow(values)
+    return line.getvalue()
+
+
+def _text(value):
+    """
+    Write a value the way the form fields read it.
+    """
+    if value is None:
+        return ''
+    return str(_json_value(value))
+
+
+def _json_value(value):
+    if isinstance(value, datetime.timedelta):
+        return duration_string(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def read_rows(stream, format):
+    """
+    Generate a (line, row) pair for each task in a text stream.
+    row is a dict, or None if the line couldn't be read.
+    Raises ValueError if a CSV file can't be read past a line.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as error:
+            raise ValueError("The file can't be read after line {}: {}."
+                             .format(reader.line_num, error))
+    elif format == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+    else:
+        raise ValueError("{} is not an import format.".format(format))
+
+
+def import_tasks(user, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create tasks for the user from (line, row) pairs, as from read_rows.
+    Return the number of tasks created.
+
+    The import is a single transaction,
+    and raises InvalidImport without creating anything
+    if any of the rows are invalid.
+    """
+    series_ids = {}
+    latest = {}
+    errors = []
+    batch = []
+    created = 0
+
+    with transaction.atomic():
+        for line, row in rows:
+            if row is None:
+                errors.append({'line': line,
+                               'errors': {'__all__': ["Not a task."]}})
+            else:
+                form = ImportTaskForm(row)
+                if not form.is_valid():
+                    errors.append({'line': line, 'errors': {
+                                    field: list(messages) for field, messages
+                                    in form.errors.items()}})
+
+            if len(errors) >= MAX_ERRORS:
+                break
+            if errors:
+                continue
+
+            task = form.save(commit=False)
+            task.user = user
+            if task.is_timed:
+                task.remaining_time = task.total_time
+
+            # recurring tasks without a series are a series of their own.
+            if task.recurring != 'N':
+                series = row.get('series') or object()
+                task.recurring_id = series_ids.setdefault(series,
+                                                          uuid.uuid4())
+                if task.date >= latest.get(task.recurring_id, task.date):
+                    latest[task.recurring_id] = task.date
+
+            batch.append(task)
+            if len(batch) >= batch_size:
+                Task.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+
+        if errors:
+            raise InvalidImport(errors)
+
+        Task.objects.bulk_create(batch)
+        created += len(batch)
+
+        # the latest task of a series is the one the daily updates repeat.
+        for recurring_id, date in latest.items():
+            Task.objects.filter(user=user, recurring_id=recurring_id,
+                                date=date).update(
+                                            is_most_recent=True,
+                                            updated_at=timezone.now())
+
+    invalidate_user(user.pk)
+    return created
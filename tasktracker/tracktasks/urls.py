@@ -5,7 +5,18 @@ urlpatterns = [
     url(r'^$', views.IndexView.as_view(), name='index'),
     url(r'^addtask/$', views.CreateTaskView.as_view(), name='create task'),
     url(r'^modifytask/(?P<pk>[0-9]+)/$', views.ModifyTaskView.as_view(), name='modify task'),
+    url(r'^modifyrule/(?P<pk>[0-9]+)/$', views.ModifyRecurrenceRuleView.as_view(), name='modify rule'),
+    url(r'^modifyoccurrence/(?P<occurrence_id>[0-9]+(?:-[0-9]{8})?)/$', views.modify_occurrence, name='modify occurrence'),
     url(r'^marktaskcomplete/$', views.mark_task_complete, name='mark complete'),
+    url(r'^analytics/$', views.AnalyticsView.as_view(), name='analytics'),
+    url(r'^scores/$', views.score_history, name='score history'),
+    url(r'^events/$', views.task_events, name='task events'),
+    url(r'^taskactions/$', views.apply_task_actions, name='task actions'),
+    url(r'^calendar/(?P<token>[\w:-]+)\.ics$', views.calendar_feed, name='calendar feed'),
+    url(r'^export/$', views.export_tasks, name='export tasks'),
+    url(r'^import/$', views.import_tasks, name='import tasks'),
+    url(r'^bulkupdate/$', views.bulk_update_tasks, name='bulk update'),
     url(r'^managetasks/$', views.ManageTasksView.as_view(), name='manage tasks'),
+    url(r'^managetasks/more/$', views.load_more_tasks, name='more tasks'),
 
 ]
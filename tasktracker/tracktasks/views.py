@@ -1,10 +1,21 @@
 import datetime
+import hashlib
+import hmac
+import io
+import json
+import queue
+import time
 import uuid
 
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
+from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse, Http404
+from django.http import StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core import signing
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views import generic
 from django.urls import reverse
 from django.core.urlresolvers import reverse_lazy
@@ -12,18 +23,76 @@ from django.conf.urls import url
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils.decorators import method_decorator
-from .forms import CreateTaskForm, ModifyTaskForm
+from django.views.decorators.http import require_POST
+from django.utils.http import http_date, quote_etag
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.middleware.csrf import get_token
+from django.conf import settings
+from .forms import CreateTaskForm, ModifyTaskForm, ModifyRecurrenceRuleForm
 
 
 from userprofiles.models import Profile
 
-from .models import Task
+from .models import Task, RecurrenceRule, TaskAction, DailyScore
+from .cache import cached_for_user, is_catching_up
+from . import analytics, events, ical, metrics, transfer
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-class IndexView(LoginRequiredMixin, generic.ListView):
+class ConditionalTasksMixin:
+    """
+    Answer conditional GETs for pages of the user's tasks
+    from TaskManager.last_change,
+    before any of the page's lists are queried or rendered.
+    """
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        response['ETag'] = quote_etag(etag)
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        # make browsers check instead of guessing from Last-Modified.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_validators(self):
+        """
+        Return the page's ETag and last modified timestamp.
+
+        Pages show today's lists, so both change with the day.
+        The ETag also covers tasks that were deleted,
+        the CSRF cookie the page's forms are tokened for
+        and whether the user's tasks are being caught up.
+        Last-Modified can't, so it's left out while catching up.
+        """
+        user = self.request.user
+        today = datetime.date.today()
+        latest, count = Task.objects.last_change(user)
+        catching_up = is_catching_up(user.pk)
+        # the cookie the response sets, if the request doesn't have one.
+        get_token(self.request)
+        csrf_cookie = self.request.META['CSRF_COOKIE']
+
+        validator = '{}:{}:{}:{}:{}:{}'.format(
+                        user.pk, today, latest and latest.timestamp(),
+                        count, catching_up, csrf_cookie)
+        etag = hashlib.md5(validator.encode('utf-8')).hexdigest()
+
+        if catching_up:
+            return etag, None
+        start_of_day = timezone.make_aware(datetime.datetime.combine(
+                                                today, datetime.time()))
+        last_modified = max(filter(None, [latest, start_of_day]))
+        return etag, int(last_modified.timestamp())
+
+class IndexView(LoginRequiredMixin, ConditionalTasksMixin, generic.ListView):
     """
     Shows all of today's tasks.
     """
@@ -33,62 +102,440 @@ class IndexView(LoginRequiredMixin, generic.ListView):
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
-        request = self.request
-        data['daily_tasks_list'] = Task.objects.scheduled_for(request.user, datetime.date.today())
-        data['still_due_tasks_list'] = Task.objects.still_due_on(request.user,
-                                                         datetime.date.today())
-        data['completed_tasks_list'] = Task.objects.completed_on(request.user,
-                                                        datetime.date.today())
-        data['overdue_tasks_list'] = Task.objects.overdue_on(request.user,
-                                                     datetime.date.today())
+        user = self.request.user
+        today = datetime.date.today()
+        dashboard = cached_for_user(
+                        'dashboard', user, today,
+                        lambda: Task.objects.dashboard(user, today))
+        data['daily_tasks_list'] = dashboard['scheduled_for']
+        data['still_due_tasks_list'] = dashboard['still_due_on']
+        data['completed_tasks_list'] = dashboard['completed_on']
+        data['overdue_tasks_list'] = dashboard['overdue_on']
+        data['catching_up'] = is_catching_up(user.pk)
+        data['event_streams'] = getattr(settings,
+                                        'TRACKTASKS_EVENT_STREAMS', False)
         return data
 
-class ManageTasksView(LoginRequiredMixin, generic.ListView):
+class ManageTasksView(LoginRequiredMixin, ConditionalTasksMixin,
+                      generic.ListView):
     """
-    Show all of a user's tasks.
+    Show all of a user's tasks, a page at a time.
+    Later pages are loaded by load_more_tasks.
     """
     template_name = 'tracktasks/managetasks.html'
     model = Task
     context_object_name = 'user_tasks'
 
     def get_queryset(self):
-        return Task.objects.active_tasks(self.request.user)
+        page, self.next_cursor = get_tasks_page(self.request.user)
+        return page
+
+    def get_context_data(self, **kwargs):
+        data = super().get_context_data(**kwargs)
+        data['next_cursor'] = self.next_cursor
+        data['calendar_url'] = self.request.build_absolute_uri(
+                    reverse('tracktasks:calendar feed',
+                            args=[ical.feed_token(self.request.user.pk)]))
+        return data
+
+# tasks shown per page of the manage tasks list.
+MANAGE_TASKS_PAGE_SIZE = 50
+
+CURSOR_SALT = 'tracktasks.managetasks'
+
+def get_tasks_page(user, cursor=None):
+    """
+    Return a page of the user's active tasks
+    starting after the provided cursor,
+    and the cursor for the next page, or None on the last page.
+    Raise signing.BadSignature for a cursor that wasn't made here.
+    """
+    today = datetime.date.today()
+    after = None
+    if cursor is not None:
+        after_date, after_id = signing.loads(cursor, salt=CURSOR_SALT)
+        after = (datetime.datetime.strptime(after_date, '%Y-%m-%d').date(),
+                 after_id)
+
+    page, last_key = cached_for_user(
+                        'active_tasks:{}'.format(cursor or ''), user, today,
+                        lambda: Task.objects.active_tasks_page(
+                                        user, today, after,
+                                        MANAGE_TASKS_PAGE_SIZE))
+
+    if last_key is None:
+        return page, None
+    last_date, last_id = last_key
+    return page, signing.dumps([last_date.isoformat(), last_id],
+                               salt=CURSOR_SALT)
+
+@login_required
+def load_more_tasks(request):
+    """
+    Respond with the rendered rows of the next page of the user's tasks,
+    and the cursor for the page after it.
+    """
+    try:
+        page, next_cursor = get_tasks_page(request.user,
+                                           request.GET['cursor'])
+    except (KeyError, ValueError, signing.BadSignature):
+        return JsonResponse({'error': "Invalid cursor."}, status=400)
+
+    return JsonResponse({
+        'html': render_to_string('tracktasks/manage_rows.html',
+                                 {'user_tasks': page}, request=request),
+        'next_cursor': next_cursor,
+    })
+
+class AnalyticsView(LoginRequiredMixin, generic.TemplateView):
+    """
+    Show completion and overdue rates and tracked time
+    by week and by recurring series.
+    Only the rollups are read, see tracktasks.analytics.
+    """
+    template_name = 'tracktasks/analytics.html'
+    weeks = 12
+
+    def get_context_data(self, **kwargs):
+        data = super().get_context_data(**kwargs)
+        data.update(analytics.weekly_report(self.request.user, self.weeks))
+        data['null_recurring'] = Task.NULL_RECURRING
+        return data
+
+# the most days score_history returns.
+MAX_SCORE_DAYS = 366
+
+@login_required
+def score_history(request):
+    """
+    Respond with the user's daily scores for the last days,
+    given as days, through today.
+    Days without a score are zero.
+    """
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return JsonResponse({'error': "Invalid number of days."}, status=400)
+    days = max(1, min(days, MAX_SCORE_DAYS))
+
+    today = datetime.date.today()
+    first = today - datetime.timedelta(days=days - 1)
+    scores = {score.date: score for score in DailyScore.objects.filter(
+                                    user=request.user,
+                                    date__range=(first, today))}
+
+    history = []
+    for offset in range(days):
+        date = first + datetime.timedelta(days=offset)
+        score = scores.get(date, DailyScore(date=date))
+        history.append({
+            'date': date,
+            'earned': score.earned,
+            'lost': score.lost,
+            'score': score.score,
+            'completed': score.completed,
+            'missed': score.missed,
+        })
+
+    return JsonResponse({'days': history})
+
+@login_required
+def task_events(request):
+    """
+    Stream changes to the user's tasks as server-sent events.
+
+    timer events carry a task's new timer state,
+    tasks events say the task lists changed and should be reloaded.
+    The stream closes after events.STREAM_LIFETIME seconds
+    and the browser reconnects.
+
+    Not found unless TRACKTASKS_EVENT_STREAMS is set.
+    """
+    if not getattr(settings, 'TRACKTASKS_EVENT_STREAMS', False):
+        raise Http404("Event streams are off.")
+
+    response = StreamingHttpResponse(stream_events(request.user.pk),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # keep proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def stream_events(user_id):
+    """
+    Generate server-sent events for a user until the stream's lifetime
+    is up, with keepalive comments while idle.
+    """
+    subscription = events.subscribe(user_id)
+    try:
+        yield 'retry: 3000\n\n'
+
+        closes = time.monotonic() + events.STREAM_LIFETIME
+        while time.monotonic() < closes:
+            try:
+                event, data = subscription.get(timeout=events.KEEPALIVE)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+
+            yield 'event: {}\ndata: {}\n\n'.format(
+                            event, json.dumps(data, cls=DjangoJSONEncoder))
+    finally:
+        subscription.close()
+
+@login_required
+@require_POST
+def modify_occurrence(request, occurrence_id):
+    """
+    Save a rule's occurrence, if it's virtual,
+    and redirect to the page to edit it on its own.
+    """
+    try:
+        task = Task.objects.get_occurrence(request.user, occurrence_id)
+    except (Task.DoesNotExist, RecurrenceRule.DoesNotExist, ValueError):
+        raise Http404("No such task.")
+    return HttpResponseRedirect(reverse('tracktasks:modify task',
+                                        kwargs={'pk': task.pk}))
 
 @login_required
 def mark_task_complete(request):
     """
     Mark a task complete, start a timer or stop a timer.
     Probably will move the latter two out later.
+
+    Responds with the task's new state,
+    the dashboard lists it now shows up in
+    and its rendered rows for those lists,
+    so the page can be patched in place.
     """
 
-    if request.is_ajax():
-        task_id = request.POST['selected_task']
-        name = request.POST['name']
-        task = Task.objects.get(pk=task_id)
+    if not request.is_ajax():
+        return HttpResponse()
 
-        if "completed" in name:
-            task.complete()
+    task_id = request.POST['selected_task']
+    name = request.POST['name']
+    try:
+        task = Task.objects.get_occurrence(request.user, task_id)
+    except (Task.DoesNotExist, RecurrenceRule.DoesNotExist, ValueError):
+        raise Http404("No such task.")
 
-        elif "start_timer" in name:
-            task.start_time = timezone.now()
+    if "completed" in name:
+        task.mark_complete()
 
-        elif "stop_timer" in name:
-            try:
-                elapsed_time = timezone.now() - task.start_time
-            except TypeError:
-                task.start_time = timezone.now()
-                elapsed_time = timezone.now() - task.start_time
-            task.remaining_time -= elapsed_time
-            task.start_time = None
+    elif "start_timer" in name:
+        task.start_timer()
 
-            # only the days attribute of a timedelta
-            # will go negative.
-            if task.remaining_time.days < 0:
-                task.complete()
+    elif "stop_timer" in name:
+        task.stop_timer()
 
-        task.save()
+    lists = task.dashboard_lists(datetime.date.today())
 
-    return HttpResponse()
+    return JsonResponse({
+        'task': task.state(),
+        'lists': lists,
+        'html': {list_name: render_task_row(request, task, list_name)
+                 for list_name in lists},
+    })
+
+# the row template and date label used by each dashboard list.
+TASK_ROWS = {
+    'scheduled_for': ('tracktasks/task_row.html', None),
+    'still_due_on': ('tracktasks/task_row.html', 'due'),
+    'overdue_on': ('tracktasks/task_row.html', 'was due'),
+    'completed_on': ('tracktasks/completed_row.html', None),
+}
+
+def render_task_row(request, task, list_name):
+    """
+    Render a task's row, the way it appears in a dashboard list.
+    """
+    template_name, date_label = TASK_ROWS[list_name]
+    return render_to_string(template_name,
+                            {'task': task, 'date_label': date_label,
+                             'mark_complete_url': reverse(
+                                            'tracktasks:mark complete')},
+                            request=request)
+
+# the furthest tasks can be rescheduled at once, in days.
+MAX_RESCHEDULE_DAYS = 3650
+
+@login_required
+@require_POST
+def bulk_update_tasks(request):
+    """
+    Complete, disable or reschedule several of the user's tasks at once.
+
+    Expects an action, one of complete, disable or reschedule,
+    task ids as task_ids,
+    recurring ids as recurring_ids, to disable whole series,
+    and a number of days, to reschedule by,
+    up to MAX_RESCHEDULE_DAYS either way.
+
+    Responds with the number of tasks affected.
+    """
+    action = request.POST.get('action')
+    try:
+        task_ids = [int(task_id)
+                    for task_id in request.POST.getlist('task_ids')]
+        recurring_ids = [uuid.UUID(recurring_id) for recurring_id
+                         in request.POST.getlist('recurring_ids')]
+
+        if action == 'complete':
+            affected = Task.objects.bulk_complete(request.user, task_ids)
+        elif action == 'disable':
+            affected = Task.objects.bulk_disable(request.user, task_ids,
+                                                 recurring_ids)
+        elif action == 'reschedule':
+            days = int(request.POST['days'])
+            if abs(days) > MAX_RESCHEDULE_DAYS:
+                raise ValueError("Tasks can be moved by up to {} days."
+                                 .format(MAX_RESCHEDULE_DAYS))
+            affected = Task.objects.bulk_reschedule(request.user, task_ids,
+                                                    days)
+        else:
+            raise ValueError("{} is not a bulk action.".format(action))
+
+    except (KeyError, ValueError) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    return JsonResponse({'action': action, 'affected': affected})
+
+def calendar_feed(request, token):
+    """
+    Respond with the iCalendar feed of the user the token was made for.
+    There's no session, calendar clients only have the url.
+
+    Feeds that haven't changed since the client's copy
+    get a 304 without being rendered or read from the cache.
+    """
+    try:
+        user_id = ical.token_user_id(token)
+    except signing.BadSignature:
+        raise Http404("No such calendar.")
+
+    etag, last_modified = ical.feed_validators(user_id)
+    last_modified = int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(ical.get_feed(user_id, etag),
+                                content_type='text/calendar; charset=utf-8')
+
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+def scrape_metrics(request):
+    """
+    Respond with the metrics of every process, for a metrics scraper
+    with TRACKTASKS_METRICS_TOKEN as its bearer token.
+    """
+    token = getattr(settings, 'TRACKTASKS_METRICS_TOKEN', None)
+    if not token:
+        raise Http404("Metrics are turned off.")
+
+    sent = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(sent.encode('utf-8'),
+                               'Bearer {}'.format(token).encode('utf-8')):
+        response = HttpResponse("Invalid metrics token.", status=401,
+                                content_type='text/plain; charset=utf-8')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@login_required
+def export_tasks(request):
+    """
+    Stream all of the user's tasks as a CSV attachment,
+    or as JSON Lines with format=jsonl.
+    """
+    format = request.GET.get('format', 'csv')
+    if format not in transfer.FORMATS:
+        return JsonResponse({'error': "Invalid format."}, status=400)
+
+    response = StreamingHttpResponse(
+                    transfer.export_tasks(request.user, format),
+                    content_type=transfer.FORMATS[format])
+    response['Content-Disposition'] = (
+                    'attachment; filename="tasks.{}"'.format(format))
+    return response
+
+@login_required
+@require_POST
+def import_tasks(request):
+    """
+    Create tasks from an uploaded export, as tasks.
+    The format is read from the file's extension,
+    unless it's provided as format.
+
+    Responds with the number of tasks created,
+    or the invalid rows if there were any, in which case none are.
+    """
+    try:
+        upload = request.FILES['tasks']
+        format = request.POST.get('format') or transfer.format_of(
+                                                                upload.name)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        created = transfer.import_tasks(request.user,
+                                        transfer.read_rows(stream, format))
+    except transfer.InvalidImport as invalid:
+        return JsonResponse({'error': str(invalid),
+                             'rows': invalid.errors}, status=400)
+    except (KeyError, ValueError) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    return JsonResponse({'created': created})
+
+@login_required
+@require_POST
+def apply_task_actions(request):
+    """
+    Apply a batch of actions queued up by the client.
+
+    Expects a JSON body like
+    {"actions": [{"task": 1, "action": "complete",
+                  "timestamp": "2017-01-16T09:00:00Z"}, ...]}
+    with actions from TaskAction.ACTIONS,
+    applied in order, as of their timestamps.
+    Tasks are identified by their occurrence ids,
+    so virtual occurrences can be acted on, and are saved first.
+
+    Responds with the state of every task in the batch,
+    the ids the virtual occurrences were saved with
+    and the number of actions applied and skipped as already applied.
+    """
+    valid_actions = dict(TaskAction.ACTIONS)
+    try:
+        actions = []
+        for entry in json.loads(request.body.decode('utf-8'))['actions']:
+            if entry['action'] not in valid_actions:
+                raise ValueError("{} is not an action.".format(
+                                                        entry['action']))
+            timestamp = parse_datetime(entry['timestamp'])
+            if timestamp is None:
+                raise ValueError("{} is not a timestamp.".format(
+                                                        entry['timestamp']))
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+            task_id = entry['task']
+            if '-' not in str(task_id):
+                task_id = int(task_id)
+            actions.append((task_id, entry['action'], timestamp))
+
+        result = Task.objects.apply_actions(request.user, actions)
+
+    except (KeyError, TypeError, ValueError) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    except (Task.DoesNotExist, RecurrenceRule.DoesNotExist):
+        raise Http404("No such task.")
+
+    return JsonResponse({
+        'tasks': [task.state() for task in result['tasks'].values()],
+        'saved_ids': result['saved_ids'],
+        'applied': result['applied'],
+        'skipped': result['skipped'],
+    })
 
 class ModifyTaskView(LoginRequiredMixin, generic.UpdateView):
     """
@@ -108,7 +555,10 @@ class ModifyTaskView(LoginRequiredMixin, generic.UpdateView):
         instance = form.instance
         instance.user = self.request.user
 
-        if (instance.is_disabled == True) and (instance.recurring != 'N'):
+        # deleting one occurrence of a rule leaves the rest of its series.
+        if (instance.is_disabled == True) and (instance.recurring != 'N') \
+                and not RecurrenceRule.objects.filter(
+                            recurring_id=instance.recurring_id).exists():
             Task.objects.disable_recurrences(instance.recurring_id)
 
         return super(ModifyTaskView, self).form_valid(form)
@@ -118,6 +568,26 @@ class ModifyTaskView(LoginRequiredMixin, generic.UpdateView):
         return initial
 
 
+class ModifyRecurrenceRuleView(LoginRequiredMixin, generic.UpdateView):
+    """
+    Update an existing recurrence rule.
+    """
+    form_class = ModifyRecurrenceRuleForm
+    template_name = 'tracktasks/modifytask.html'
+    context_object_name = 'task'
+
+    def get_queryset(self):
+        return RecurrenceRule.objects.filter(user=self.request.user)
+
+    def get_success_url(self):
+        return reverse_lazy('tracktasks:manage tasks')
+
+    def form_valid(self, form):
+        if form.instance.is_disabled:
+            Task.objects.disable_recurrences(form.instance.recurring_id)
+
+        return super(ModifyRecurrenceRuleView, self).form_valid(form)
+
 
 class CreateTaskView(LoginRequiredMixin, generic.CreateView):
     """
@@ -143,11 +613,20 @@ class CreateTaskView(LoginRequiredMixin, generic.CreateView):
         if form.instance.is_timed:
             form.instance.remaining_time = form.instance.total_time
 
+        # with virtual recurrences, recurring tasks are stored as a rule.
+        if (form.instance.recurring != 'N' and
+                getattr(settings, 'TRACKTASKS_VIRTUAL_RECURRENCES', False)):
+            RecurrenceRule.from_task(form.instance).save()
+            return HttpResponseRedirect(self.get_success_url())
+
         # add next recurrence for recurring tasks.
+        # the next recurrence is the one the daily updates repeat.
         if form.instance.recurring != 'N':
             form.instance.recurring_id = uuid.uuid4()
             first_task = form.save(commit=False)
 
+            first_task.is_most_recent = True
             Task.add_next_recurring_date(first_task)
+            first_task.is_most_recent = False
 
         return super(CreateTaskView, self).form_valid(form)